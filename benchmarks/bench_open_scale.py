@@ -0,0 +1,54 @@
+#! /usr/bin/env python3
+"""
+OpenScale.get_reading cost on the python side: trigger, line read and parse, against a board that answers
+instantly with a canned line. with the simulated rig, the line is generated by the virtual board instead
+(from the rig model), so the cost includes generating it.
+"""
+
+from typing import Dict
+
+from common import per_call, rig as _rig
+
+# reading lines for (timestamp, raw reading, local temp, remote temp) enabled, as the board prints them
+LINES = {
+    'minimal': b'12.3456 kg,\r\n',
+    'timestamp': b'123456,12.3456 kg,\r\n',
+    'all_fields': b'123456,12.3456 kg,183045,23.25,22.75,\r\n',
+}
+OPTIONS = {
+    'minimal': {'timestamp_enable': False},
+    'timestamp': {},
+    'all_fields': {'raw_reading_enable': True, 'local_temp_enable': True, 'remote_temp_enable': True},
+}
+
+
+def run(rig: str) -> Dict:
+    from libs.hal.sparkfun_openscale import OpenScale
+
+    class CannedOpenScale(OpenScale):
+        """board that answers every trigger with the same line"""
+        line = b''
+        first_read = False
+
+        def open(self):
+            self.is_open = True
+
+        def write(self, data):
+            return len(data)
+
+        def read_until(self, expected=b'\n', size=None):
+            return self.line
+
+    results = {}
+    with _rig(rig) as simulation:
+        for name, options in OPTIONS.items():
+            if simulation is None:
+                scale = CannedOpenScale(**options)
+                scale.line = LINES[name]
+            else:
+                from libs.hal.simulation import VirtualOpenScale
+                scale = VirtualOpenScale(simulation.rig, **options)
+            results[name] = per_call(scale.get_reading)
+            results[f'{name}_raw'] = per_call(lambda: scale.get_reading(to_force=False))
+    results['readings_per_s'] = 1e6 / results['timestamp']['median_us']
+    return results
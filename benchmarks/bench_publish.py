@@ -0,0 +1,45 @@
+#! /usr/bin/env python3
+"""
+cost of publishing a sample: the @publish wrapper and pubsub dispatch to 0, 1 and 4 listeners
+(the DataLogger, telemetry and live plot are one listener each), and with libs.instrumentation recording.
+"""
+
+from contextlib import ExitStack
+from typing import Dict
+
+from common import per_call, subscribed
+
+
+def run(rig: str) -> Dict:
+    from libs.data_router import publish
+    from libs.instrumentation import instruments
+    from pubsub import pub
+
+    def read() -> float:
+        return 0.5
+
+    sample = publish('strain', ('strain',))(read)
+    results = {'call': per_call(read)}
+    listeners = []
+    for count in (0, 1, 4):
+        while len(listeners) < count:
+            # pubsub keeps weak references and tells listeners apart by identity, so one function each
+            def listener(data, topic=pub.AUTO_TOPIC):
+                pass
+
+            listeners.append(listener)
+        with ExitStack() as stack:
+            for listener in listeners:
+                stack.enter_context(subscribed(listener, ('strain',)))
+            results[f'listeners_{count}'] = per_call(sample)
+            if count == 1:
+                instruments.enable()
+                try:
+                    results['listeners_1_instrumented'] = per_call(sample)
+                finally:
+                    instruments.disable()
+                    instruments.reset()
+    one = results['listeners_1']['median_us']
+    results['dispatch_per_listener_us'] = (results['listeners_4']['median_us'] - one) / 3
+    results['samples_per_s'] = 1e6 / one
+    return results
@@ -0,0 +1,52 @@
+#! /usr/bin/env python3
+"""
+query_sensors achieved poll rate and jitter, with the samples logged by a DataLogger as in a run.
+the simulated rig polls the actuator and the three thermocouples on virtual chips, in real time. the hal polls
+the devices named with --devices (eg: adc t1, on the pi), or a publisher that costs nothing to read without any.
+"""
+
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from typing import Dict, Iterable
+
+from common import CONFIG, interval_stats, rig as _rig
+
+PERIODS = (0.1, 0.01)
+DURATION = 2.0
+SIMULATED_DEVICES = ('actuator', 't1', 't2', 't3')
+
+
+def run(rig: str, devices: Iterable[str] = ()) -> Dict:
+    from libs import hal
+    from libs.data_router import PUBLISH_FUNCS, DataLogger, publish, query_sensors
+
+    results = {}
+    saved = list(PUBLISH_FUNCS)
+    with _rig(rig) as simulation:
+        try:
+            del PUBLISH_FUNCS[:]
+            for name in SIMULATED_DEVICES if simulation is not None else devices:
+                hal.get_device(name)
+            if not PUBLISH_FUNCS:
+                PUBLISH_FUNCS.append(publish('strain', ('strain',))(lambda: 0.5))
+            results['publishers'] = len(PUBLISH_FUNCS)
+            for period in PERIODS:
+                stamps = []
+                stop = Event()
+                with TemporaryDirectory() as outdir:
+                    logger = DataLogger(config={**CONFIG, 'period': period}, outdir=outdir, poll=False)
+
+                    def on_round(round_start: float):
+                        logger._end_round(round_start)
+                        stamps.append(round_start)
+
+                    poller = Thread(target=query_sensors, args=(period, on_round, stop), daemon=True)
+                    poller.start()
+                    stop.wait(DURATION)
+                    stop.set()
+                    poller.join()
+                    logger.close()
+                results[f'period_{period * 1e3:g}ms'] = {'target_hz': 1 / period, **interval_stats(stamps, period)}
+        finally:
+            PUBLISH_FUNCS[:] = saved
+    return results
@@ -0,0 +1,48 @@
+#! /usr/bin/env python3
+"""
+DataLogger.record_data throughput, called directly so dispatch is not included (see bench_publish):
+csv per topic, frame mode, binary records and blocks of strain burst samples.
+"""
+
+from tempfile import TemporaryDirectory
+from typing import Dict
+
+import numpy as np
+
+from common import CONFIG, per_call
+
+BURST = 860
+
+
+def run(rig: str) -> Dict:
+    from libs.data_router import DataLogger
+    from pubsub import pub
+
+    topics = pub.getDefaultTopicMgr()
+    position, thermocouple, burst = (topics.getOrCreateTopic(name)
+                                     for name in ('actuator.position', 'thermocouple', 'strain_burst'))
+    samples = {
+        'position': ({'pos_info': 4514}, position),
+        'thermocouple': ({'meta': 'fluid', 'temp': 21.5, 'internal_temp': 23.25, 'fault': 0, 'valid': True,
+                          'acq_ts': 1.0}, thermocouple),
+    }
+    block = {'strain': np.linspace(0.0, 1.0, BURST), 'raw': np.arange(BURST, dtype=np.int16),
+             'acq_ts': np.linspace(0.0, 1.0, BURST)}
+    results = {}
+    for mode, options in (('csv', {}), ('frame', {'frame': True}), ('records', {'records': ('actuator.position',)})):
+        with TemporaryDirectory() as outdir:
+            logger = DataLogger(config=CONFIG, outdir=outdir, poll=False, **options)
+            try:
+                for name, (data, topic) in samples.items():
+                    if mode == 'records' and name != 'position':
+                        continue
+                    timing = per_call(lambda: logger.record_data(data, topic=topic))
+                    timing['samples_per_s'] = 1e6 / timing['median_us']
+                    results[f'{mode}_{name}'] = timing
+                if mode == 'csv':
+                    timing = per_call(lambda: logger.record_data(block, topic=burst))
+                    timing['samples_per_s'] = BURST * 1e6 / timing['median_us']
+                    results[f'{mode}_strain_burst'] = timing
+            finally:
+                logger.close()
+    return results
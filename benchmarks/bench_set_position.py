@@ -0,0 +1,63 @@
+#! /usr/bin/env python3
+"""
+Actuator.set_position settle time and control loop rate, for the oscillate.yaml stroke and a long move, with
+the actuator's limit guard at the ends of the moves.
+on the simulated rig times are simulated (as long as the hardware would take) and the cpu side loop rate,
+how fast python alone could run the loop, is reported too. on the hal the actuator really moves, so it only
+runs when asked to (--move).
+"""
+
+from time import perf_counter
+from typing import Dict
+
+from common import rig as _rig
+
+# (start, target) in raw adc levels
+MOVES = {
+    'stroke_down': (4600, 4514),
+    'stroke_up': (4514, 4600),
+    'long_up': (4514, 8000),
+    'long_down': (8000, 4514),
+}
+
+
+def run(rig: str, move: bool = False) -> Dict:
+    if rig == 'hal' and not move:
+        return {'skipped': 'moves the actuator, pass --move to run it on the hal'}
+    from libs.data_router import register_listeners
+    from pubsub import pub
+    reads = []
+
+    def count(data, topic=pub.AUTO_TOPIC):
+        reads.append(data['pos_info'])
+
+    results = {}
+    with _rig(rig, virtual_time=True) as simulation:
+        from libs import hal
+        actuator = hal.actuator
+        # the moves' span as the procedure limits, as oscillate.yaml does
+        actuator.pos_limit_low = min(min(move) for move in MOVES.values())
+        actuator.pos_limit_high = max(max(move) for move in MOVES.values())
+        clock = perf_counter if simulation is None else simulation.clock.perf_counter
+        register_listeners(count, ('actuator.position',))
+        try:
+            for name, (start, target) in MOVES.items():
+                actuator.set_position(start)
+                reads.clear()
+                trips = actuator.limit_guard.trips
+                wall, began = perf_counter(), clock()
+                actuator.set_position(target)
+                settle, wall = clock() - began, perf_counter() - wall
+                results[name] = {
+                    'settle_s': settle,
+                    'reads': len(reads),
+                    'loop_rate_hz': len(reads) / settle if settle else 0.0,
+                    'error_levels': abs(sum(reads[-actuator.kernel_size:]) / actuator.kernel_size - target),
+                    'limit_trips': actuator.limit_guard.trips - trips,
+                }
+                if simulation is not None:
+                    results[name]['cpu_loop_per_s'] = len(reads) / wall
+        finally:
+            pub.unsubscribe(count, 'actuator.position')
+            actuator.set_out_speed(actuator.speed_controller.stop)
+    return results
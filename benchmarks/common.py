@@ -0,0 +1,117 @@
+#! /usr/bin/env python3
+"""
+shared helpers of the benchmark suite: timing, the rig benchmarks run against and comparing results.
+"""
+
+import os
+import sys
+import statistics
+from timeit import Timer
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+# rigs benchmarks run against:
+#   hal       -- devices as the hal builds them: the chips on the pi, the stub classes anywhere else
+#   simulated -- the virtual chips of libs.hal.simulation
+RIGS = ('hal', 'simulated')
+# procedure units, as a DataLogger needs them for its column headers
+CONFIG = {'len_units': 'raw', 'force_units': 'N', 'period': 0.1}
+
+
+def per_call(func: Callable, repeat: int = 5) -> Dict[str, float]:
+    """
+    time per call of func, from `repeat` runs of enough calls to take at least 0.2 s each.
+    :return: median and best time per call (us), and the number of calls timed
+    """
+    timer = Timer(func)
+    number, _ = timer.autorange()
+    times = sorted(total / number for total in timer.repeat(repeat, number))
+    return {'median_us': statistics.median(times) * 1e6, 'min_us': times[0] * 1e6, 'calls': number * repeat}
+
+
+def interval_stats(stamps: List[float], period: float) -> Dict[str, float]:
+    """achieved rate (Hz) and jitter (ms) of events stamped at `stamps` (s) that were due every `period` (s)"""
+    intervals = [later - earlier for earlier, later in zip(stamps, stamps[1:])]
+    if not intervals:
+        return {'rate_hz': 0.0, 'jitter_ms': 0.0, 'p99_jitter_ms': 0.0, 'max_jitter_ms': 0.0}
+    deviation = sorted(abs(interval - period) for interval in intervals)
+    return {
+        'rate_hz': len(intervals) / (stamps[-1] - stamps[0]),
+        'jitter_ms': statistics.pstdev(intervals) * 1e3,
+        'p99_jitter_ms': deviation[min(len(deviation) - 1, int(0.99 * len(deviation)))] * 1e3,
+        'max_jitter_ms': deviation[-1] * 1e3,
+    }
+
+
+@contextmanager
+def rig(kind: str, virtual_time: bool = False):
+    """
+    devices for a benchmark. the simulated rig keeps the real clock unless virtual_time, in which case
+    durations are in simulated time (as long as the hardware would take).
+    :return: the Simulation, or None for the hal's own devices
+    """
+    if kind not in RIGS:
+        raise ValueError(f'rig must be one of {RIGS}')
+    if kind == 'hal':
+        yield None
+        return
+    from libs.hal.simulation import Simulation
+    simulation = Simulation(limit=None, virtual_time=virtual_time)
+    simulation.install()
+    try:
+        yield simulation
+    finally:
+        simulation.uninstall()
+
+
+def _direction(metric: str) -> int:
+    """1 if a metric is better higher, -1 if better lower, 0 if it is not compared"""
+    if metric.endswith(('_per_s', '_hz')):
+        return 1
+    if metric.endswith(('_us', '_ms', '_s')):
+        return -1
+    return 0
+
+
+def _flatten(results: Dict, prefix: str = '') -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline: Dict, results: Dict, tolerance: float) -> List[Tuple[str, float, float]]:
+    """
+    metrics of results that are worse than in baseline by more than tolerance (a fraction).
+    :return: (metric, baseline value, value) of every regression
+    """
+    old, new = _flatten(baseline), _flatten(results)
+    regressions = []
+    for metric in sorted(old.keys() & new.keys()):
+        direction = _direction(metric)
+        if not direction or not old[metric]:
+            continue
+        if direction * (new[metric] - old[metric]) / abs(old[metric]) < -tolerance:
+            regressions.append((metric, old[metric], new[metric]))
+    return regressions
+
+
+@contextmanager
+def subscribed(callback: Callable, topics: Iterable[str]):
+    """subscribes callback to topics for the duration of the block"""
+    from libs.data_router import register_listeners
+    from pubsub import pub
+    topics = tuple(topics)
+    register_listeners(callback, topics)
+    try:
+        yield callback
+    finally:
+        for topic in topics:
+            pub.unsubscribe(callback, topic)
@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+"""
+benchmarks of the acquisition and control hot paths, results printed as json so runs can be compared across
+commits.
+
+    publish        -- @publish wrapper and pubsub dispatch cost per sample
+    record_data    -- DataLogger.record_data throughput (csv, frame, binary records, strain bursts)
+    open_scale     -- OpenScale.get_reading trigger, read and parse cost
+    set_position   -- Actuator.set_position settle time and loop rate
+    query_sensors  -- query_sensors achieved poll rate and jitter
+
+    python benchmarks/run.py [benchmark ...] [--rig hal|simulated] [--out results.json]
+    python benchmarks/run.py --compare baseline.json [--tolerance 0.2]
+
+--rig hal uses the devices as the hal builds them (the chips on the pi, stub classes anywhere else),
+--rig simulated the virtual chips of libs.hal.simulation. with --compare the exit status is 1 if any timing
+got worse than the baseline by more than the tolerance, for use as a regression check.
+"""
+
+import os
+import sys
+import json
+import platform
+import subprocess
+from datetime import datetime
+from inspect import signature
+from importlib import import_module
+from argparse import ArgumentParser
+
+from common import RIGS, compare
+
+BENCHMARKS = ('publish', 'record_data', 'open_scale', 'set_position', 'query_sensors')
+
+parser = ArgumentParser()
+parser.add_argument('benchmarks', nargs='*', choices=(*BENCHMARKS, []), metavar='benchmark',
+                    help=f'benchmarks to run, all by default: {", ".join(BENCHMARKS)}')
+parser.add_argument('--rig', choices=RIGS, default='simulated', help='devices to benchmark against')
+parser.add_argument('--move', action='store_true', help='allow set_position to move the actuator on the hal')
+parser.add_argument('--devices', nargs='*', default=(), help='hal devices query_sensors polls, eg: adc t1')
+parser.add_argument('--out', type=str, default=None, help='also write the results to this file')
+parser.add_argument('--compare', type=str, default=None, metavar='BASELINE',
+                    help='results of an earlier run to check these against')
+parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown against the baseline (fraction)')
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names, rig: str, **options) -> dict:
+    results = {}
+    for name in names:
+        bench = import_module(f'bench_{name}').run
+        accepted = signature(bench).parameters
+        results[name] = bench(rig, **{key: value for key, value in options.items() if key in accepted})
+        print(f'{name} done', file=sys.stderr)
+    return results
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    report = {
+        'commit': commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'rig': args.rig,
+        'results': run(args.benchmarks or BENCHMARKS, args.rig, move=args.move, devices=args.devices),
+    }
+    text = json.dumps(report, indent=2)
+    if args.out is not None:
+        with open(args.out, 'w') as file:
+            file.write(text + '\n')
+    print(text)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(baseline['results'], report['results'], args.tolerance)
+        for metric, old, new in regressions:
+            print(f'{metric}: {old:.4g} -> {new:.4g}', file=sys.stderr)
+        if regressions:
+            print(f'{len(regressions)} regression(s) against {args.compare} ({baseline.get("commit")})',
+                  file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+"""
+benchmark of software SPI backends for the bit-banged thermocouple (t3)
+
+runs MAX31856 burst reads against an emulated MAX31856 wired to a fake gpio chip, so the python side
+cost of each backend can be compared off the pi. the emulated device also checks every transfer is decoded.
+
+    waveform -- libs.hal.soft_spi.WaveformSPI, precomputed waveforms with bulk line updates
+    bitbang  -- Adafruit_GPIO.SPI.BitBang driven through an adapter over the same fake chip (if installed)
+
+pass --hardware to compare the backends available on the pi against the sample thermocouple instead.
+"""
+
+import os
+import sys
+from time import perf_counter
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+parser = ArgumentParser()
+parser.add_argument('-d', '--duration', type=float, default=2.0, help='seconds to run each backend for')
+parser.add_argument('--hardware', action='store_true', help='benchmark the sample thermocouple instead')
+
+PINS = {'clk': 13, 'cs': 5, 'do': 19, 'di': 26}
+
+
+class FakeChipAdapter:
+    """Adafruit_GPIO style adapter over a FakeGPIOChip, one pin per call as BitBang expects"""
+
+    def __init__(self, chip):
+        self.chip = chip
+
+    def setup(self, pin, mode, pull_up_down=None):
+        pass
+
+    def output(self, pin, value):
+        self.chip.get_line(pin).set_value(int(bool(value)))
+
+    def set_high(self, pin):
+        self.output(pin, 1)
+
+    def set_low(self, pin):
+        self.output(pin, 0)
+
+    def input(self, pin):
+        return self.chip.levels[pin]
+
+    def is_high(self, pin):
+        return self.chip.levels[pin] == 1
+
+    def is_low(self, pin):
+        return self.chip.levels[pin] == 0
+
+
+def rate(sensor, duration):
+    count = 0
+    start = perf_counter()
+    while perf_counter() - start < duration:
+        sensor.read_burst()
+        count += 1
+    return count / (perf_counter() - start)
+
+
+def emulated_backends():
+    from libs.hal.max31856 import MAX31856
+    from libs.hal.soft_spi import FakeGPIOChip, FakeSPIDevice
+    registers = bytearray(16)
+    # 25.0 C thermocouple, 25.0 C cold junction, no faults
+    registers[0x0A:0x10] = bytes((0x19, 0x00, 0x01, 0x90, 0x00, 0x00))
+
+    def chip():
+        return FakeGPIOChip(on_change=FakeSPIDevice(PINS['clk'], PINS['di'], PINS['do'], PINS['cs'],
+                                                    mode=1, registers=registers))
+
+    yield 'waveform', MAX31856(tc_type='T', avgsel=4, software_spi=dict(PINS, backend='waveform', chip=chip()))
+    try:
+        import Adafruit_GPIO.SPI
+    except ImportError:
+        print('Adafruit_GPIO not installed, skipping bitbang')
+        return
+    yield 'bitbang', MAX31856(tc_type='T', avgsel=4, software_spi=PINS, gpio=FakeChipAdapter(chip()))
+
+
+def hardware_backends():
+    from libs.hal.max31856 import MAX31856
+    for backend in ('pigpio', 'waveform', 'bitbang'):
+        try:
+            yield backend, MAX31856(tc_type='T', avgsel=4, software_spi=dict(PINS, backend=backend))
+        except (RuntimeError, ValueError) as e:
+            print('{}: unavailable ({})'.format(backend, e))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    results = []
+    for name, sensor in (hardware_backends() if args.hardware else emulated_backends()):
+        if not args.hardware:
+            assert sensor.read_burst() == (25.0, 25.0, 0), '{} decode mismatch'.format(name)
+        results.append((name, rate(sensor, args.duration)))
+    print('Backend      | Reads/s')
+    for name, reads in results:
+        print('{:<12} | {:>9.1f}'.format(name, reads))
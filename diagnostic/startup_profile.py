@@ -0,0 +1,52 @@
+#! /usr/bin/env python3
+"""
+profile of the launcher's startup: module imports, cli parsing, procedure loading and device initialization,
+reported as a tree (see libs.startup_profile).
+
+    python diagnostic/startup_profile.py [--config CONFIG/oscillate.yaml] [--devices adc dac] [--budget 2.0]
+
+with --budget the exit status is 1 if startup took longer than the budget (s), for use as a regression check.
+"""
+
+import os
+import sys
+import json
+from argparse import ArgumentParser
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from libs.startup_profile import profiler
+
+parser = ArgumentParser()
+parser.add_argument('--config', type=str, default=None, help='procedure to load, as the launcher does')
+parser.add_argument('--devices', nargs='*', default=(), help='hal devices to build, eg: adc dac t1')
+parser.add_argument('--min-ms', type=float, default=1.0, help='hide spans shorter than this')
+parser.add_argument('--json', action='store_true', help='print the tree as json')
+parser.add_argument('--budget', type=float, default=None, help='fail if startup takes longer than this (s)')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    config = None if args.config is None else os.path.abspath(args.config)
+    profiler.start()
+    with profiler.span('import launcher modules'):
+        from libs import hal
+        from orchestration import load_procedure
+        from launch import parser as launch_parser
+        from libs.telemetry import TelemetryServer
+    with profiler.span('parse args'):
+        launch_parser.parse_args([])
+    if config is not None:
+        with profiler.span('load procedure'):
+            recipe = load_procedure(config)
+            hal.configure(recipe['CONFIG'])
+    for name in args.devices:
+        hal.get_device(name)
+    profiler.stop()
+    if args.json:
+        print(json.dumps({'elapsed': profiler.elapsed, 'devices': sorted(hal.DEVICES), 'tree': profiler.to_dict()}))
+    else:
+        print(profiler.report(args.min_ms))
+    if args.budget is not None and profiler.elapsed > args.budget:
+        print(f'startup took {profiler.elapsed:.3f} s, over the {args.budget:.3f} s budget', file=sys.stderr)
+        sys.exit(1)
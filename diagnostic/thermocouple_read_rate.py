@@ -0,0 +1,96 @@
+#! /usr/bin/env python3
+"""
+benchmark of MAX31856 temperature acquisition rates
+
+compares the per-register read path (read_temp_c + read_internal_temp_c, 5 chip select cycles)
+against the single CJTH..FAULT burst read (read_burst, 1 chip select cycle).
+
+by default runs against an emulated register file so it can be ran off the pi.
+transfer costs can be modelled with --cs-us (per chip select cycle) and --bit-us (per clocked bit),
+roughly matching the pure python bit-banged bus on t3 with something like: --cs-us 150 --bit-us 30
+pass --hardware to run against the sample thermocouple (t3) instead.
+"""
+
+import os
+import sys
+from time import perf_counter
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+parser = ArgumentParser()
+parser.add_argument('-d', '--duration', type=float, default=2.0, help='seconds to run each read method for')
+parser.add_argument('--cs-us', type=float, default=0.0, help='modelled cost of a chip select cycle (us)')
+parser.add_argument('--bit-us', type=float, default=0.0, help='modelled cost of a clocked bit (us)')
+parser.add_argument('--hardware', action='store_true', help='benchmark the sample thermocouple instead')
+
+
+class RegisterFileSPI:
+    """emulates the MAX31856 register file with address auto-increment"""
+
+    def __init__(self, cs_us=0.0, bit_us=0.0):
+        self.cs_s = cs_us * 1e-6
+        self.bit_s = bit_us * 1e-6
+        # 25.0 C thermocouple, 25.0 C cold junction, no faults
+        self.registers = bytearray(16)
+        self.registers[0x0A:0x10] = bytes((0x19, 0x00, 0x01, 0x90, 0x00, 0x00))
+        self.transfers = 0
+
+    def set_clock_hz(self, hz):
+        pass
+
+    def set_mode(self, mode):
+        pass
+
+    def set_bit_order(self, order):
+        pass
+
+    def transfer(self, data):
+        self.transfers += 1
+        end = perf_counter() + self.cs_s + 8 * len(data) * self.bit_s
+        address = data[0]
+        if address & 0x80:
+            for offset, value in enumerate(data[1:]):
+                self.registers[((address & 0x7F) + offset) & 0x0F] = value
+            res = bytearray(len(data))
+        else:
+            res = bytearray([0]) + bytearray(self.registers[(address + offset) & 0x0F]
+                                             for offset in range(len(data) - 1))
+        while perf_counter() < end:
+            pass
+        return res
+
+
+def per_register(sensor):
+    return sensor.read_temp_c(), sensor.read_internal_temp_c()
+
+
+def burst(sensor):
+    return sensor.read_burst()
+
+
+def rate(func, sensor, duration):
+    count = 0
+    start = perf_counter()
+    while perf_counter() - start < duration:
+        func(sensor)
+        count += 1
+    return count / (perf_counter() - start)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    from libs.hal.max31856 import MAX31856
+    if args.hardware:
+        sensor = MAX31856(tc_type='T', avgsel=4, software_spi={'clk': 13, 'cs': 5, 'do': 19, 'di': 26})
+        spi = None
+    else:
+        spi = RegisterFileSPI(cs_us=args.cs_us, bit_us=args.bit_us)
+        sensor = MAX31856(tc_type='T', avgsel=4, hardware_spi=spi)
+        assert per_register(sensor) == burst(sensor)[:2], 'burst decode mismatch'
+    print('Read Method  | Reads/s     | Transfers/read')
+    for name, func in (('per register', per_register), ('burst', burst)):
+        before = spi.transfers if spi is not None else 0
+        reads = rate(func, sensor, args.duration)
+        per_read = (spi.transfers - before) / (reads * args.duration) if spi is not None else float('nan')
+        print('{:<12} | {:>11.1f} | {:>14.2f}'.format(name, reads, per_read))
@@ -1,13 +1,13 @@
 #! /usr/bin/env/python3.6
 
-import re
 import sys
 from time import sleep
 from serial import Serial
 
-# regex test:
-# http://www.pyregex.com/?id=eyJyZWdleCI6IlJlYWRpbmc6IFxcWyg%2FUDxtYXNzPi0%2FXFxkK1xcLlxcZCspXFxzKD9QPHVuaXRzPlxcdyspXFxdXFxzK0NhbGlicmF0aW9uIEZhY3RvcjpcXHMoP1A8ZmFjdG9yPi0%2FXFxkKykiLCJmbGFncyI6MTAsIm1hdGNoX3R5cGUiOiJmaW5kYWxsIiwidGVzdF9zdHJpbmciOiJSZWFkaW5nOiBbMS4yMzQ1IGxic10gICBDYWxpYnJhdGlvbiBGYWN0b3I6IDEyMzQ1Njc4XG5SZWFkaW5nOiBbLTIuMzQ1NSBrZ10gICBDYWxpYnJhdGlvbiBGYWN0b3I6IC0xMjM0NSJ9
-pattern = re.compile(r'Reading: \[(?P<mass>-?\d+\.\d+)\s(?P<units>\w+)\]\s+Calibration Factor:\s(?P<factor>-?\d+)')
+from libs.hal.sparkfun_openscale import CAL_PATTERN, CalibrationEngine
+
+# returns a dict in the form {'mass': '<measured_mass>', 'units': '<parsed_units>', 'factor':'<calibration_factor>'}
+pattern = CAL_PATTERN
 
 
 def calibrate_load_cell(desired_value, tolerance=0.001):
@@ -28,27 +28,11 @@ def calibrate_load_cell(desired_value, tolerance=0.001):
     #  Serial.println(F("Press x to exit"));
     for i in range(0, 7):  # toss first 7 lines
         interface.readline()
-    reading = interface.readline().decode('utf-8')
-    parsed_reading = pattern.match(
-        reading).groupdict()  # returns a dict in the form {'mass': '<measured_mass>', 'units': '<parsed_units>', 'factor':'<calibration_factor>'}
-    mass, units, factor = float(parsed_reading['mass']), parsed_reading['units'], int(parsed_reading['factor'])
-    # calculate error
-    error = desired_value - mass
-
-    if error < tolerance:  # spot on to begin with
-        return
-    else:
-        while error > tolerance:
-            if error < 0:  # too far -- should decrease cal factor
-                interface.write('-')
-            elif error > 0:  # too short -- should increase cal factor
-                interface.write('+')
-            reading = interface.readline().decode('utf-8')
-            parsed_reading = pattern.match(
-                reading).groupdict()  # returns a dict in the form {'mass': '<measured_mass>', 'units': '<parsed_units>', 'factor':'<calibration_factor>'}
-            mass, units, factor = float(parsed_reading['mass']), parsed_reading['units'], int(parsed_reading['factor'])
-            # calculate error
-            error = desired_value - mass
+    # estimate the slope, jump most of the way there and bisect the remainder
+    factor = CalibrationEngine(interface, tolerance=tolerance).run(desired_value)
+    # save and exit
+    interface.write(b'x')
+    return factor
 
 
 if __name__ == '__main__':
@@ -61,4 +45,4 @@ if __name__ == '__main__':
             tolerance = float(sys.argv[2])
         except IndexError:
             pass
-    calibrate_load_cell(desired_value, tolerance)
+    print('calibration factor: {}'.format(calibrate_load_cell(desired_value, tolerance)))
@@ -25,16 +25,30 @@ from argparse import ArgumentParser
 from orchestration.actions import action_map
 from launch.command_map import cmds
 from version import version as __version__
-from libs.hal import adc, actuator
+from libs.hal import A2D, HAL_CONFIG
+from libs.hal.constants import POS_LIMITS
 
 parser = ArgumentParser()  # 'elastocaloric testing'
 subparsers = parser.add_subparsers(help='Action to take', dest='cmd')
 parser.add_argument('-V', '--version', action='version', version='%(prog)s {}'.format(__version__))
 parser.add_argument('-t', '--timeout', type=int, default=5, help='set timeout for loop')
-parser.add_argument('-r', '--sample_rate', type=int, choices=sorted(adc.accepted_sample_rates),
-                    default=adc.sample_rate, help='Sample rate for adc (sps)')
+parser.add_argument('-r', '--sample_rate', type=int, choices=sorted(A2D.accepted_sample_rates),
+                    default=HAL_CONFIG['pos_adc_sample_rate'], help='Sample rate for adc (sps)')
 parser.add_argument('-o', '--outfile', type=str, default=None, help='optional file to save results to')
 parser.add_argument('--config', type=str, default=None, help='optional configuration file')
+parser.add_argument('--profile-startup', action='store_true',
+                    help='report import, device initialization and phase times, see libs.startup_profile')
+parser.add_argument('--telemetry', type=str, default=None, metavar='ADDRESS',
+                    help='serve live samples on a unix socket path or host:port, see libs.telemetry')
+parser.add_argument('--instrument', type=str, default=None, metavar='PATH',
+                    help='time the hot paths and dump a snapshot to PATH at the end of the run, or on SIGUSR1 '
+                         '(SIGUSR2 toggles recording), see libs.instrumentation')
+parser.add_argument('--trace', type=str, default=None, metavar='PATH',
+                    help='record the chip traffic of the run to a trace for offline replay, see libs.hal.trace')
+parser.add_argument('--simulate', action='store_true',
+                    help='dry run the procedure on a simulated rig, faster than real time, see libs.hal.simulation')
+parser.add_argument('--simulate-limit', type=float, default=4 * 3600, metavar='SECONDS',
+                    help='simulated time after which a dry run is stopped')
 parser.add_argument('-u', '--unit', type=str, default='raw', choices={'raw', 'in', 'mm'},
                     help='unit to have final results in.')
 # parser.add_argument('-g', '--gain', type=float, choices={2/3, 1, 2, 3, 8, 16}, default=1,
@@ -50,10 +64,10 @@ test_dac_parser = subparsers.add_parser(cmds['TEST_DAC'], help='test dac functio
 test_cal_parser = subparsers.add_parser(cmds['TEST_CAL'], help='test calibration routines')
 
 test_positioning_parser = subparsers.add_parser(cmds['TEST_POS'], add_help=False, help='test controllable positing')
-test_positioning_parser.add_argument('-L', '--low_min', type=int, default=actuator.pos_limit_low)
-test_positioning_parser.add_argument('-l', '--low_threshold', type=int, default=actuator.pos_limit_low)
-test_positioning_parser.add_argument('-h', '--high_threshold', type=int, default=actuator.pos_limit_high)
-test_positioning_parser.add_argument('-H', '--high_max', type=int, default=actuator.pos_limit_high)
+test_positioning_parser.add_argument('-L', '--low_min', type=int, default=POS_LIMITS['low'])
+test_positioning_parser.add_argument('-l', '--low_threshold', type=int, default=POS_LIMITS['low'])
+test_positioning_parser.add_argument('-h', '--high_threshold', type=int, default=POS_LIMITS['high'])
+test_positioning_parser.add_argument('-H', '--high_max', type=int, default=POS_LIMITS['high'])
 test_positioning_parser.add_argument('--help', action='help', help='print help')
 
 pos_subparsers = test_positioning_parser.add_subparsers(help='specific position action to take', dest='action')
@@ -61,14 +75,14 @@ pos_subparsers.add_parser(action_map['RESET_MIN'], help='reset to minimum extens
 pos_subparsers.add_parser(action_map['RESET_MAX'], help='reset to max extension')
 
 goto_parser = pos_subparsers.add_parser('goto_pos', help='go to desired position')
-goto_parser.add_argument('position', type=int, default=adc.levels >> 1,
-                         help='position value between 0 and {}'.format(adc.max_level))
+goto_parser.add_argument('position', type=int, default=A2D.levels >> 1,
+                         help='position value between 0 and {}'.format(A2D.max_level))
 
 monitor_parser = subparsers.add_parser(cmds['RUN_ACQ'], add_help=False, help='run acquisition')
-monitor_parser.add_argument('-L', '--low_min', type=int, default=actuator.pos_limit_low)
-monitor_parser.add_argument('-l', '--low_threshold', type=int, default=actuator.pos_limit_low)
-monitor_parser.add_argument('-h', '--high_threshold', type=int, default=actuator.pos_limit_high)
-monitor_parser.add_argument('-H', '--high_max', type=int, default=actuator.pos_limit_high)
+monitor_parser.add_argument('-L', '--low_min', type=int, default=POS_LIMITS['low'])
+monitor_parser.add_argument('-l', '--low_threshold', type=int, default=POS_LIMITS['low'])
+monitor_parser.add_argument('-h', '--high_threshold', type=int, default=POS_LIMITS['high'])
+monitor_parser.add_argument('-H', '--high_max', type=int, default=POS_LIMITS['high'])
 monitor_parser.add_argument('--help', action='help', help='print help')
 
 
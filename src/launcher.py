@@ -11,18 +11,69 @@ License: N/A
 Description: main launcher file for the stack.
 """
 
-from libs.hal import hal_cleanup, actuator
+import sys
+import signal
+from libs.startup_profile import profiler
+# started before anything else is imported, so every import is timed
+if '--profile-startup' in sys.argv:
+    profiler.start()
+
+from libs.hal import hal_cleanup
 from orchestration import ProcedureExecutor, load_procedure
 from launch import parser
+from libs.telemetry import TelemetryServer, parse_address
+from libs.instrumentation import instruments
 
 if __name__ == '__main__':
     args = parser.parse_args()
-    recipe = load_procedure(args.config)
-    actuator.pos_limit_low = recipe['CONFIG']['lower_limit']
-    actuator.pos_limit_high = recipe['CONFIG']['upper_limit']
-    executor = ProcedureExecutor(cfg=recipe['CONFIG'], routines=recipe['ROUTINES'])
+    if args.trace is not None and args.simulate:
+        parser.error('--trace records the rig, it can not be used with --simulate')
+    with profiler.span('load procedure'):
+        recipe = load_procedure(args.config)
+    simulation = None
+    if args.simulate:
+        from libs.hal.simulation import Simulation
+        # devices are built on a simulated rig, on a simulated clock
+        simulation = Simulation(limit=args.simulate_limit)
+        simulation.install()
+    capture = None
+    if args.trace is not None:
+        from libs.hal.trace import TraceCapture
+        # devices are built on chips recording their traffic
+        capture = TraceCapture(args.trace)
+        capture.install()
+    # configures the hal, devices are built as the procedure first uses them
+    with profiler.span('create executor'):
+        executor = ProcedureExecutor(cfg=recipe['CONFIG'], routines=recipe['ROUTINES'], poll=simulation is None,
+                                     outdir=None if simulation is None else simulation.outdir)
+    if simulation is not None:
+        simulation.attach(executor.logger)
+    telemetry = None if args.telemetry is None else TelemetryServer(parse_address(args.telemetry))
+    if args.instrument is not None:
+        instruments.enable()
+        if hasattr(signal, 'SIGUSR1'):
+            # kill -USR1 <pid> dumps a snapshot without stopping the run, -USR2 pauses or resumes recording
+            signal.signal(signal.SIGUSR1, lambda signum, frame: instruments.dump(args.instrument))
+            signal.signal(signal.SIGUSR2, lambda signum, frame: instruments.toggle())
     try:
-        executor.run()
+        with profiler.span('run'):
+            executor.run()
     except KeyboardInterrupt:
-       hal_cleanup()
-
+        hal_cleanup()
+    finally:
+        # flushes and closes the logs, also done by hal_cleanup
+        executor.logger.close()
+        if telemetry is not None:
+            telemetry.close()
+        if capture is not None:
+            capture.uninstall()
+            print(f'{capture.writer.calls} chip calls traced to {args.trace}')
+        if simulation is not None:
+            print(simulation.report())
+            simulation.uninstall()
+        if args.instrument is not None:
+            instruments.dump(args.instrument)
+            print(instruments.report())
+        if profiler.enabled:
+            profiler.stop()
+            print(profiler.report())
@@ -22,6 +22,8 @@ from time import perf_counter
 from abc import ABC, abstractmethod
 from typing import Callable, Iterable, Union
 
+from libs.instrumentation import timed
+
 
 class ControllerBase(ABC):
     coefficients = ''
@@ -48,6 +50,7 @@ class ControllerBase(ABC):
     def calc_correction(self, time_val):
         return 0.0
 
+    @timed('controller.process')
     def process(self):
         self.input = self.get_input()
         self.err = self.ref - self.input
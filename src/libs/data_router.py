@@ -13,19 +13,25 @@ Description: constructs for forwarding and logging various data values
 
 import os
 # import os.path as osp
-from threading import Thread, Timer
-from libs.hal.constants import LOCK
+from threading import Event, Lock, Thread, Timer, current_thread
+from weakref import WeakSet
+from libs.hal.constants import acquire, release
 # noinspection PyUnresolvedReferences
 # from multiprocess import Process, Lock  # , Queue
 # from multiprocessing import Lock, Queue, Process
 from datetime import datetime
-from time import perf_counter, sleep, time
+from time import perf_counter, perf_counter_ns, sleep, time
 from functools import wraps as _wraps
 from inspect import signature as _signature
 from typing import Dict, TextIO, Callable, FrozenSet, Iterable, Tuple  # , Union
 
 from pubsub import pub
 
+from libs.log_rotation import RotatingLog
+from libs.log_durability import DurableLog
+from libs.log_mmap import RecordLog
+from libs.instrumentation import instruments, timed
+
 from version import version, prog_name
 
 # pub.subscribe(callback, topic)
@@ -38,6 +44,11 @@ TOPICS: FrozenSet = frozenset({
     'actuator.force',
     'thermocouple',
     'strain',
+    'strain_burst',
+})
+# asynchronous notifications, not polled and not logged as data
+EVENTS: FrozenSet = frozenset({
+    'fault',
 })
 
 THERMOCOUPLE_NAMES: Tuple[str, ...] = ('sample', 'ambient', 'fluid')
@@ -45,8 +56,30 @@ COLUMNS: Dict[str, str] = {
     'actuator.position': 'time (s), position ({len_units})\n',
     'actuator.speed': 'time (s), speed (raw)\n',
     'actuator.force': 'time (s), force ({force_units}), local_temp (C), timestamp (ms since loadcell powerup)\n',
-    'thermocouple': 'time (s), temperature (C), internal temperature (C)\n',
+    'thermocouple': 'time (s), temperature (C), internal temperature (C), fault, valid\n',
     'strain': 'time (s), strain (%)\n',
+    'strain_burst': 'time (s), strain (%), raw\n',
+}
+# per sample fields of each topic, in log column order (after the time column)
+FIELDS: Dict[str, Tuple[str, ...]] = {
+    'actuator.position': ('pos_info',),
+    'actuator.speed': ('speed',),
+    'actuator.force': ('force', 'local_temp', 'timestamp'),
+    'thermocouple': ('temp', 'internal_temp', 'fault', 'valid'),
+    'strain': ('strain',),
+    'strain_burst': ('strain', 'raw'),
+}
+# topics whose messages carry blocks of samples, always logged to their own file
+BLOCK_TOPICS: FrozenSet = frozenset({
+    'strain_burst',
+})
+
+# fixed width record layout of the fixed schema topics, for binary record logs (see libs.log_mmap)
+RECORD_DTYPES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    'actuator.position': (('ts', '<f8'), ('pos_info', '<f8')),
+    'actuator.speed': (('ts', '<f8'), ('speed', '<f8')),
+    'strain': (('ts', '<f8'), ('strain', '<f8')),
+    'strain_burst': (('ts', '<f8'), ('strain', '<f8'), ('raw', '<i2')),
 }
 
 # def publish(topic):
@@ -70,6 +103,17 @@ def add_to_poll(method):
     PUBLISH_FUNCS.append(method)
 
 
+def _publish_timed(func, topic: str, keys: Tuple[str, ...], names: Tuple[str, str], args, kwargs):
+    """@publish wrapper while instrumentation is enabled, the read and the dispatch to listeners are timed apart"""
+    start = perf_counter_ns()
+    datum = func(*args, **kwargs)
+    read = perf_counter_ns()
+    pub.sendMessage(topic, data={keys[0]: datum} if len(keys) == 1 else {k: v for k, v in zip(keys, datum)})
+    instruments.record(names[0], read - start)
+    instruments.record(names[1], perf_counter_ns() - read)
+    return datum
+
+
 def publish(topic: str, keys: Tuple[str, ...]):
     if topic not in TOPICS:
         raise ValueError(f'Unrecognized topic {topic}.\n'
@@ -77,15 +121,20 @@ def publish(topic: str, keys: Tuple[str, ...]):
 
     def real_decorator(func):
         fun_ret = _signature(func).return_annotation
+        names = (f'publish.{topic}.read', f'publish.{topic}.dispatch')
         if len(keys) == 1:
             @_wraps(func)
             def wrapper(*args, **kwargs):
+                if instruments.enabled:
+                    return _publish_timed(func, topic, keys, names, args, kwargs)
                 datum = func(*args, **kwargs)
                 pub.sendMessage(topic, data={keys[0]: datum})
                 return datum
         elif len(str(fun_ret)[12:].split(',')) == len(keys):
             @_wraps(func)
             def wrapper(*args, **kwargs):
+                if instruments.enabled:
+                    return _publish_timed(func, topic, keys, names, args, kwargs)
                 datum = func(*args, **kwargs)
                 pub.sendMessage(topic, data={k: v for k, v in zip(keys, datum)})
                 return datum
@@ -96,9 +145,21 @@ def publish(topic: str, keys: Tuple[str, ...]):
     return real_decorator
 
 
+def publish_event(topic: str, **data):
+    """
+    sends an event to any registered listeners.
+    :param topic: one of EVENTS
+    :param data: event contents, delivered as the listener's `data` dict
+    """
+    if topic not in EVENTS:
+        raise ValueError(f'Unrecognized event {topic}.\n'
+                         f'If trying to use a new event, add it inside the DataRouter.py file')
+    pub.sendMessage(topic, data=data)
+
+
 def register_listeners(call_back, topics: Iterable):
-    if any(topic not in TOPICS for topic in topics):
-        bad_topics: Tuple[str] = tuple(topic for topic in topics if topic not in TOPICS)
+    if any(topic not in TOPICS | EVENTS for topic in topics):
+        bad_topics: Tuple[str] = tuple(topic for topic in topics if topic not in TOPICS | EVENTS)
         raise ValueError(f'Unrecognized topic(s) {bad_topics}.\n')
     for topic in topics:
         pub.subscribe(call_back, topic)
@@ -130,23 +191,42 @@ def register_listeners(call_back, topics: Iterable):
 #
 
 
-def query_sensors(period):
+def query_sensors(period, on_round: Callable = None, stop: Event = None):
     """
     force trigger publisher functions periodically to get data.
+    :param period: time to sleep between poll rounds
+    :param on_round: optional callback, called with the round's start time (perf_counter) after each poll round
+    :param stop: optional event that ends polling once set
     :return:
     """
     time = perf_counter()
-    while True:
-        LOCK.acquire()
+    while stop is None or not stop.is_set():
+        acquire()
         # print('\nGETTING FUNCTIONS\n')
         # print(perf_counter() - time)
         # time = perf_counter()
         # print(PUBLISH_FUNCS)
+        round_start = perf_counter()
+        timing = instruments.enabled
+        if timing:
+            round_ns = perf_counter_ns()
         for func in PUBLISH_FUNCS:
             # print(func)
             func()
-        LOCK.release()
-        sleep(period)
+        if on_round is not None:
+            on_round(round_start)
+        release()
+        if timing:
+            round_ns = perf_counter_ns() - round_ns
+            instruments.record('poll.round', round_ns)
+            instruments.count('poll.rounds')
+            if round_ns > period * 1e9:
+                # the round alone took longer than the poll period
+                instruments.count('poll.overruns')
+        if stop is None:
+            sleep(period)
+        else:
+            stop.wait(period)
 
 
 class RepeatedTimer(object):
@@ -177,6 +257,16 @@ class RepeatedTimer(object):
         self.is_running = False
 
 
+# open loggers, closed by close_loggers (called from hal_cleanup)
+LOGGERS: WeakSet = WeakSet()
+
+
+def close_loggers():
+    """closes every open DataLogger, flushing their logs to disk"""
+    for logger in list(LOGGERS):
+        logger.close()
+
+
 class DataLogger:
     log_header: str = f'# {prog_name},v{version}\n' \
                       '# log for:, {topic}\n' \
@@ -187,67 +277,193 @@ class DataLogger:
         'actuator.position': '{0[ts]},{0[pos_info]}\n'.format,
         'actuator.speed': '{0[ts]},{0[speed]}\n'.format,
         'actuator.force': '{0[ts]},{0[force]},{0[local_temp]},{0[timestamp]}\n'.format,
-        'thermocouple': '{0[ts]},{0[temp]},{0[internal_temp]}\n'.format,
+        'thermocouple': '{0[ts]},{0[temp]},{0[internal_temp]},{0[fault]},{0[valid]:d}\n'.format,
         'strain': '{0[ts]},{0[strain]}\n'.format,
+        # blocks of samples, one row per sample
+        'strain_burst': lambda data: ''.join(map('{},{},{}\n'.format, data['ts'].tolist(),
+                                                                   data['strain'].tolist(), data['raw'].tolist())),
     }
 
-    def __init__(self, config: Dict, outdir: str = None):
+    def __init__(self, config: Dict, outdir: str = None, frame: bool = False, poll: bool = True,
+                 max_bytes: int = None, max_seconds: float = None, compression: str = 'gzip',
+                 flush_every: int = None, flush_interval: float = 1.0, fsync: bool = True,
+                 records: Iterable[str] = (), sensors: Iterable[str] = ()):
+        """
+        :param config: run configuration, used for the period and column units
+        :param outdir: directory to write logs to, defaults to a timestamped directory under DEFAULT_DATA_LOC
+        :param frame: log every poll round as one wide record in a single frame file instead of one file per topic.
+            each channel keeps its own acquisition time column, channels not sampled during a round are left empty.
+        :param poll: start the thread polling the sensors, otherwise publishers have to be triggered externally
+        :param max_bytes: rotate logs into a new segment once they reach this size, see libs.log_rotation
+        :param max_seconds: rotate logs into a new segment once they are this old
+        :param compression: compression for closed segments ('gzip', 'lzma' or None), only used when rotating
+        :param flush_every: flush each log after this many records, see libs.log_durability
+        :param flush_interval: flush each log once its oldest unflushed record is this old (s)
+        :param fsync: fsync logs on every flush
+        :param records: topics (of RECORD_DTYPES) to log as binary record files instead of csv.
+            open them with libs.log_mmap.open_record_log, also while still logging. not part of frames.
+        :param sensors: polled hal devices (of hal.POLLED) to build before polling starts. devices only publish
+            once built, so the ones no routine accesses are not logged otherwise
+        """
+        bad_topics = set(records) - set(RECORD_DTYPES)
+        if bad_topics:
+            raise ValueError(f'No fixed width record layout for topic(s) {tuple(bad_topics)}')
         self.start = perf_counter()
         self.topic_map: Dict[str, str] = {}
         self.logs: Dict[str, TextIO] = {}
+        self.records: Dict[str, RecordLog] = {}
         self.period = getattr(config, 'period', 0.1)
+        self.frame = frame
+        self.closed = False
+        self.durability: Dict = {'flush_every': flush_every, 'flush_interval': flush_interval, 'fsync': fsync}
+        self.rotation: Dict = None
+        if max_bytes is not None or max_seconds is not None:
+            self.rotation = {'max_bytes': max_bytes, 'max_seconds': max_seconds, 'compression': compression}
         if outdir is None:
             outdir = f'{DEFAULT_DATA_LOC}/{prog_name}_{datetime.now().strftime("%Y_%m_%d_%H_%M_%S")}'
             os.makedirs(outdir, exist_ok=True)
-        for topic in TOPICS:
-            if 'thermocouple' in topic:
-                for meta in THERMOCOUPLE_NAMES:
-                    topic_meta = '.'.join(filter(None, (topic, meta)))
-                    ts = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-                    topic_file = f'{outdir}/{topic_meta}_{ts}.csv'
-                    self.topic_map[topic_meta] = topic_file
-                    self.logs[topic_meta] = open(topic_file, 'w')
-                    # data_queue.put((topic_meta,
-                    #                 self.log_header.format(topic=topic, ts=ts, meta=meta) + COLUMNS[topic].format(
-                    #                     **config)))
-                    self.logs[topic_meta].write(
-                        self.log_header.format(topic=topic, ts=ts, meta=meta) + COLUMNS[topic].format(**config))
-
-            else:
-                ts = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-                topic_file = f'{outdir}/{topic}_{ts}.csv'
-                self.topic_map[topic] = topic_file
-                self.logs[topic] = open(topic_file, 'w')
-                # data_que/ue.put(
-                #     (topic, self.log_header.format(topic=topic, ts=ts, meta='') + COLUMNS[topic].format(**config))
-                # )
-                self.logs[topic].write(
-                    self.log_header.format(topic=topic, ts=ts, meta='') + COLUMNS[topic].format(**config))
+        self.outdir = outdir
+        # (topic, meta) of every per sample channel
+        self.channels: Tuple[Tuple[str, str], ...] = tuple(
+            (topic, meta) for topic in sorted(TOPICS - BLOCK_TOPICS)
+            for meta in (THERMOCOUPLE_NAMES if 'thermocouple' in topic else ('',)))
+        for topic in records:
+            self._open_records(topic)
+        for topic, meta in self.channels:
+            if not frame and topic not in self.records:
+                self._open_log(topic, meta, COLUMNS[topic].format(**config))
+        for topic in BLOCK_TOPICS - set(self.records):
+            self._open_log(topic, '', COLUMNS[topic].format(**config))
+        if frame:
+            # latest formatted record per channel for the current round. any publishing thread (eg: an action's
+            # control loop) adds to it while the polling thread swaps it out, so both hold _frame_lock
+            self._frame: Dict[str, str] = {}
+            self._frame_lock = Lock()
+            self._empty: Dict[str, str] = {}
+            columns = ['round time (s)']
+            for topic, meta in self.channels:
+                if topic in self.records:
+                    continue
+                topic_meta = '.'.join(filter(None, (topic, meta)))
+                columns.extend(f'{topic_meta} {field}' for field in ('time (s)',) + FIELDS[topic])
+                self._empty[topic_meta] = ',' * len(FIELDS[topic])
+            self._open_log('frame', '', ', '.join(columns) + '\n')
         # record_keeper.outfiles = self.logs
+        self._open_log('events', '', 'time (s), event, source, detail\n')
         register_listeners(self.record_data, TOPICS)
+        register_listeners(self.record_event, EVENTS)
+        if sensors:
+            # the hal imports data_router, so it can not be imported at the top
+            from libs import hal
+            hal.build(sensors)
         # self.timerThread = Process(target=query_sensors, args=(self.period,))
-        self.timerThread = Thread(target=query_sensors, args=(self.period,))
+        self._stop = Event()
+        self.timerThread = Thread(target=query_sensors, args=(self.period, self._end_round, self._stop))
         # self.timerThread = RepeatedTimer(interval=self.period, target=query_sensors)
         self.timerThread.daemon = True
-        self.timerThread.start()
+        if poll:
+            self.timerThread.start()
+        LOGGERS.add(self)
         self.start = perf_counter()
 
-    def __del__(self):
-        # self.timerThread.join()
-        # while True:
-        #     if data_queue.empty():
-        #         break
-        # self.timerThread.stop()
+    def _open_log(self, topic: str, meta: str, columns: str):
+        """opens the log for a topic (and meta) and writes its header"""
+        topic_meta = '.'.join(filter(None, (topic, meta)))
+        ts = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        topic_file = f'{self.outdir}/{topic_meta}_{ts}.csv'
+        header = self.log_header.format(topic=topic, ts=ts, meta=meta) + columns
+        self.topic_map[topic_meta] = topic_file
+        if self.rotation is not None:
+            # segments are read back as one log with libs.log_rotation.iter_log(topic_file)
+            file = RotatingLog(topic_file, header, **self.rotation)
+        else:
+            file = open(topic_file, 'w')
+            file.write(header)
+        self.logs[topic_meta] = DurableLog(file, **self.durability)
+
+    def _open_records(self, topic: str):
+        """opens the binary record log of a fixed schema topic"""
+        ts = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        topic_file = f'{self.outdir}/{topic}_{ts}.rec'
+        self.topic_map[topic] = topic_file
+        self.records[topic] = RecordLog(topic_file, list(RECORD_DTYPES[topic]))
+
+    def close(self):
+        """stops polling, stops listening and flushes and closes all logs. safe to call more than once."""
+        if self.closed:
+            return
+        self.closed = True
+        self._stop.set()
+        if self.timerThread.is_alive() and self.timerThread is not current_thread():
+            self.timerThread.join(timeout=max(1.0, 5 * self.period))
+        for topic in TOPICS:
+            pub.unsubscribe(self.record_data, topic)
+        for topic in EVENTS:
+            pub.unsubscribe(self.record_event, topic)
+        if self.frame:
+            self.record_frame(perf_counter())
         for file in self.logs.values():
-            file.write('\n')
             file.close()
+        for file in self.records.values():
+            file.close()
+        LOGGERS.discard(self)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        # only if construction got far enough to have something to close
+        if hasattr(self, '_stop'):
+            self.close()
+
+    def _end_round(self, round_start: float):
+        """called by the polling thread after every poll round"""
+        if self.frame:
+            self.record_frame(round_start)
+        # time based flushes still happen when a log has not been written to since
+        for file in self.logs.values():
+            file.poll()
+
+    @timed('logger.record_data')
     def record_data(self, data, topic=pub.AUTO_TOPIC):
         # def record_data(self, data: Dict[str, Any], topic: str = pub.AUTO_TOPIC):
         topic = topic.getName()
-        data['ts'] = perf_counter() - self.start  # datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        # publishers that know when their sample was taken provide it as 'acq_ts' (perf_counter seconds)
+        acq_ts = data.get('acq_ts')
         # print(topic, data)
-        topic_meta = '.'.join(filter(None, (topic, data.pop('meta', ''))))
+        topic_meta = '.'.join(filter(None, (topic, data.get('meta', ''))))
+        # the message is shared with other listeners, so it is not modified
+        data = {**data, 'ts': (perf_counter() if acq_ts is None else acq_ts) - self.start}
         # print('TOPIC META @@@@@@@@@@@@@@@@@@@@@@@@@@\n', topic_meta)
         # data_queue.put((topic_meta, self.unpack_map[topic](data)))
-        self.logs[topic_meta].write(self.unpack_map[topic](data))
+        if topic in self.records:
+            if topic in BLOCK_TOPICS:
+                self.records[topic].extend(data)
+            else:
+                self.records[topic].append(data)
+        elif self.frame and topic not in BLOCK_TOPICS:
+            # held until the end of the poll round, the newest sample of a round wins
+            record = self.unpack_map[topic](data)[:-1]
+            with self._frame_lock:
+                self._frame[topic_meta] = record
+        else:
+            self.logs[topic_meta].write(self.unpack_map[topic](data))
+
+    @timed('logger.record_frame')
+    def record_frame(self, round_start: float):
+        """writes the samples published during a poll round as a single record"""
+        with self._frame_lock:
+            frame, self._frame = self._frame, {}
+        if not frame:
+            return
+        self.logs['frame'].write(','.join([str(round_start - self.start)] + [
+            frame.get(topic_meta, self._empty[topic_meta]) for topic_meta in self._empty]) + '\n')
+
+    def record_event(self, data, topic=pub.AUTO_TOPIC):
+        topic = topic.getName()
+        acq_ts = data.get('acq_ts')
+        ts = (perf_counter() if acq_ts is None else acq_ts) - self.start
+        self.logs['events'].write(f"{ts},{topic},{data.get('meta', '')},{'|'.join(data.get('flags', ()))}\n")
@@ -5,22 +5,214 @@ Author: Danyal Ahsanullah
 Date: 7/25/2018
 Copyright (c):  2018 Danyal Ahsanullah
 License: N/A
-Description: 
+Description: hardware abstraction layer.
+             devices are built on first access (libs.hal.<name> or get_device(name)),
+             with the settings from configure(). polled devices (POLLED) only publish once built,
+             a DataLogger builds the ones it logs when it starts.
 """
 
+import sys
+from types import ModuleType
+from threading import RLock, get_ident
+from importlib import import_module as _import_module
+from typing import Callable, Dict, FrozenSet, Iterable, Tuple
+
 from libs.utils import GPIO, SPI
-from libs.hal.constants import PINS
-from libs.hal.actuator import Actuator
-from libs.hal.strain_gauge import StrainGauge
-from libs.hal.thermocouple import Thermocouple
-# noinspection PyPep8Naming
-from libs.hal.adc import ADS1115Interface as A2D
-# noinspection PyPep8Naming
-from libs.hal.dac import MCP4725Interface as D2A
-from libs.hal.sparkfun_openscale import OpenScale as LoadCell
+from libs.hal.constants import PINS, POS_LIMITS
+from libs.startup_profile import profiler
 
 LOAD_CELL_PORT='/dev/ttyUSB0'
 
+# classes are imported on first use, so importing the hal (eg: for cli parsing) does not pull in every driver
+_CLASSES: Dict[str, tuple] = {
+    'Actuator': ('libs.hal.actuator', 'Actuator'),
+    'StrainGauge': ('libs.hal.strain_gauge', 'StrainGauge'),
+    'Thermocouple': ('libs.hal.thermocouple', 'Thermocouple'),
+    'A2D': ('libs.hal.adc', 'ADS1115Interface'),
+    'D2A': ('libs.hal.dac', 'MCP4725Interface'),
+    'LoadCell': ('libs.hal.sparkfun_openscale', 'OpenScale'),
+}
+
+# settings the devices are built with, see configure()
+HAL_CONFIG: Dict = {
+    'pos_adc_channel': 1,
+    'pos_adc_sample_rate': 128,
+    'pos_adc_gain': 1,
+    'strain_adc_channel': 3,
+    'strain_adc_sample_rate': 860,
+    'strain_adc_gain': 4,
+    'load_cell_port': LOAD_CELL_PORT,
+    # actuator position limits (raw adc levels), enforced by its limit guard
+    'lower_limit': POS_LIMITS['low'],
+    'upper_limit': POS_LIMITS['high'],
+}
+
+
+def _cls(name: str):
+    module, attr = _CLASSES[name]
+    return getattr(_import_module(module), attr)
+
+
+# constructor settings of the devices built directly on a chip, less the chip's bus. the factories below,
+# the simulated rig and trace capture/replay build their devices with these, see settings()
+# conversion_sync reads each continuous mode conversion once, pass drdy_pin=<pin> if DRDY is wired up
+_SETTINGS: Dict[str, Callable[[], Dict]] = {
+    'adc': lambda: {'sample_rate': HAL_CONFIG['pos_adc_sample_rate'], 'gain': HAL_CONFIG['pos_adc_gain'],
+                    'default_channel': HAL_CONFIG['pos_adc_channel']},
+    'dac': lambda: {},
+    't1': lambda: {'name': 'ambient', 'tc_type': 'T', 'num_avgs': 4, 'conversion_sync': True},
+    't2': lambda: {'name': 'fluid', 'tc_type': 'T', 'num_avgs': 4, 'conversion_sync': True},
+    't3': lambda: {'name': 'sample', 'tc_type': 'T', 'num_avgs': 4, 'conversion_sync': True},
+    'load_cell': lambda: {'port': HAL_CONFIG['load_cell_port']},
+}
+# todo: fix the soft/hard spi, configure naming ability.
+# spi bus of each thermocouple, as Thermocouple arguments
+SPI_BUSES: Dict[str, Callable[[], Dict]] = {
+    't1': lambda: {'hardware_spi': SPI.SpiDev(0, 0)},  # SPI0, PORT0
+    't2': lambda: {'hardware_spi': SPI.SpiDev(0, 1)},  # SPI0, PORT1
+    't3': lambda: {'software_spi': {'clk': 13, 'cs': 5, 'do': 19, 'di': 26}},
+}
+
+
+def settings(name: str) -> Dict:
+    """constructor settings of a device built directly on a chip, with the current HAL_CONFIG"""
+    return _SETTINGS[name]()
+
+
+_FACTORIES: Dict[str, Callable] = {
+    'adc': lambda: _cls('A2D')(**settings('adc')),
+    'dac': lambda: _cls('D2A')(**settings('dac')),
+    't1': lambda: _cls('Thermocouple')(**settings('t1'), **SPI_BUSES['t1']()),
+    't2': lambda: _cls('Thermocouple')(**settings('t2'), **SPI_BUSES['t2']()),
+    't3': lambda: _cls('Thermocouple')(**settings('t3'), **SPI_BUSES['t3']()),
+    # todo: fix configurability of strain gauge
+    's1': lambda: _cls('StrainGauge')(interface=get_device('adc'), channel=HAL_CONFIG['strain_adc_channel'],
+                                      gain=HAL_CONFIG['strain_adc_gain'],
+                                      data_rate=HAL_CONFIG['strain_adc_sample_rate']),
+    # todo fix this so it works right
+    'load_cell': lambda: _cls('LoadCell')(**settings('load_cell')),
+    'actuator': lambda: _cls('Actuator')(position_sensor=get_device('adc'), speed_controller=get_device('dac'),
+                                         force_sensor=get_device('load_cell'),
+                                         pos_limits={'low': HAL_CONFIG['lower_limit'],
+                                                     'high': HAL_CONFIG['upper_limit']}),
+}
+# devices that other devices are built on, owning a device owns these too
+DEPENDENCIES: Dict[str, tuple] = {
+    's1': ('adc',),
+    'actuator': ('adc', 'dac', 'load_cell'),
+}
+# devices that publish from the polling thread once built. they are built when logging starts (see build()),
+# so their data is logged whether or not a routine uses them
+POLLED: Tuple[str, ...] = ('actuator', 't1', 't2', 't3', 's1')
+# devices built so far
+DEVICES: Dict[str, object] = {}
+_BUILD_LOCK = RLock()
+# resource name -> thread ident of its owner, and the resources each owning thread holds, see claim()
+_OWNERS: Dict[str, int] = {}
+_CLAIMS: Dict[int, FrozenSet[str]] = {}
+
+
+class DeviceBusy(RuntimeError):
+    """raised for a device (or resource) that is owned by another thread, or not owned by this one"""
+
+
+def expand_resources(resources: Iterable[str]) -> FrozenSet[str]:
+    """the resources along with every device they are built on"""
+    expanded = set()
+    pending = list(resources)
+    while pending:
+        name = pending.pop()
+        if name not in expanded:
+            expanded.add(name)
+            pending.extend(DEPENDENCIES.get(name, ()))
+    return frozenset(expanded)
+
+
+def claim(resources: Iterable[str]) -> FrozenSet[str]:
+    """
+    makes the calling thread the only one allowed to use the resources, and the devices they are built on.
+    while a thread holds a claim, it may only use devices it claimed.
+    resources are device names or any other name (eg: 'pump') shared by convention.
+    :return: everything that was claimed
+    """
+    resources = expand_resources(resources)
+    ident = get_ident()
+    with _BUILD_LOCK:
+        busy = sorted(name for name in resources if _OWNERS.get(name, ident) != ident)
+        if busy:
+            raise DeviceBusy(f'owned by another routine: {", ".join(busy)}')
+        resources = resources | _CLAIMS.get(ident, frozenset())
+        for name in resources:
+            _OWNERS[name] = ident
+        _CLAIMS[ident] = resources
+    return resources
+
+
+def release():
+    """releases everything claimed by the calling thread"""
+    with _BUILD_LOCK:
+        for name in _CLAIMS.pop(get_ident(), ()):
+            del _OWNERS[name]
+
+
+def claimed() -> FrozenSet[str]:
+    """resources claimed by the calling thread, empty if it holds no claim"""
+    return _CLAIMS.get(get_ident(), frozenset())
+
+
+def configure(config):
+    """
+    sets the settings devices are built with from a procedure's CONFIG (or any mapping of HAL_CONFIG keys).
+    only devices that have not been built yet are affected.
+    """
+    for key in HAL_CONFIG:
+        if key in config:
+            HAL_CONFIG[key] = config[key]
+
+
+def get_device(name: str):
+    """returns the named device, building it (and the devices it uses) on first access"""
+    # threads without a claim may use any device
+    if _CLAIMS and name not in _CLAIMS.get(get_ident(), (name,)):
+        raise DeviceBusy(f'{name} was not claimed by this routine')
+    device = DEVICES.get(name)
+    if device is None:
+        with _BUILD_LOCK:
+            device = DEVICES.get(name)
+            if device is None:
+                with profiler.span(name, 'device'):
+                    device = DEVICES[name] = _FACTORIES[name]()
+    return device
+
+
+def build(names: Iterable[str] = POLLED):
+    """builds the named devices (the polled ones by default) that have not been built yet"""
+    for name in names:
+        get_device(name)
+
+
+def __getattr__(name: str):
+    if name in _CLASSES:
+        cls = globals()[name] = _cls(name)
+        return cls
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+class _HalModule(ModuleType):
+    """
+    resolves device names through the registry. this takes precedence over submodules of the same name
+    (libs.hal.adc, libs.hal.dac, libs.hal.actuator), which the import system binds on the package when loaded.
+    """
+
+    def __getattribute__(self, name: str):
+        if name in _FACTORIES:
+            return get_device(name)
+        return super().__getattribute__(name)
+
+
+sys.modules[__name__].__class__ = _HalModule
+
+
 def hal_init():
     # choose BCM or BOARD
     GPIO.setmode(GPIO.BCM)
@@ -31,32 +223,33 @@ def hal_init():
     # initialize output values
     GPIO.output(PINS['relay_2'], GPIO.LOW)  # set GPIO22 to 0/GPIO.LOW/False
     GPIO.output(PINS['relay_1'], GPIO.LOW)  # set GPIO22 to 0/GPIO.LOW/False
+    dac = get_device('dac')
     dac.set_level(dac.stop)
 
 
 def hal_cleanup():
-    dac.set_voltage(dac.stop)
-    adc.stop_adc()
+    owned = claimed()
+    if owned:
+        # a routine running alongside others only resets its own devices, shared state is left to the executor
+        if 'dac' in owned and 'dac' in DEVICES:
+            DEVICES['dac'].set_voltage(DEVICES['dac'].stop)
+        if 'adc' in owned and 'adc' in DEVICES:
+            DEVICES['adc'].stop_adc()
+        return
+    # flush logged data before anything else, data_router imports the hal so it can not be imported at the top
+    from libs.data_router import close_loggers
+    close_loggers()
+    # devices that were never used have nothing to reset
+    if 'dac' in DEVICES:
+        DEVICES['dac'].set_voltage(DEVICES['dac'].stop)
+    if 'adc' in DEVICES:
+        DEVICES['adc'].stop_adc()
     GPIO.cleanup()
 
 
-# import hardware interfaces
-# instantiate HW
-adc = A2D(default_channel=1)
-dac = D2A()
-# todo: fix the soft/hard spi, configure naming ability.
-t1 = Thermocouple(name='ambient', tc_type='T', num_avgs=4, hardware_spi=SPI.SpiDev(0, 0))  # SPI0, PORT0
-t2 = Thermocouple(name='fluid', tc_type='T', num_avgs=4, hardware_spi=SPI.SpiDev(0, 1))  # SPI0, PORT1
-t3 = Thermocouple(name='sample', tc_type='T', num_avgs=4, software_spi={'clk': 13, 'cs': 5, 'do': 19, 'di': 26})
-# todo: fix configurability of strain gauge
-s1 = StrainGauge(interface=adc)
-
 # Thermocouple.read_temp = lambda *args: 2.34567
 # Thermocouple.read_internal_temp = lambda *args: 1.23456
 
-# todo fix this so it works right
-load_cell = LoadCell(port=LOAD_CELL_PORT)
-
 
 # noinspection PyMissingConstructor,PyPep8Naming
 # class load_cell(LoadCell):
@@ -68,6 +261,3 @@ load_cell = LoadCell(port=LOAD_CELL_PORT)
 #        from random import uniform
 #        sleep(uniform(100e-3, 700e-3))
 #        return 123, 456, 789
-
-
-actuator = Actuator(position_sensor=adc, speed_controller=dac, force_sensor=load_cell)
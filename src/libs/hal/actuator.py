@@ -10,21 +10,98 @@ Copyright (c):  2018 Danyal Ahsanullah
 License: N/A
 Description: 
 """
+from time import perf_counter
+from threading import Lock
 from typing import Tuple, Union
 from numbers import Real as _Real
 from collections import deque as _deque
 
 from libs.utils import GPIO
-from libs.utils import in2mm
-from libs.hal.constants import GLOBAL_VCC, PINS
+from libs.utils import in2mm, mm2in
+from libs.hal.constants import GLOBAL_VCC, PINS, POS_LIMITS
 # noinspection PyPep8Naming
 from libs.hal.adc import ADS1115Interface as A2D
 # noinspection PyPep8Naming
 from libs.hal.dac import MCP4725Interface as D2A
-from libs.data_router import add_to_poll, publish
+from libs.data_router import add_to_poll, publish, publish_event
 from libs.hal.sparkfun_openscale import OpenScale as LoadCell
 
 
+class LimitGuard:
+    """
+    cuts the actuator's drive before it runs past its position limits, checked on every position sample
+    (polled or read by an action's control loop), so independent of the action.
+
+    the velocity over the last samples predicts where the actuator will be once a cut takes effect: after the next
+    sample plus stop_time. drive toward a limit is cut as soon as that prediction reaches the limit, and cut again
+    on every sample for as long as it is driven that way. drive away from the limit is left alone.
+    trips are published as faults, unless the running move targets the limit (eg: set_position(pos_limit_high)),
+    in which case the cut is just how the move ends.
+    """
+
+    def __init__(self, actuator: 'Actuator', stop_time: float = 0.01, window: int = 3):
+        """
+        :param actuator: actuator guarded, its pos_limit_low/pos_limit_high (raw levels) are the limits
+        :param stop_time: time the actuator takes to stop once the dac is cut (s)
+        :param window: samples the velocity is estimated over
+        """
+        self.actuator = actuator
+        self.stop_time = stop_time
+        self.enabled = True
+        # 'low' or 'high' once the drive was cut at that limit, None once driven clear of it
+        self.tripped: Union[str, None] = None
+        self.trips = 0
+        # raw level the running set_position is headed for, None outside of one
+        self.target: Union[float, None] = None
+        self._samples: _deque = _deque(maxlen=max(2, window))
+        self._lock = Lock()
+
+    def predict(self, level: int, ts: float) -> float:
+        """adds a sample, returns the level predicted for when a cut made now would have taken effect"""
+        self._samples.append((ts, level))
+        (first_ts, first), (last_ts, last) = self._samples[0], self._samples[-1]
+        if last_ts <= first_ts:
+            return level
+        period = (last_ts - first_ts) / (len(self._samples) - 1)
+        return level + (last - first) / (last_ts - first_ts) * (period + self.stop_time)
+
+    def check(self, level: int, ts: float) -> bool:
+        """
+        checks a position sample, cutting the drive if it is about to run past a limit
+        :param level: raw position level
+        :param ts: time the sample was taken (perf_counter s)
+        :return: True if the drive was cut
+        """
+        actuator = self.actuator
+        # the trip is decided and recorded under the lock, the drive is cut and the fault published outside of it:
+        # cutting the dac can poll the position (eg: on the simulated clock), which comes back here
+        with self._lock:
+            predicted = self.predict(level, ts)
+            if actuator.direction == 'forward':
+                limit, past = 'high', max(level, predicted) >= actuator.pos_limit_high
+            else:
+                limit, past = 'low', min(level, predicted) <= actuator.pos_limit_low
+            if not actuator.speed_controller.value or not self.enabled:
+                return False
+            if not past:
+                self.tripped = None
+                return False
+            new_trip = self.tripped != limit
+            if new_trip:
+                self.tripped = limit
+                self.trips += 1
+            if self.target is None:
+                fault = new_trip
+            elif limit == 'high':
+                fault = new_trip and self.target < actuator.pos_limit_high
+            else:
+                fault = new_trip and self.target > actuator.pos_limit_low
+        actuator.speed_controller.set_level(0)
+        if fault:
+            publish_event('fault', meta='actuator', flags=(f'position_limit_{limit}',), acq_ts=ts)
+        return True
+
+
 class Actuator:
     """
     Actuator interface for main drive arm
@@ -48,7 +125,8 @@ class Actuator:
         :param position_sensor: ADC handle for position
         :param speed_controller: DAC handle for speed control
         :param force_sensor: ADC handle for measuring applied force
-        :param pos_limits: dictionary of {'high':<int>, 'low':<int>} that enforce limits on positions
+        :param pos_limits: dictionary of {'high':<int>, 'low':<int>} that enforce limits on positions,
+                           see LimitGuard
         :param units:
         """
         self.convert_units = {
@@ -61,8 +139,8 @@ class Actuator:
         self.speed_controller = speed_controller
         self.force_sensor = force_sensor
         self.distance_per_level = self.distance_per_volt * self.position_sensor.step_size
-        self.pos_limit_low = 5000
-        self.pos_limit_high = 26000
+        self.pos_limit_low = POS_LIMITS['low']
+        self.pos_limit_high = POS_LIMITS['high']
         self.units = units
         self.direction = 'forward'
         if pos_limits is not None:
@@ -70,10 +148,26 @@ class Actuator:
             self.pos_limit_high = pos_limits.pop('high', self.pos_limit_high)
         if movement_controller is not None:
             self.movement_controller = movement_controller
+        self.limit_guard = LimitGuard(self)
         add_to_poll(self._get_pos)
         add_to_poll(self._get_speed)
         add_to_poll(self._get_load)
 
+    @classmethod
+    def level_from_length(cls, length: float, units: str, step_size: float) -> int:
+        """
+        raw position level of a length, without building an actuator (eg: to convert a procedure's limits).
+        inverse of convert_units
+        :param length: length in units
+        :param units: one of 'raw', 'in', 'mm'
+        :param step_size: volts per level of the position adc, see A2D.step_size_for
+        """
+        if units == 'raw':
+            return length
+        if units == 'mm':
+            length = mm2in(length)
+        return round(length / (cls.distance_per_volt * step_size))
+
     def _get_pos(self):
         return self.position
 
@@ -98,6 +192,7 @@ class Actuator:
         pos = self.position_sensor.read_single()
         while pos < 1000:
             pos = self.position_sensor.read_single()
+        self.limit_guard.check(pos, perf_counter())
         return self.convert_units[self.units](pos)
         # LOCK.release()
 
@@ -150,6 +245,14 @@ class Actuator:
         :param speed: speed value to be used for movement. If not supplied, will use speed_controller default speed.
         :return: None
         """
+        # a cut at a limit this move targets is not a fault, see LimitGuard
+        self.limit_guard.target = self.level_from_length(position, self.units, self.position_sensor.step_size)
+        try:
+            return self._seek_position(position, speed)
+        finally:
+            self.limit_guard.target = None
+
+    def _seek_position(self, position: Union[int, float], speed: Union[float, int, None]) -> None:
         flag = False
         if speed is None:
             speed = self.speed_controller.default_val
@@ -180,6 +283,9 @@ class Actuator:
                     positions.append(pos)
                     flag = True
             flag = False
+            if self.limit_guard.tripped is not None and not self.speed_controller.value:
+                # stopped at a limit, as close to the target as the limits allow
+                return None
             # pos = self.position
             # positions.append(pos)
             value = sum(positions) / positions.maxlen
@@ -224,6 +330,9 @@ class Actuator:
         self.speed_controller.set_level(speed)
         while True:
             value = self.load[0]
+            if self.limit_guard.tripped is not None and not self.speed_controller.value:
+                # stopped at a position limit before reaching the load
+                return self.position
             # print(self.speed_controller.value, value)
             if abs(value - target_load) < eps:
                 self.speed_controller.set_level(0)
@@ -12,6 +12,7 @@ from collections import deque as _deque
 
 from libs.utils import GPIO
 from libs.hal.constants import GLOBAL_VCC
+from libs.instrumentation import timed
 
 try:
     from Adafruit_ADS1x15 import ADS1115
@@ -29,7 +30,8 @@ except ImportError:
     class ADS1115:
         """quick stub class for ADS1115"""
         stop_adc = _nop
-        start_adc = start_adc_comparator = get_last_result = read_adc = read_adc_difference = _sop
+        start_adc = start_adc_comparator = start_adc_difference_comparator = get_last_result = read_adc = \
+            read_adc_difference = _sop
 
 
 class ADS1115Interface(ADS1115):
@@ -73,7 +75,7 @@ class ADS1115Interface(ADS1115):
         self.gain = gain
         self.default_channel = default_channel
         self.alert_pin = alert_pin
-        self.step_size = 2 * self.max_voltage / self.levels
+        self.step_size = self.step_size_for(gain, vcc)
         self.history: _deque = _deque(maxlen=history_len)
         super().__init__()
 
@@ -87,6 +89,15 @@ class ADS1115Interface(ADS1115):
         self.history.append(res)
         return res
 
+    @classmethod
+    def step_size_for(cls, gain: float, vcc: float = GLOBAL_VCC) -> float:
+        """
+        volts per level at a gain, without building an interface (eg: to convert a procedure's limits)
+        :param gain: Internal PGA gain, one of accepted_gains
+        :param vcc: Supply voltage (V)
+        """
+        return 2 * min(cls.pga_map[gain], vcc) / cls.levels
+
     @property
     def max_voltage(self) -> float:
         """
@@ -112,6 +123,7 @@ class ADS1115Interface(ADS1115):
         """
         GPIO.wait_for_edge(self.alert_pin, GPIO.FALLING, timeout=timeout)
 
+    @timed('hal.adc.read_single')
     def read_single(self) -> int:
         """
         reads a single-shot reading from the ADC
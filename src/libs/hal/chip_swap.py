@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+chip_swap.py
+Author: Danyal Ahsanullah
+Date: 9/1/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: base for building the hal's devices on other chips (simulated, traced or replayed ones).
+"""
+
+from abc import ABC, abstractmethod
+from typing import Callable, Dict
+
+from libs import hal
+from libs.data_router import PUBLISH_FUNCS
+
+
+class ChipSwap(ABC):
+    """
+    swaps the hal's chip factories while installed, the devices built meanwhile are forgotten on uninstall.
+    devices are built with the hal's own settings (hal.settings(name)), only the chip underneath differs.
+    """
+
+    def __init__(self):
+        self.installed = False
+        self._factories: Dict[str, Callable] = {}
+        self._polled = 0
+
+    @abstractmethod
+    def _factories_for(self) -> Dict[str, Callable]:
+        """factories of the swapped devices, by hal device name"""
+
+    def install(self):
+        """replaces the hal's chip factories, call before any device is built"""
+        if self.installed:
+            return
+        if hal.DEVICES:
+            raise RuntimeError(f'devices already built: {sorted(hal.DEVICES)}')
+        factories = self._factories_for()
+        self._factories = {name: hal._FACTORIES[name] for name in factories}
+        hal._FACTORIES.update(factories)
+        self._polled = len(PUBLISH_FUNCS)
+        self.installed = True
+
+    def uninstall(self):
+        """restores the hal's chip factories"""
+        if not self.installed:
+            return
+        hal._FACTORIES.update(self._factories)
+        # along with the devices built on the swapped ones
+        for name in (*self._factories, 's1', 'actuator'):
+            hal.DEVICES.pop(name, None)
+        del PUBLISH_FUNCS[self._polled:]
+        self.installed = False
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
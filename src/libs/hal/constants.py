@@ -1,7 +1,42 @@
 from sys import platform as _platform
-from threading import Lock
+from threading import RLock, local
+from contextlib import contextmanager
 
-LOCK = Lock()
+# held while polling and by exclusive bus users (eg: a strain capture). reentrant, as the polling thread's
+# device reads take it too (OpenScale.get_reading). take it with hold() (or acquire()/release()), which keep
+# track of the threads holding it, see held()
+LOCK = RLock()
+# per thread count of the holds on LOCK
+_holds = local()
+
+
+def acquire(blocking: bool = True) -> bool:
+    """acquires LOCK for the calling thread, returns whether it was acquired"""
+    if not LOCK.acquire(blocking):
+        return False
+    _holds.count = getattr(_holds, 'count', 0) + 1
+    return True
+
+
+def release():
+    """releases a hold on LOCK taken by acquire()"""
+    _holds.count -= 1
+    LOCK.release()
+
+
+def held() -> bool:
+    """whether the calling thread holds LOCK (eg: mid poll round or mid capture)"""
+    return getattr(_holds, 'count', 0) > 0
+
+
+@contextmanager
+def hold():
+    """holds LOCK for the enclosed block"""
+    acquire()
+    try:
+        yield
+    finally:
+        release()
 
 
 GLOBAL_VCC = 3.3
@@ -9,6 +44,11 @@ TIMEOUT = None
 UNITS = 'raw'
 OUTFILE = None
 LOAD_CELL_PORT = 'COM10' if _platform == 'win32' else '/dev/ttyusb0'
+# default actuator travel limits (raw adc levels)
+POS_LIMITS = {
+    'low': 5000,
+    'high': 26000,
+}
 PINS = {
     'relay_1': 17,
     'relay_2': 22,
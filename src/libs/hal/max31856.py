@@ -35,6 +35,9 @@ THE SOFTWARE.
 """
 # import warnings
 # import math
+import numpy as np
+from libs.hal.soft_spi import software_spi as _soft_spi
+from libs.instrumentation import timed
 
 try:
     import Adafruit_GPIO as Adafruit_GPIO
@@ -112,6 +115,10 @@ class MAX31856(object):
     MAX31856_REG_READ_LTCBL = 0x0E  # Linearized TC Temperature, Byte 0
     MAX31856_REG_READ_FAULT = 0x0F  # Fault status register
 
+    # Burst read of CJTH through FAULT, registers auto-increment so one transaction covers all six
+    MAX31856_BURST_START = MAX31856_REG_READ_CJTH
+    MAX31856_BURST_LEN = MAX31856_REG_READ_FAULT - MAX31856_REG_READ_CJTH + 1
+
     # Write Addresses
     MAX31856_REG_WRITE_CR0 = 0x80
     MAX31856_REG_WRITE_CR1 = 0x81
@@ -129,6 +136,23 @@ class MAX31856(object):
     # Pre-config Register Options
     MAX31856_CR0_READ_ONE = 0x40  # One shot reading, delay approx. 200ms then read temp registers
     MAX31856_CR0_READ_CONT = 0x80  # Continuous reading, delay approx. 100ms between readings
+    MAX31856_CR0_OCFAULT = 0x10  # Open circuit detection enabled (Rs < 5kOhm), checked every 16 conversions
+
+    # Fault status register bits, see data sheet Table 6 (SR)
+    MAX31856_FAULT_CJRANGE = 0x80  # Cold junction out of operating range
+    MAX31856_FAULT_TCRANGE = 0x40  # Thermocouple out of type range
+    MAX31856_FAULT_CJHIGH = 0x20  # Cold junction above high threshold
+    MAX31856_FAULT_CJLOW = 0x10  # Cold junction below low threshold
+    MAX31856_FAULT_TCHIGH = 0x08  # Thermocouple above high threshold
+    MAX31856_FAULT_TCLOW = 0x04  # Thermocouple below low threshold
+    MAX31856_FAULT_OVUV = 0x02  # Over/under voltage on the thermocouple inputs
+    MAX31856_FAULT_OPEN = 0x01  # Thermocouple open circuit
+    FAULT_MAP = {'cj_range': MAX31856_FAULT_CJRANGE, 'tc_range': MAX31856_FAULT_TCRANGE,
+                 'cj_high': MAX31856_FAULT_CJHIGH, 'cj_low': MAX31856_FAULT_CJLOW,
+                 'tc_high': MAX31856_FAULT_TCHIGH, 'tc_low': MAX31856_FAULT_TCLOW,
+                 'ovuv': MAX31856_FAULT_OVUV, 'open': MAX31856_FAULT_OPEN}
+    # faults that make the temperature reading meaningless, threshold faults are only alarms
+    MAX31856_FAULT_INVALID = MAX31856_FAULT_CJRANGE | MAX31856_FAULT_TCRANGE | MAX31856_FAULT_OVUV | MAX31856_FAULT_OPEN
 
     # Thermocouple Types
     THERMOCOUPLE_MAP = {'B': 0x0, 'E': 0x1, 'J': 0x2, 'K': 0x3, 'N': 0x4, 'R': 0x5, 'S': 0x6, 'T': 0x7}
@@ -136,6 +160,11 @@ class MAX31856(object):
     # sample numbers
     SAMPLE_MAP = {1: 0x0, 2: 0x01, 4: 0x02, 8: 0x03, 16: 0x04}
 
+    # Continuous conversion timing with 60Hz noise rejection (CR0 bit 0 clear), see datasheet electrical
+    # characteristics. Max values are used so a modelled conversion is never expected before it is ready.
+    MAX31856_CONST_CONV_TIME_CONT = 0.090  # single sample conversion (s)
+    MAX31856_CONST_CONV_TIME_AVG = 0.0333  # additional time per averaged sample (s)
+
     def __init__(self, tc_type='T', avgsel=1, software_spi=None, hardware_spi=None, gpio=None):
         """Initialize MAX31856 device with software SPI on the specified CLK,
         CS, and DO pins.  Alternatively can specify hardware SPI by sending an
@@ -150,6 +179,9 @@ class MAX31856(object):
                 cs (integer): Pin number for software SPI cs
                 do (integer): Pin number for software SPI MISO
                 di (integer): Pin number for software SPI MOSI
+                backend (str, optional): 'auto' (default), 'pigpio', 'waveform' or 'bitbang'.
+                    see libs.hal.soft_spi.software_spi
+                chip (optional): gpio chip used by the waveform backend
             hardware_spi (SPI.SpiDev): If using hardware SPI, define the connection
         """
         self._logger = logging.getLogger('Adafruit_MAX31856.MAX31856')
@@ -162,11 +194,19 @@ class MAX31856(object):
             self._spi = hardware_spi
         elif software_spi is not None:
             self._logger.debug('Using software SPI')
-            # Default to platform GPIO if not provided.
-            if gpio is None:
-                gpio = Adafruit_GPIO.get_platform_gpio()
-            self._spi = SPI.BitBang(gpio, software_spi['clk'], software_spi['di'],
-                                    software_spi['do'], software_spi['cs'])
+            backend = software_spi.get('backend', 'auto')
+            self._spi = None
+            if gpio is None and backend != 'bitbang':
+                # prefer a backend that does not toggle one pin per python call
+                self._spi = _soft_spi(software_spi['clk'], software_spi['di'], software_spi['do'],
+                                      software_spi['cs'], backend=backend,
+                                      chip=software_spi.get('chip', 'gpiochip0'))
+            if self._spi is None:
+                # Default to platform GPIO if not provided.
+                if gpio is None:
+                    gpio = Adafruit_GPIO.get_platform_gpio()
+                self._spi = SPI.BitBang(gpio, software_spi['clk'], software_spi['di'],
+                                        software_spi['do'], software_spi['cs'])
         else:
             raise ValueError('Must specify either spi for for hardware SPI or clk, cs, and do for softwrare SPI!')
         self._spi.set_clock_hz(5000000)
@@ -181,6 +221,11 @@ class MAX31856(object):
         self._write_register(self.MAX31856_REG_WRITE_CR0, self.MAX31856_CR0_READ_CONT)
         self._write_register(self.MAX31856_REG_WRITE_CR1, cr1)
 
+    @property
+    def conversion_time(self):
+        """Return the approximate time (s) between continuous mode conversions for the current averaging."""
+        return self.MAX31856_CONST_CONV_TIME_CONT + ((1 << self.avgsel) - 1) * self.MAX31856_CONST_CONV_TIME_AVG
+
     @staticmethod
     def _cj_temp_from_bytes(msb, lsb):
         """Takes in the msb and lsb from a Cold Junction (CJ) temperature reading and converts it
@@ -238,6 +283,56 @@ class MAX31856(object):
 
         return temp_c
 
+    @staticmethod
+    def decode_cj_temps(msb, lsb):
+        """Vectorized _cj_temp_from_bytes, bit-exact with the scalar decoder.
+
+        Args:
+            msb (array like): Most significant bytes of CJ temperature readings
+            lsb (array like): Least significant bytes of CJ temperature readings
+
+        Returns:
+            temp_c (np.ndarray): float64 temperatures in degrees celsius
+        """
+        msb = np.asarray(msb, dtype=np.int32)
+        temp_bytes = (((msb & 0x7F) << 8) + np.asarray(lsb, dtype=np.int32)) >> 2
+        temp_bytes -= (msb >> 7) << (MAX31856.MAX31856_CONST_CJ_BITS - 1)
+        return temp_bytes * MAX31856.MAX31856_CONST_CJ_LSB
+
+    @staticmethod
+    def decode_thermocouple_temps(byte0, byte1, byte2):
+        """Vectorized _thermocouple_temp_from_bytes, bit-exact with the scalar decoder.
+
+        Args:
+            byte0 (array like): Least significant bytes of thermocouple temperature readings
+            byte1 (array like): Middle bytes of thermocouple temperature readings
+            byte2 (array like): Most significant bytes of thermocouple temperature readings
+
+        Returns:
+            temp_c (np.ndarray): float64 temperatures in degrees celsius
+        """
+        byte2 = np.asarray(byte2, dtype=np.int32)
+        temp_bytes = (((byte2 & 0x7F) << 16) + (np.asarray(byte1, dtype=np.int32) << 8)
+                      + np.asarray(byte0, dtype=np.int32)) >> 5
+        temp_bytes -= (byte2 >> 7) << (MAX31856.MAX31856_CONST_THERM_BITS - 1)
+        return temp_bytes * MAX31856.MAX31856_CONST_THERM_LSB
+
+    @staticmethod
+    def decode_bursts(values):
+        """Vectorized _burst_from_bytes for a capture of many CJTH..FAULT bursts.
+
+        Args:
+            values (array like): shape (N, 6) bytes per burst in register order:
+                CJTH, CJTL, LTCBH, LTCBM, LTCBL, FAULT
+
+        Returns:
+            (temp_c, internal_temp_c, fault) (np.ndarray, np.ndarray, np.ndarray)
+        """
+        values = np.asarray(values, dtype=np.uint8).reshape(-1, MAX31856.MAX31856_BURST_LEN)
+        return (MAX31856.decode_thermocouple_temps(values[:, 4], values[:, 3], values[:, 2]),
+                MAX31856.decode_cj_temps(values[:, 0], values[:, 1]),
+                values[:, 5].copy())
+
     def read_internal_temp_c(self):
         """Return internal temperature value in degrees celsius."""
         val_low_byte = self._read_register(self.MAX31856_REG_READ_CJTL)
@@ -260,6 +355,38 @@ class MAX31856(object):
 
         return temp_c
 
+    @staticmethod
+    def _burst_from_bytes(values):
+        """Decodes a CJTH..FAULT burst into its temperatures and fault status.
+
+        Args:
+            values (list): bytes read starting at CJTH, in register order:
+                CJTH, CJTL, LTCBH, LTCBM, LTCBL, FAULT
+
+        Returns:
+            (temp_c, internal_temp_c, fault) (float, float, int)
+        """
+        cjth, cjtl, ltcbh, ltcbm, ltcbl, fault = values
+        return (MAX31856._thermocouple_temp_from_bytes(ltcbl, ltcbm, ltcbh),
+                MAX31856._cj_temp_from_bytes(cjth, cjtl),
+                fault)
+
+    @timed('hal.max31856.read_burst')
+    def read_burst(self):
+        """Return thermocouple temperature, internal temperature (both in degrees celsius) and
+        the fault register from a single SPI transaction.
+        """
+        temp_c, internal_temp_c, fault = MAX31856._burst_from_bytes(
+            self._read_registers(self.MAX31856_BURST_START, self.MAX31856_BURST_LEN))
+        self._logger.debug("Thermocouple Temperature {0} deg. C, Cold Junction Temperature {1} deg. C, "
+                           "Fault 0x{2:02X}".format(temp_c, internal_temp_c, fault))
+        return temp_c, internal_temp_c, fault
+
+    @staticmethod
+    def decode_fault(fault):
+        """Return the names (see FAULT_MAP) of the faults set in a fault status register value."""
+        return tuple(name for name, mask in MAX31856.FAULT_MAP.items() if fault & mask)
+
     def read_fault_register(self):
         """Return bytes containing fault codes and hardware problems.
         """
@@ -290,6 +417,29 @@ class MAX31856(object):
             (address & 0xFFFF), (value & 0xFFFF)))
         return value
 
+    def _read_registers(self, address, count):
+        """Reads `count` consecutive registers starting at address from the MAX31856
+
+        Args:
+            address (8-bit Hex): Address of the first register to read. Constants listed in class
+                as MAX31856_REG_READ_*
+            count (int): Number of registers to read
+
+        Note:
+            The MAX31856 auto-increments the register address while chip select is held, so a single
+            transfer of the address followed by `count` dummy bytes returns every register in the
+            range. As with _read_register, the first returned byte is discarded.
+        """
+
+        raw = self._spi.transfer([address] + [0x00] * count)
+        if raw is None or len(raw) != count + 1:
+            raise RuntimeError('Did not read expected number of bytes from device!')
+
+        values = list(raw[1:])
+        self._logger.debug('Read Registers: 0x{0:02X}-0x{1:02X}, Raw Values: {2}'.format(
+            (address & 0xFF), ((address + count - 1) & 0xFF), ' '.join('0x{0:02X}'.format(v) for v in values)))
+        return values
+
     def _write_register(self, address, write_value):
         """Writes to a register at address from the MAX31856
 
@@ -0,0 +1,739 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+simulation.py
+Author: Danyal Ahsanullah
+Date: 8/30/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: simulated rig, for dry runs of procedures without the hardware.
+
+    the adc, dac, thermocouple and load cell chips (ADS1115, MCP4725, MAX31856, OpenScale) are replaced by
+    virtual ones whose signals come from a physical model of the rig (RigModel). everything above the chips,
+    the hal drivers, actions and logging, is the real code.
+
+    time is virtual: it only advances by how long each chip transaction takes on the hardware, so a procedure
+    runs as fast as the cpu allows. sensor polling runs on the virtual clock, between the procedure's transactions.
+
+    simulation = Simulation()
+    simulation.install()  # before any device is built
+    executor = ProcedureExecutor(cfg, routines, poll=False, outdir=simulation.outdir)
+    simulation.attach(executor.logger)
+    executor.run()
+    executor.logger.close()
+    print(simulation.report())
+    simulation.uninstall()
+
+    or: launcher.py --simulate --config <procedure>
+"""
+
+import os
+import sys
+import time as _time
+from math import exp
+from random import Random
+from tempfile import mkdtemp
+from shutil import rmtree
+from threading import Event, RLock, Thread
+from typing import Callable, Dict, List, Tuple, Union
+
+from libs.utils import GPIO as _GPIO
+from libs import hal
+from libs.hal.constants import acquire, held, release
+from libs.hal.actuator import Actuator
+from libs.hal.adc import ADS1115, ADS1115Interface as A2D
+from libs.hal.dac import MCP4725, MCP4725Interface as D2A
+from libs.hal.max31856 import MAX31856
+from libs.hal.thermocouple import Thermocouple
+from libs.hal.sparkfun_openscale import OpenScale
+from libs.hal.chip_swap import ChipSwap
+from libs.data_router import PUBLISH_FUNCS, TOPICS, register_listeners
+from pubsub import pub
+
+N_PER_LBF = 4.448222
+N_PER_KG = 9.80665
+# time of one i2c transaction (s)
+I2C_TIME = 0.0002
+# modules whose clocks are left alone
+_REAL_TIME_MODULES = frozenset({'libs.startup_profile', __name__})
+
+
+class SimulationLimit(RuntimeError):
+    """
+    raised once the simulated time passes the simulation's limit, eg: for an actuator that stalled.
+    a RuntimeError, so the routine it interrupts fails like it would on an error state.
+    """
+
+
+class VirtualClock:
+    """
+    simulated time (s). advanced by the virtual devices, read through perf_counter/time and slept on through sleep,
+    which replace the real ones while a simulation is installed.
+    """
+
+    def __init__(self, limit: Union[float, None] = None):
+        """
+        :param limit: simulated time after which SimulationLimit is raised, None for no limit
+        """
+        self.now = 0.0
+        self.limit = limit
+        self.epoch = _time.time()
+        self._lock = RLock()
+        # [next due time, period, callback] of periodic callbacks, see every()
+        self._timers: List[list] = []
+        self._in_timer = False
+        self.stopped = False
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.epoch + self.now
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def every(self, period: float, callback: Callable[[float], None]):
+        """calls callback(due time) every period of simulated time, see advance()"""
+        self._timers.append([self.now + period, period, callback])
+
+    def advance(self, seconds: float):
+        """
+        moves time forward, then runs the periodic callbacks that came due.
+        callbacks run on the advancing thread, the time they take delays the caller as sharing the bus would.
+        callbacks hold the hal LOCK, and are held back while it is held elsewhere (eg: during a strain capture),
+        as the polling thread is.
+        """
+        with self._lock:
+            self.now += max(0.0, seconds)
+            if self.limit is not None and self.now > self.limit and not self.stopped:
+                # once, and the periodic callbacks stop with it: the cleanup after it still needs to run
+                self.stopped = True
+                raise SimulationLimit(f'simulation passed its limit of {self.limit} s')
+            if self._in_timer or self.stopped or not self._timers:
+                return
+            # held by this thread (eg: mid capture) or another one, the callbacks wait for it
+            if held() or not acquire(blocking=False):
+                return
+            self._in_timer = True
+            try:
+                for timer in self._timers:
+                    while timer[0] <= self.now:
+                        due = timer[0]
+                        timer[0] += timer[1]
+                        timer[2](due)
+            finally:
+                self._in_timer = False
+                release()
+
+
+class RigModel:
+    """
+    physical model of the rig:
+        the actuator moves at its rated speed (Actuator.inches_per_second), scaled by the dac level and slowed by
+        the load, and stalls when pulling past its rated force.
+        the sample is a spring engaged below `engage` inches of extension: retracting the actuator past it
+        loads the sample in tension (the direction Actuator.set_load uses).
+        the sample heats up with increasing strain and cools with decreasing strain (elastocaloric effect),
+        and exchanges heat with the fluid, which in turn relaxes to ambient (thermal lag).
+    """
+
+    def __init__(self, clock: VirtualClock, rating: int = 150, stroke: float = Actuator.stroke,
+                 position: float = 2.5, engage: float = 2.0, stiffness: float = 200.0, gauge_length: float = 10.0,
+                 elastocaloric: float = 4.0, tau_sample: float = 2.0, tau_fluid: float = 30.0,
+                 ambient: float = 22.0, min_stroke: float = 0.01, max_step: float = 0.001):
+        """
+        :param clock: clock the model follows
+        :param rating: actuator force rating (lbf), one of Actuator.inches_per_second
+        :param stroke: actuator stroke (in)
+        :param position: starting position (in)
+        :param engage: position (in) below which the sample is in tension
+        :param stiffness: sample stiffness (N/in)
+        :param gauge_length: sample length (in) strain is measured over
+        :param elastocaloric: sample temperature change per % of strain (K/%)
+        :param tau_sample: time constant of the sample's heat exchange with the fluid (s)
+        :param tau_fluid: time constant of the fluid's heat exchange with ambient (s)
+        :param ambient: ambient temperature (C)
+        :param min_stroke: travel (in) in one direction that counts as a stroke, shorter moves are corrections
+        :param max_step: longest integration step while moving (s)
+        """
+        self.clock = clock
+        self.rating = rating
+        self.speed_none = Actuator.inches_per_second[rating]['none']
+        self.speed_full = Actuator.inches_per_second[rating]['full']
+        self.stroke = stroke
+        self.position = position
+        self.engage = engage
+        self.stiffness = stiffness
+        self.gauge_length = gauge_length
+        self.elastocaloric = elastocaloric
+        self.tau_sample = tau_sample
+        self.tau_fluid = tau_fluid
+        self.ambient = ambient
+        self.sample_temp = ambient
+        self.fluid_temp = ambient
+        self.min_stroke = min_stroke
+        self.max_step = max_step
+        self.level = 0
+        self.forward = True
+        self.t = clock.now
+        self._lock = RLock()
+        # statistics
+        self.travel = 0.0
+        self.strokes = 0
+        self.stalled = 0.0
+        self.peak_force = 0.0
+        self.peak_strain = 0.0
+        self._segment = 0.0
+        self._last_stroke = 0
+
+    @property
+    def force(self) -> float:
+        """tension in the sample (N)"""
+        return self.stiffness * max(0.0, self.engage - self.position)
+
+    @property
+    def strain(self) -> float:
+        """strain of the sample (%)"""
+        return 100 * max(0.0, self.engage - self.position) / self.gauge_length
+
+    @property
+    def cycles(self) -> int:
+        """full back and forth movements so far"""
+        strokes = self.strokes
+        if abs(self._segment) >= self.min_stroke and (self._segment > 0) - (self._segment < 0) != self._last_stroke:
+            strokes += 1
+        return strokes // 2
+
+    def drive(self, level: int):
+        """dac output level, 0 stops"""
+        with self._lock:
+            self.update()
+            self.level = level
+
+    def relay(self, pin: int, level):
+        """gpio output, the direction relay sets forward when high"""
+        with self._lock:
+            self.update()
+            if pin == hal.PINS['relay_1']:
+                self.forward = bool(level)
+
+    def update(self):
+        """brings the model up to the clock's time"""
+        with self._lock:
+            now = self.clock.now
+            while self.t < now:
+                # exact for the temperatures, so only motion needs small steps
+                if self.level <= 0 or now - self.t <= self.max_step:
+                    self._step(now - self.t)
+                    self.t = now
+                else:
+                    self._step(self.max_step)
+                    self.t += self.max_step
+
+    def _step(self, dt: float):
+        strain = self.strain
+        if self.level > 0:
+            load = min(1.0, self.force / N_PER_LBF / self.rating)
+            if not self.forward and load >= 1.0:
+                # pulling at (or past) the rated force
+                self.stalled += dt
+            else:
+                speed = (self.speed_none - (self.speed_none - self.speed_full) * load) * self.level / D2A.levels
+                moved = min(self.stroke, max(0.0, self.position + (speed if self.forward else -speed) * dt)) \
+                    - self.position
+                self.position += moved
+                self.travel += abs(moved)
+                if moved and (moved > 0) != (self._segment > 0) and self._segment:
+                    direction = 1 if self._segment > 0 else -1
+                    if abs(self._segment) >= self.min_stroke and direction != self._last_stroke:
+                        self.strokes += 1
+                        self._last_stroke = direction
+                    self._segment = 0.0
+                self._segment += moved
+                self.peak_force = max(self.peak_force, self.force)
+                self.peak_strain = max(self.peak_strain, self.strain)
+        self.sample_temp += self.elastocaloric * (self.strain - strain)
+        self.sample_temp += (self.fluid_temp - self.sample_temp) * (1 - exp(-dt / self.tau_sample))
+        self.fluid_temp += (self.sample_temp - self.fluid_temp) * (1 - exp(-dt / self.tau_sample)) / 2
+        self.fluid_temp += (self.ambient - self.fluid_temp) * (1 - exp(-dt / self.tau_fluid))
+
+    def position_voltage(self) -> float:
+        """output of the position pot (V)"""
+        self.update()
+        return self.position / self.stroke * Actuator.pot_voltage
+
+    def bridge_ratio(self, bridge: str = 'quarter', gf: float = 2.0) -> float:
+        """Vout / Vex of the strain gauge bridge, see StrainGauge.strain_from_level"""
+        self.update()
+        k = -100 * hal.StrainGauge.BRIDGE_MAP[bridge] / gf
+        strain = self.strain
+        return strain / (k - 2 * strain) if bridge == 'quarter' else strain / k
+
+    def temperatures(self) -> Dict[str, float]:
+        """temperatures (C) at each thermocouple, by thermocouple name"""
+        self.update()
+        return {'ambient': self.ambient, 'fluid': self.fluid_temp, 'sample': self.sample_temp}
+
+
+class VirtualGPIO:
+    """gpio pins of the simulated rig, replaces RPi.GPIO while a simulation is installed"""
+    BCM, BOARD, IN, OUT, RISING, FALLING, BOTH, PUD_UP, PUD_DOWN = range(11, 20)
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, rig: RigModel):
+        self.rig = rig
+        self.levels: Dict[int, int] = {}
+        # adc whose ALERT/RDY pin signals conversions, set once the adc is built
+        self.adc: Union['VirtualA2D', None] = None
+        # edge detection armed per pin: (stop, thread producing the edges)
+        self._detecting: Dict[int, Tuple[Event, Thread]] = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=None, initial=None):
+        if initial is not None:
+            self.output(channel, initial)
+
+    def cleanup(self, *args):
+        self.levels.clear()
+
+    def output(self, channel, level):
+        self.levels[channel] = int(bool(level))
+        self.rig.relay(channel, level)
+
+    def input(self, channel) -> int:
+        return self.levels.get(channel, self.LOW)
+
+    # noinspection PyUnusedLocal
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        """
+        the adc's conversion ready edges call `callback` as its conversions complete. edges are paced in real time
+        on their own thread, as RPi.GPIO's callbacks are, and move the simulated clock along with them.
+        """
+        if callback is None or self.adc is None or channel != self.adc.alert_pin or not self.adc.converting:
+            return
+        stop = Event()
+
+        def convert():
+            while not stop.wait(1.0 / self.adc._continuous[2]) and self.adc.converting:
+                self.adc.wait_conversion()
+                callback(channel)
+        thread = Thread(target=convert, name='virtual-gpio', daemon=True)
+        self._detecting[channel] = (stop, thread)
+        thread.start()
+
+    def remove_event_detect(self, channel):
+        stop, thread = self._detecting.pop(channel, (None, None))
+        if thread is not None:
+            stop.set()
+            thread.join()
+
+    def wait_for_edge(self, channel, edge, timeout=None):
+        """the adc's conversion ready edge, or nothing until the timeout (ms)"""
+        if self.adc is not None and channel == self.adc.alert_pin and self.adc.converting:
+            self.adc.wait_conversion()
+            return channel
+        self.rig.clock.advance((timeout or 0) / 1000)
+        return None
+
+
+class VirtualADS1115(ADS1115):
+    """ADS1115 (Adafruit_ADS1x15 interface) sampling signals of the simulated rig"""
+    # Adafruit_ADS1x15 default data rate
+    default_rate = 128
+
+    # noinspection PyMissingConstructor
+    def __init__(self, *args, **kwargs):
+        # no i2c bus is opened
+        self.signals: Dict[Tuple[str, int], Callable[[], float]] = {}
+        self.noise = 0.0
+        self.random = Random(0)
+        self.clock: Union[VirtualClock, None] = None
+        self._continuous: Union[tuple, None] = None
+
+    def _level(self, key: Tuple[str, int], gain) -> int:
+        signal = self.signals.get(key)
+        volts = 0.0 if signal is None else signal()
+        level = round(volts / A2D.pga_map[gain] * 32768 + self.random.gauss(0.0, self.noise))
+        return max(A2D.min_level, min(A2D.max_level, level))
+
+    def _single(self, key: Tuple[str, int], gain, data_rate) -> int:
+        # config write, wait for the conversion, result read
+        self.clock.advance(2 * I2C_TIME + 1.0 / (data_rate or self.default_rate) + 0.0001)
+        return self._level(key, gain)
+
+    def read_adc(self, channel, gain=1, data_rate=None):
+        return self._single(('single', channel), gain, data_rate)
+
+    def read_adc_difference(self, differential, gain=1, data_rate=None):
+        return self._single(('diff', differential), gain, data_rate)
+
+    def _start(self, key: Tuple[str, int], gain, data_rate) -> int:
+        self.clock.advance(I2C_TIME)
+        self._continuous = (key, gain, data_rate or self.default_rate, self.clock.now)
+        self.wait_conversion()
+        return self.get_last_result()
+
+    def start_adc(self, channel, gain=1, data_rate=None):
+        return self._start(('single', channel), gain, data_rate)
+
+    def start_adc_difference(self, differential, gain=1, data_rate=None):
+        return self._start(('diff', differential), gain, data_rate)
+
+    # noinspection PyUnusedLocal
+    def start_adc_comparator(self, channel, high_threshold, low_threshold, gain=1, data_rate=None, *args, **kwargs):
+        return self._start(('single', channel), gain, data_rate)
+
+    # noinspection PyUnusedLocal
+    def start_adc_difference_comparator(self, differential, high_threshold, low_threshold, gain=1, data_rate=None,
+                                        *args, **kwargs):
+        return self._start(('diff', differential), gain, data_rate)
+
+    @property
+    def converting(self) -> bool:
+        return self._continuous is not None
+
+    def wait_conversion(self):
+        """waits for the next continuous mode conversion to complete"""
+        _, _, data_rate, start = self._continuous
+        done = int((self.clock.now - start) * data_rate) + 1
+        self.clock.advance(start + done / data_rate - self.clock.now)
+
+    def get_last_result(self):
+        self.clock.advance(I2C_TIME)
+        if self._continuous is None:
+            return 0
+        key, gain, _, _ = self._continuous
+        return self._level(key, gain)
+
+    def stop_adc(self):
+        self.clock.advance(I2C_TIME)
+        self._continuous = None
+
+
+class VirtualA2D(A2D, VirtualADS1115):
+    """the hal's adc interface on a virtual ADS1115"""
+
+    def __init__(self, clock: VirtualClock, signals: Dict[Tuple[str, int], Callable[[], float]], noise: float = 1.0,
+                 seed: int = 0, **kwargs):
+        """
+        :param clock: simulation clock
+        :param signals: voltage source of each input, by ('single', channel) or ('diff', differential)
+        :param noise: standard deviation of the noise added to readings (levels)
+        :param seed: seed of the noise
+        :param kwargs: passed to ADS1115Interface
+        """
+        super().__init__(**kwargs)
+        self.clock = clock
+        self.signals = signals
+        self.noise = noise
+        self.random = Random(seed)
+
+
+class VirtualMCP4725(MCP4725):
+    """MCP4725 (Adafruit_MCP4725 interface) driving the simulated actuator's speed"""
+
+    # noinspection PyMissingConstructor
+    def __init__(self, *args, **kwargs):
+        # no i2c bus is opened
+        self.rig: Union[RigModel, None] = None
+
+    # noinspection PyUnusedLocal
+    def set_voltage(self, value, persist=False):
+        self.rig.clock.advance(I2C_TIME)
+        self.rig.drive(int(value))
+
+
+class VirtualD2A(D2A, VirtualMCP4725):
+    """the hal's dac interface on a virtual MCP4725"""
+
+    def __init__(self, rig: RigModel, **kwargs):
+        super().__init__(**kwargs)
+        self.rig = rig
+
+
+class VirtualMAX31856:
+    """
+    MAX31856 as seen over its spi bus, pass it to a Thermocouple as its hardware_spi.
+    temperatures come from the simulated rig, faults are never raised.
+    """
+
+    def __init__(self, rig: RigModel, sensor: str, internal: Union[float, None] = None):
+        """
+        :param rig: simulated rig
+        :param sensor: name of the rig temperature measured, see RigModel.temperatures
+        :param internal: cold junction (board) temperature (C), defaults to the rig's ambient
+        """
+        self.rig = rig
+        self.sensor = sensor
+        self.internal = rig.ambient if internal is None else internal
+        self.clock_hz = 5000000
+        self.registers = bytearray(16)
+
+    def set_clock_hz(self, hz):
+        self.clock_hz = hz
+
+    def set_mode(self, mode):
+        pass
+
+    def set_bit_order(self, order):
+        pass
+
+    def _read(self, address: int) -> int:
+        if MAX31856.MAX31856_REG_READ_CJTH <= address <= MAX31856.MAX31856_REG_READ_LTCBL:
+            temp = round(self.rig.temperatures()[self.sensor] / MAX31856.MAX31856_CONST_THERM_LSB)
+            cj = round(self.internal / MAX31856.MAX31856_CONST_CJ_LSB)
+            word = ((cj & ((1 << MAX31856.MAX31856_CONST_CJ_BITS) - 1)) << 2).to_bytes(2, 'big') + \
+                ((temp & ((1 << MAX31856.MAX31856_CONST_THERM_BITS) - 1)) << 5).to_bytes(3, 'big')
+            return word[address - MAX31856.MAX31856_REG_READ_CJTH]
+        if address == MAX31856.MAX31856_REG_READ_FAULT:
+            return 0
+        return self.registers[address & 0x0F]
+
+    def transfer(self, data):
+        """one chip select cycle: address then data bytes, reads auto increment the address"""
+        self.rig.clock.advance(len(data) * 8 / self.clock_hz + 0.00002)
+        address = data[0]
+        if address & 0x80:
+            for offset, value in enumerate(data[1:]):
+                self.registers[(address + offset) & 0x0F] = value
+            return [0] * len(data)
+        return [0] + [self._read((address + offset) & 0x0F) for offset in range(len(data) - 1)]
+
+
+class VirtualOpenScale(OpenScale):
+    """OpenScale board measuring the simulated sample's tension, answers serial triggers with a reading line"""
+    # loadcell amplifier conversions per second
+    conversion_rate = 80
+
+    def __init__(self, rig: RigModel, *args, **kwargs):
+        self.rig = rig
+        self._buffer = bytearray()
+        super().__init__(*args, **kwargs)
+        # already past the startup banner
+        self.first_read = False
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._buffer.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._buffer)
+
+    def _reading(self) -> bytes:
+        force = self.rig.force
+        if self._units == 'kg':
+            value = force / N_PER_KG
+        else:
+            value = force / N_PER_LBF
+        fields = []
+        if self._timestamp_enable:
+            fields.append(str(int(self.rig.clock.now * 1000)))
+        fields.append(f'{value:.{self._decimal_places}f} {self._units}')
+        if self._raw_reading_enable:
+            fields.append(str(int(value * 10000) + self._tare_val))
+        if self._local_temp_enable:
+            fields.append(f'{self.rig.ambient:.2f}')
+        if self._remote_temp_enable:
+            fields.append(f'{self.rig.ambient:.2f}')
+        return (','.join(fields) + ',\r\n').encode()
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.rig.clock.advance(len(data) * 10 / self.baudrate)
+        for key in data:
+            # in serial trigger mode every key but the menu key triggers a reading
+            if bytes((key,)) != self.cmds['open_menu']:
+                self.rig.clock.advance(self._num_avgs / self.conversion_rate)
+                self.rig.update()
+                self._buffer += self._reading()
+        return len(data)
+
+    def read(self, size=1) -> bytes:
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self.rig.clock.advance(len(data) * 10 / self.baudrate)
+        return data
+
+    def read_until(self, expected=b'\n', size=None) -> bytes:
+        end = self._buffer.find(expected)
+        end = len(self._buffer) if end < 0 else end + len(expected)
+        if size is not None:
+            end = min(end, size)
+        return self.read(end)
+
+    def readline(self, size=None) -> bytes:
+        return self.read_until(b'\n', size)
+
+
+class Simulation(ChipSwap):
+    """
+    swaps the hal's chips for virtual ones on a simulated rig, and the clocks of the stack for a virtual one.
+    """
+
+    def __init__(self, limit: Union[float, None] = 4 * 3600, seed: int = 0, outdir: Union[str, None] = None,
+                 virtual_time: bool = True, **rig):
+        """
+        :param limit: simulated seconds after which the run is stopped with SimulationLimit
+        :param seed: seed of the sensor noise
+        :param outdir: directory logs are written to, a temporary directory (removed by uninstall) if None
+        :param virtual_time: replace the clocks of the stack, otherwise only the chips are simulated and the stack
+            runs in real time (eg: to measure its own overhead, see benchmarks/)
+        :param rig: RigModel parameters
+        """
+        super().__init__()
+        self.virtual_time = virtual_time
+        self.clock = VirtualClock(limit)
+        self.rig = RigModel(self.clock, **rig)
+        self.gpio = VirtualGPIO(self.rig)
+        self.seed = seed
+        self._own_outdir = outdir is None
+        self.outdir = mkdtemp(prefix='pi_control_sim_') if outdir is None else outdir
+        self.samples: Dict[str, int] = {}
+        self._saved: List[Tuple[object, str, object]] = []
+        self._wall = 0.0
+
+    def _factories_for(self) -> Dict[str, Callable]:
+        config = hal.HAL_CONFIG
+
+        def adc():
+            signals = {('single', config['pos_adc_channel']): self.rig.position_voltage,
+                       ('diff', config['strain_adc_channel']): lambda: self.rig.bridge_ratio() * 5.0}
+            device = VirtualA2D(self.clock, signals, seed=self.seed, **hal.settings('adc'))
+            self.gpio.adc = device
+            return device
+
+        def thermocouple(name: str):
+            def build():
+                settings = hal.settings(name)
+                return Thermocouple(**settings, hardware_spi=VirtualMAX31856(self.rig, settings['name']))
+            return build
+
+        return {
+            'adc': adc,
+            'dac': lambda: VirtualD2A(self.rig, **hal.settings('dac')),
+            **{name: thermocouple(name) for name in hal.SPI_BUSES},
+            'load_cell': lambda: VirtualOpenScale(self.rig, **hal.settings('load_cell')),
+        }
+
+    def _patch(self, target, name: str, value):
+        self._saved.append((target, name, getattr(target, name)))
+        setattr(target, name, value)
+
+    def _patch_modules(self):
+        """points the gpio and clocks of every loaded libs/orchestration module at the simulated ones"""
+        clocks = {}
+        if self.virtual_time:
+            clocks = {id(_time.perf_counter): self.clock.perf_counter, id(_time.monotonic): self.clock.perf_counter,
+                      id(_time.time): self.clock.time, id(_time.sleep): self.clock.sleep}
+        for name, module in list(sys.modules.items()):
+            if module is None or not name.startswith(('libs.', 'orchestration')) or name in _REAL_TIME_MODULES:
+                continue
+            for attr, value in list(vars(module).items()):
+                if id(value) in clocks and callable(value):
+                    self._patch(module, attr, clocks[id(value)])
+                elif value is _GPIO:
+                    self._patch(module, attr, self.gpio)
+
+    def install(self):
+        """
+        replaces the hal's chip factories, and the gpio and clocks of every loaded libs/orchestration module.
+        modules imported afterwards keep the real ones until attach(), so create the executor in between.
+        """
+        if self.installed:
+            return
+        super().install()
+        self._patch_modules()
+        register_listeners(self._count, TOPICS)
+        self._wall = _time.perf_counter()
+
+    def attach(self, logger):
+        """
+        polls the sensors for a DataLogger (created with poll=False) every logger.period of simulated time.
+        also simulates the modules imported since install(), eg: actions loaded when the routines compiled.
+        """
+        self._patch_modules()
+        def poll_round(due: float):
+            # only the simulated devices, ie: the ones built since install()
+            for func in PUBLISH_FUNCS[self._polled:]:
+                func()
+            logger._end_round(due)
+        self.clock.every(logger.period, poll_round)
+
+    def uninstall(self):
+        """restores the hardware and real clocks, forgets the virtual devices"""
+        if not self.installed:
+            return
+        self._wall = _time.perf_counter() - self._wall
+        for topic in TOPICS:
+            pub.unsubscribe(self._count, topic)
+        for target, name, value in reversed(self._saved):
+            setattr(target, name, value)
+        self._saved.clear()
+        super().uninstall()
+        if self._own_outdir:
+            rmtree(self.outdir, ignore_errors=True)
+
+    def _count(self, data, topic=pub.AUTO_TOPIC):
+        topic_meta = '.'.join(filter(None, (topic.getName(), data.get('meta', ''))))
+        acq_ts = data.get('acq_ts')
+        self.samples[topic_meta] = self.samples.get(topic_meta, 0) + (len(acq_ts) if hasattr(acq_ts, '__len__') else 1)
+
+    def data_volume(self) -> Tuple[int, int]:
+        """(bytes, files) logged so far"""
+        size = files = 0
+        for root, _, names in os.walk(self.outdir):
+            for name in names:
+                size += os.path.getsize(os.path.join(root, name))
+                files += 1
+        return size, files
+
+    def summary(self) -> Dict:
+        wall = _time.perf_counter() - self._wall if self.installed else self._wall
+        size, files = self.data_volume()
+        return {
+            'duration': self.clock.now,
+            'wall': wall,
+            'cycles': self.rig.cycles,
+            'travel': self.rig.travel,
+            'stalled': self.rig.stalled,
+            'peak_force': self.rig.peak_force,
+            'peak_strain': self.rig.peak_strain,
+            'bytes': size,
+            'files': files,
+            'samples': dict(self.samples),
+        }
+
+    def report(self) -> str:
+        summary = self.summary()
+        lines = [
+            f'simulated duration: {summary["duration"]:.1f} s '
+            f'({summary["duration"] / max(summary["wall"], 1e-9):.0f}x real time)',
+            f'cycles: {summary["cycles"]} ({summary["travel"]:.2f} in of travel, '
+            f'peak force {summary["peak_force"]:.1f} N, peak strain {summary["peak_strain"]:.2f} %)',
+            f'data: {summary["bytes"] / 1e6:.3f} MB in {summary["files"]} files, '
+            f'{sum(summary["samples"].values())} samples',
+        ]
+        lines.extend(f'    {topic}: {count}' for topic, count in sorted(summary['samples'].items()))
+        if summary['stalled']:
+            lines.append(f'actuator stalled at its {self.rig.rating} lbf rating for {summary["stalled"]:.1f} s')
+        if self.clock.stopped:
+            lines.append(f'stopped at the simulation limit of {self.clock.limit} s')
+        return '\n'.join(lines)
@@ -0,0 +1,344 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+soft_spi.py
+Author: Danyal Ahsanullah
+Date: 8/14/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: software SPI backends that are faster than per bit GPIO toggling.
+             All backends share the Adafruit_GPIO.SPI transfer interface used by MAX31856:
+                set_clock_hz, set_mode, set_bit_order, transfer
+
+    PigpioSPI   -- bit-banging is done natively by the pigpio daemon (bb_spi_*), one call per transfer.
+    WaveformSPI -- per byte waveforms are precomputed and clocked out through a bulk line request,
+                   so clock and data lines change together in one call per edge.
+                   Works with a libgpiod character device chip or FakeGPIOChip.
+    FakeGPIOChip/FakeSPIDevice -- gpio chip and SPI slave emulation for testing and benchmarking off the pi.
+"""
+
+from typing import Callable, Dict, Iterable, List, Union
+
+try:
+    import pigpio
+except ImportError:
+    pigpio = None
+
+try:
+    import gpiod
+    LINE_REQ_DIR_OUT = gpiod.LINE_REQ_DIR_OUT
+    LINE_REQ_DIR_IN = gpiod.LINE_REQ_DIR_IN
+except ImportError:
+    gpiod = None
+    LINE_REQ_DIR_OUT = 3
+    LINE_REQ_DIR_IN = 2
+
+MSBFIRST = 0
+LSBFIRST = 1
+CONSUMER = 'pi_control'
+
+# bit reversal table for LSB first transfers
+_REVERSED = bytes(int('{:08b}'.format(value)[::-1], 2) for value in range(256))
+
+
+class FakeGPIOChip:
+    """
+    minimal stand in for a libgpiod chip (get_line, get_lines, request, set_values, get_value(s))
+    useful for benchmarking and testing software SPI without a pi.
+
+    `on_change` is called with the chip after every output change and may update input levels via `levels`,
+    which allows a simulated device to be wired up to the lines.
+    """
+
+    def __init__(self, num_lines: int = 54, on_change: Union[Callable, None] = None):
+        self.levels: List[int] = [0] * num_lines
+        self.on_change = on_change
+        self.writes = 0
+
+    def get_line(self, offset: int) -> '_FakeLines':
+        return _FakeLines(self, (offset,), single=True)
+
+    def get_lines(self, offsets: Iterable[int]) -> '_FakeLines':
+        return _FakeLines(self, tuple(offsets))
+
+
+class _FakeLines:
+    def __init__(self, chip: FakeGPIOChip, offsets, single=False):
+        self.chip = chip
+        self.offsets = offsets
+        self.single = single
+
+    # noinspection PyUnusedLocal
+    def request(self, consumer=CONSUMER, type=LINE_REQ_DIR_IN, default_vals=None, default_val=None):
+        if default_val is not None:
+            default_vals = (default_val,)
+        if default_vals is not None:
+            self.set_values(default_vals)
+
+    def release(self):
+        pass
+
+    def set_values(self, values):
+        levels = self.chip.levels
+        for offset, value in zip(self.offsets, values):
+            levels[offset] = value
+        self.chip.writes += 1
+        if self.chip.on_change is not None:
+            self.chip.on_change(self.chip)
+
+    def set_value(self, value):
+        self.set_values((value,))
+
+    def get_values(self):
+        return [self.chip.levels[offset] for offset in self.offsets]
+
+    def get_value(self):
+        return self.chip.levels[self.offsets[0]]
+
+
+class FakeSPIDevice:
+    """
+    SPI slave with an auto incrementing register file (MAX31856 style addressing: bit 7 set for writes),
+    to be passed as FakeGPIOChip's `on_change`. Bits are shifted MSB first on the wire.
+    """
+
+    def __init__(self, sclk: int, mosi: int, miso: int, ss: int, mode: int = 1, registers: bytes = bytes(16)):
+        self.pins = (sclk, mosi, miso, ss)
+        self.cpol = (mode >> 1) & 1
+        self.cpha = mode & 1
+        self.registers = bytearray(registers)
+        self.received: List[bytearray] = []
+        self._selected = False
+        self._last_clk = self.cpol
+        self._rx = self._rx_bits = self._tx_bits = 0
+        self._frame = bytearray()
+
+    def _tx_byte(self, index: int) -> int:
+        if index == 0 or self._frame[0] & 0x80:
+            return 0
+        return self.registers[(self._frame[0] + index - 1) % len(self.registers)]
+
+    def _shift_out(self, chip):
+        index, bit = divmod(self._tx_bits, 8)
+        chip.levels[self.pins[2]] = (self._tx_byte(index) >> (7 - bit)) & 1
+        self._tx_bits += 1
+
+    def _sample(self, chip):
+        self._rx = (self._rx << 1) | chip.levels[self.pins[1]]
+        self._rx_bits += 1
+        if self._rx_bits == 8:
+            if self._frame and self._frame[0] & 0x80:
+                self.registers[((self._frame[0] & 0x7F) + len(self._frame) - 1) % len(self.registers)] = self._rx
+            self._frame.append(self._rx)
+            self._rx = self._rx_bits = 0
+
+    def __call__(self, chip: FakeGPIOChip):
+        sclk, _, _, ss = self.pins
+        clk = chip.levels[sclk]
+        if chip.levels[ss]:
+            if self._selected:
+                self.received.append(self._frame)
+            self._selected = False
+            self._last_clk = clk
+            return
+        if not self._selected:
+            self._selected = True
+            self._frame = bytearray()
+            self._rx = self._rx_bits = self._tx_bits = 0
+            if not self.cpha:
+                self._shift_out(chip)
+        if clk != self._last_clk:
+            self._last_clk = clk
+            leading = clk != self.cpol
+            if leading == (not self.cpha):
+                self._sample(chip)
+            else:
+                self._shift_out(chip)
+
+
+class WaveformSPI:
+    """
+    software SPI over a bulk GPIO line request with precomputed per byte waveforms.
+
+    for every byte value the sequence of (clock, mosi, cs) states is built once per mode/bit order, so a
+    transfer is just replaying states and sampling miso. clock and mosi are updated together in a single call.
+    """
+
+    def __init__(self, sclk: int, mosi: int, miso: int, ss: int, chip: Union[str, object] = 'gpiochip0'):
+        """
+        :param sclk: line offset for the clock
+        :param mosi: line offset for master out, slave in
+        :param miso: line offset for master in, slave out
+        :param ss: line offset for the (active low) slave select
+        :param chip: gpiod chip name/path or a chip like object (eg: FakeGPIOChip)
+        """
+        if isinstance(chip, str):
+            if gpiod is None:
+                raise RuntimeError('libgpiod python bindings are required to open {}'.format(chip))
+            chip = gpiod.Chip(chip)
+        self.chip = chip
+        self._out = chip.get_lines((sclk, mosi, ss))
+        self._out.request(consumer=CONSUMER, type=LINE_REQ_DIR_OUT, default_vals=(0, 0, 1))
+        self._in = chip.get_line(miso)
+        self._in.request(consumer=CONSUMER, type=LINE_REQ_DIR_IN)
+        self.clock_hz = None
+        self._mode = 0
+        self._order = MSBFIRST
+        self._waveforms: List[tuple] = []
+        self._sample_leading = True
+        self._select = self._deselect = None
+        self._build()
+
+    def _build(self):
+        idle = 1 if self._mode & 0x02 else 0
+        active = 1 - idle
+        # modes 0 and 2 sample on the leading edge, data must be valid before it
+        # modes 1 and 3 shift on the leading edge and sample on the trailing edge
+        self._sample_leading = not (self._mode & 0x01)
+        self._select = (idle, 0, 0)
+        self._deselect = (idle, 0, 1)
+        waveforms = []
+        for value in range(256):
+            if self._order == LSBFIRST:
+                value = _REVERSED[value]
+            bits = [(value >> shift) & 1 for shift in range(7, -1, -1)]
+            if self._sample_leading:
+                # set data with clock idle, leading edge samples
+                waveforms.append(tuple(((idle, bit, 0), (active, bit, 0)) for bit in bits))
+            else:
+                # leading edge shifts data, trailing edge samples
+                waveforms.append(tuple(((active, bit, 0), (idle, bit, 0)) for bit in bits))
+        self._waveforms = waveforms
+        self._out.set_values(self._deselect)
+
+    def set_clock_hz(self, hz):
+        """clock rate is bounded by the line api, the value is only recorded"""
+        self.clock_hz = hz
+
+    def set_mode(self, mode):
+        if mode < 0 or mode > 3:
+            raise ValueError('Mode must be a value 0, 1, 2, or 3.')
+        self._mode = mode
+        self._build()
+
+    def set_bit_order(self, order):
+        if order not in (MSBFIRST, LSBFIRST):
+            raise ValueError('Order must be MSBFIRST or LSBFIRST.')
+        self._order = order
+        self._build()
+
+    def close(self):
+        self._out.release()
+        self._in.release()
+
+    def transfer(self, data) -> bytearray:
+        """full duplex transfer of `data`, returns the bytes clocked in on miso"""
+        set_values = self._out.set_values
+        get_value = self._in.get_value
+        waveforms = self._waveforms
+        result = bytearray(len(data))
+        set_values(self._select)
+        if self._sample_leading:
+            for index, byte in enumerate(data):
+                value = 0
+                for first, second in waveforms[byte]:
+                    set_values(first)
+                    set_values(second)
+                    value = (value << 1) | get_value()
+                result[index] = value
+            # final trailing edge back to idle
+            set_values(self._select)
+        else:
+            for index, byte in enumerate(data):
+                value = 0
+                for first, second in waveforms[byte]:
+                    set_values(first)
+                    value = (value << 1) | get_value()
+                    set_values(second)
+                result[index] = value
+        set_values(self._deselect)
+        if self._order == LSBFIRST:
+            result = bytearray(_REVERSED[value] for value in result)
+        return result
+
+
+class PigpioSPI:
+    """
+    software SPI bit-banged natively by the pigpio daemon on arbitrary pins.
+    requires pigpiod to be running.
+    """
+    max_baud = 250000  # bb_spi limit
+    min_baud = 50
+
+    def __init__(self, sclk: int, mosi: int, miso: int, ss: int, pi=None):
+        if pi is None:
+            if pigpio is None:
+                raise RuntimeError('pigpio is required for native software SPI')
+            pi = pigpio.pi()
+        if not pi.connected:
+            raise RuntimeError('unable to connect to the pigpio daemon')
+        self.pi = pi
+        self.pins: Dict[str, int] = {'sclk': sclk, 'mosi': mosi, 'miso': miso, 'ss': ss}
+        self._baud = self.max_baud
+        self._mode = 0
+        self._order = MSBFIRST
+        self._open = False
+        self._reopen()
+
+    def _reopen(self):
+        if self._open:
+            self.pi.bb_spi_close(self.pins['ss'])
+        # bits 0-1 mode, bit 14 transmit LSB first, bit 15 receive LSB first
+        flags = self._mode | ((3 << 14) if self._order == LSBFIRST else 0)
+        self.pi.bb_spi_open(self.pins['ss'], self.pins['miso'], self.pins['mosi'], self.pins['sclk'],
+                            self._baud, flags)
+        self._open = True
+
+    def set_clock_hz(self, hz):
+        self._baud = int(min(max(hz, self.min_baud), self.max_baud))
+        self._reopen()
+
+    def set_mode(self, mode):
+        if mode < 0 or mode > 3:
+            raise ValueError('Mode must be a value 0, 1, 2, or 3.')
+        self._mode = mode
+        self._reopen()
+
+    def set_bit_order(self, order):
+        if order not in (MSBFIRST, LSBFIRST):
+            raise ValueError('Order must be MSBFIRST or LSBFIRST.')
+        self._order = order
+        self._reopen()
+
+    def close(self):
+        if self._open:
+            self.pi.bb_spi_close(self.pins['ss'])
+            self._open = False
+
+    def transfer(self, data) -> Union[bytearray, None]:
+        count, result = self.pi.bb_spi_xfer(self.pins['ss'], bytes(data))
+        if count < 0:
+            return None
+        return bytearray(result)
+
+
+def software_spi(sclk: int, mosi: int, miso: int, ss: int, backend: str = 'auto', chip='gpiochip0'):
+    """
+    builds the fastest available software SPI backend.
+    :param backend: one of 'auto', 'pigpio', 'waveform'. auto prefers pigpio, then a gpiod waveform.
+    :param chip: chip used by the waveform backend
+    :return: SPI object, or None if no backend is available (caller should fall back to Adafruit's BitBang)
+    """
+    if backend in ('auto', 'pigpio') and pigpio is not None:
+        try:
+            return PigpioSPI(sclk, mosi, miso, ss)
+        except RuntimeError:
+            if backend == 'pigpio':
+                raise
+    if backend == 'waveform' or (backend == 'auto' and gpiod is not None):
+        return WaveformSPI(sclk, mosi, miso, ss, chip=chip)
+    if backend != 'auto':
+        raise ValueError('software SPI backend {!r} is not available'.format(backend))
+    return None
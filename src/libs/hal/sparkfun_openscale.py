@@ -15,14 +15,206 @@ Description: library for interfacing the Sparkfun OpenScale.
 """
 
 import os
+import re
 import yaml
 import serial
+from time import perf_counter
 from os.path import join as ospjoin
-from typing import Tuple, Dict, Union
-from libs.hal.constants import LOCK
+from typing import Tuple, Dict, Union, Callable
+from libs.hal.constants import hold
+from libs.instrumentation import timed
 
 CFG_FILE_PATH = ospjoin(os.environ.get('OPENSCALE_CFG_PATH', '../../CONFIGS/'), 'openscale_cfg.yml')
 
+# regex test:
+# http://www.pyregex.com/?id=eyJyZWdleCI6IlJlYWRpbmc6IFxcWyg%2FUDxtYXNzPi0%2FXFxkK1xcLlxcZCspXFxzKD9QPHVuaXRzPlxcdyspXFxdXFxzK0NhbGlicmF0aW9uIEZhY3RvcjpcXHMoP1A8ZmFjdG9yPi0%2FXFxkKykiLCJmbGFncyI6MTAsIm1hdGNoX3R5cGUiOiJmaW5kYWxsIiwidGVzdF9zdHJpbmciOiJSZWFkaW5nOiBbMS4yMzQ1IGxic10gICBDYWxpYnJhdGlvbiBGYWN0b3I6IDEyMzQ1Njc4XG5SZWFkaW5nOiBbLTIuMzQ1NSBrZ10gICBDYWxpYnJhdGlvbiBGYWN0b3I6IC0xMjM0NSJ9
+CAL_PATTERN = re.compile(r'Reading: \[(?P<mass>-?\d+\.\d+)\s(?P<units>\w+)\]\s+Calibration Factor:\s(?P<factor>-?\d+)')
+
+
+class CalibrationEngine:
+    """
+    Drives the OpenScale calibration menu towards a known mass.
+
+    Rather than sending one keystroke and waiting on a full ``readline`` per press, the engine:
+        1. reads the current (factor, mass) pair
+        2. sends a probe burst of keystrokes and reads the new pair to estimate the factor to mass slope
+        3. jumps most of the way to the target in one burst
+        4. steps past the target along the secant until a pair of factors brackets it
+        5. refines with false position over the bracketing pair
+
+    Keystrokes are written in chunks no larger than ``max_burst`` to stay inside the device's receive buffer,
+    and the reading stream is scanned in bulk with ``CAL_PATTERN`` instead of line by line.
+    """
+    factor_per_key = 1  # firmware changes the factor by one per '+'/'-' press
+    overshoot = 1.25  # bracketing steps go this far past the secant's estimate, so the next reading brackets
+
+    def __init__(self, interface: serial.Serial, tolerance: float = 0.001, probe_keys: int = 50,
+                 jump_fraction: float = 0.9, max_burst: int = 32, max_steps: int = 64, settle_readings: int = 96,
+                 timeout: float = 10.0):
+        """
+        :param interface: open serial handle already sitting in the calibration menu
+        :param tolerance: acceptable absolute error between measured and target mass
+        :param probe_keys: number of keystrokes used to estimate the slope
+        :param jump_fraction: fraction of the estimated distance covered by the first jump
+        :param max_burst: maximum keystrokes written before waiting for the device to catch up
+        :param max_steps: maximum number of refinement steps before giving up
+        :param settle_readings: readings to wait for a burst to show up in the factor before taking the device's
+                                last reported factor as is (a dropped or coalesced keystroke), more than max_burst
+                                as the device can report once per keystroke
+        :param timeout: seconds to wait for a burst to show up before doing the same
+        """
+        self.interface = interface
+        self.tolerance = tolerance
+        self.probe_keys = probe_keys
+        self.jump_fraction = jump_fraction
+        self.max_burst = max_burst
+        self.max_steps = max_steps
+        self.settle_readings = settle_readings
+        self.timeout = timeout
+        # bursts whose keystrokes did not all register
+        self.missed = 0
+        self.factor = None
+        self.mass = None
+        self.units = None
+        self._buffer = b''
+
+    def _scan(self, accept: Callable[[int], bool], max_readings: Union[int, None] = None) -> bool:
+        """
+        reads the stream in bulk until a reading whose calibration factor satisfies `accept` is seen,
+        or until max_readings readings (or timeout seconds) went by without one.
+        Only complete lines are parsed; the most recent accepted reading wins. Without an accepted reading,
+        the last reading seen is kept, so the factor stays in step with the device.
+        :return: True if an accepted reading was seen
+        """
+        deadline = perf_counter() + self.timeout
+        readings = 0
+        last = None
+        while True:
+            chunk = self.interface.read(max(1, self.interface.in_waiting))
+            if not chunk:
+                raise RuntimeError('OpenScale stopped reporting calibration readings')
+            self._buffer += chunk
+            found = None
+            end = self._buffer.rfind(b'\r\n')
+            if end >= 0:
+                text = self._buffer[:end].decode('utf-8', 'ignore')
+                self._buffer = self._buffer[end + 2:]
+                for match in CAL_PATTERN.finditer(text):
+                    readings += 1
+                    last = match
+                    if accept(int(match.group('factor'))):
+                        found = match
+            if found is not None:
+                self._take(found)
+                return True
+            timed_out = perf_counter() > deadline
+            if last is not None and (timed_out or max_readings is not None and readings >= max_readings):
+                self._take(last)
+                return False
+            if timed_out:
+                raise RuntimeError('OpenScale stopped reporting calibration readings')
+
+    def _take(self, match):
+        """syncs the engine to a reading matched by CAL_PATTERN"""
+        self.factor, self.mass, self.units = int(match['factor']), float(match['mass']), match['units']
+
+    def read(self) -> Tuple[int, float]:
+        """returns the next (factor, mass) pair reported by the device"""
+        self._scan(lambda factor: True)
+        return self.factor, self.mass
+
+    def press(self, keys: int) -> Tuple[int, float]:
+        """
+        sends `keys` increments (positive) or decrements (negative) and returns the settled (factor, mass) pair.
+        keystrokes the device drops or coalesces are not resent, the pair returned is what the device reports.
+        """
+        key = b'+' if keys > 0 else b'-'
+        remaining = abs(keys)
+        while remaining:
+            burst = min(remaining, self.max_burst)
+            target = self.factor + (burst if keys > 0 else -burst) * self.factor_per_key
+            self.interface.write(key * burst)
+            self.interface.flush()
+            if not self._scan(lambda factor: factor == target, self.settle_readings):
+                self.missed += 1
+            remaining -= burst
+        return self.factor, self.mass
+
+    def move_to(self, factor: int) -> Tuple[int, float]:
+        """moves the calibration factor as close to `factor` as the keystroke resolution allows"""
+        return self.press(round((factor - self.factor) / self.factor_per_key))
+
+    def run(self, target: float) -> int:
+        """
+        calibrates until the measured mass is within tolerance of `target`
+        :param target: known mass currently placed on the scale, in the scale's units
+        :return: final calibration factor
+        """
+        if not target:
+            raise ValueError('calibrate against a non zero mass')
+        f0, m0 = self.read()
+        if abs(target - m0) <= self.tolerance:
+            return f0
+        f1, m1 = self.press(self.probe_keys)
+        if abs(target - m1) <= self.tolerance:
+            return f1
+        if m1 == m0 or not m0 or not m1:
+            raise RuntimeError('calibration factor has no effect on the reading, is a load applied?')
+        # the device divides the raw reading by the factor, so the reciprocal of the reading is (close to) linear
+        # in the factor: secants are taken over it, and residuals measured on it
+        goal = 1 / target
+        # jump most of the way along the secant
+        f2, m2 = self.move_to(f1 + self.jump_fraction * (goal - 1 / m1) * (f1 - f0) / (1 / m1 - 1 / m0))
+        # bracket the target, stepping past it along the secant of the last two readings
+        lo, r_lo = f1, 1 / m1 - goal
+        hi, m_hi = f2, m2
+        r_hi = 1 / m2 - goal
+        m_lo = m1
+        stride = f2 - f1 or self.factor_per_key
+        steps = 0
+        while r_lo * r_hi > 0 and abs(target - m_hi) > self.tolerance:
+            steps += 1
+            if steps > self.max_steps:
+                raise RuntimeError('unable to bracket target mass of {}'.format(target))
+            if hi != lo and r_hi != r_lo:
+                stride = -self.overshoot * r_hi * (hi - lo) / (r_hi - r_lo)
+            else:
+                stride *= 2
+            if abs(stride) < self.factor_per_key:
+                stride = self.factor_per_key if stride > 0 else -self.factor_per_key
+            lo, m_lo, r_lo = hi, m_hi, r_hi
+            hi, m_hi = self.move_to(hi + stride)
+            r_hi = 1 / m_hi - goal
+        # narrow the bracket by false position, halving the weight of an end kept twice in a row (illinois)
+        factor, mass = hi, m_hi
+        kept = None
+        while abs(target - mass) > self.tolerance and abs(hi - lo) > self.factor_per_key:
+            steps += 1
+            if steps > self.max_steps:
+                break
+            guess = hi - r_hi * (hi - lo) / (r_hi - r_lo)
+            # strictly inside the bracket, so every step narrows it
+            low, high = min(lo, hi) + self.factor_per_key, max(lo, hi) - self.factor_per_key
+            factor, mass = self.move_to(min(max(guess, low), high))
+            if factor in (lo, hi):
+                break
+            residual = 1 / mass - goal
+            if residual * r_lo > 0:
+                lo, m_lo, r_lo = factor, mass, residual
+                if kept == 'hi':
+                    r_hi /= 2
+                kept = 'hi'
+            else:
+                hi, m_hi, r_hi = factor, mass, residual
+                if kept == 'lo':
+                    r_lo /= 2
+                kept = 'lo'
+        # settle on the closest reading seen at the ends of the bracket
+        best = min(((factor, mass), (lo, m_lo), (hi, m_hi)), key=lambda pair: abs(target - pair[1]))
+        if best[0] != self.factor:
+            self.move_to(best[0])
+        return self.factor
+
 
 class OpenScale(serial.Serial):
     BAUDRATES = (1200, 1800, 2400, 4800, 9600, 19200, 38400, 57600,
@@ -299,18 +491,11 @@ class OpenScale(serial.Serial):
         diff = self._cal_value - value
         if diff == 0:
             return
-        elif diff > 0:  # decrement `diff` times
-            self.write(self.cmds['calibrate'])
-            for i in range(1, diff):
-                self.write(self.cmds['decrement'])
-                self.flush()
-            self.reset_input_buffer()
-        elif diff < 0:  # increment `diff` times
-            self.write(self.cmds['calibrate'])
-            for i in range(1, -diff):
-                self.write(self.cmds['increment'])
-                self.flush()
-            self.reset_input_buffer()
+        self.write(self.cmds['calibrate'])
+        # send every keystroke in a single burst rather than one write and flush per press
+        self.write((self.cmds['decrement'] if diff > 0 else self.cmds['increment']) * abs(diff))
+        self.flush()
+        self.reset_input_buffer()
         self.write(self.cmds['close_menu'])
         self._cal_value = value
 
@@ -536,22 +721,40 @@ class OpenScale(serial.Serial):
         # -> b'x' => <save_and_exit>
         self.write(self.cmds['calibrate'])
         self.read(240)  # initial spiel is 240 bytes
-        response = self.read_until(b'\r\n').decode('utf-8').split()
-        # index: contents
-        # 0: b'Reading:'
-        # 1: [ + string float reading in lbs|kg
-        # 2: string for units + ]
-        # 3: 'Calibration'
-        # 4: 'Factor:'
-        # 5: string reading of integer offset used internally
+        response = CAL_PATTERN.search(self.read_until(b'\r\n').decode('utf-8'))
+        if response is None:
+            raise RuntimeError('Unexpected response from calibration menu')
         res = {
-            'reading': float(response[1][1:]),
-            'units': str(response[2][:-1]),
-            'cal_factor': int(response[5]),
+            'reading': float(response.group('mass')),
+            'units': response.group('units'),
+            'cal_factor': int(response.group('factor')),
         }
         self.write(self.cmds['close_menu'])
         return res
 
+    def calibrate_to(self, target: float, tolerance: float = 0.001, **kwargs) -> int:
+        """
+        calibrates the scale so the known mass currently on it reads as `target`.
+        see CalibrationEngine for the search strategy and the accepted keyword arguments.
+        :param target: known mass on the scale, in the scale's configured units
+        :param tolerance: acceptable absolute error of the final reading
+        :return: final calibration factor
+        """
+        if not self.is_open:
+            self.open()
+            # keep separate to help timings
+        self.reset_output_buffer()
+        self.write(self.cmds['open_menu'])
+        self.flush()
+        self.reset_input_buffer()
+
+        self.write(self.cmds['calibrate'])
+        with hold():
+            self._cal_value = CalibrationEngine(self, tolerance=tolerance, **kwargs).run(target)
+        self.write(self.cmds['close_menu'])
+        return self._cal_value
+
+    @timed('hal.openscale.get_reading')
     def get_reading(self, to_force=True):
         # order is (if enabled) : comma separation, no whitespace:
         # timestamp -- toggleable -- int
@@ -583,7 +786,7 @@ class OpenScale(serial.Serial):
 
         key = (self._timestamp_enable << 4) | 0b01000 | (self._raw_reading_enable << 2) | \
               (self._local_temp_enable << 1) | self._remote_temp_enable
-        with LOCK:
+        with hold():
             if self.first_read:
                 self.triggered_read()
                 res = self.read_until(b'\r\n')
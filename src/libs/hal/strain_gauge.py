@@ -11,41 +11,286 @@ License: N/A
 Description: 
 """
 import numpy as np
+from time import perf_counter
+from threading import Event
+from typing import Tuple, Union
 
+from libs.utils import GPIO
+from libs.hal.constants import hold
 from libs.data_router import add_to_poll, publish
+from libs.instrumentation import timed
 from libs.hal.adc import ADS1115Interface as A2D
 
 if __name__ == '__main__':
     pass
 
 
+class CalibrationTable:
+    """
+    sorted table of (raw level, correction) calibration points.
+
+    points are kept in ascending raw level order in preallocated arrays that grow by doubling.
+    corrections are looked up from a dense table holding the piecewise linear interpolated correction
+    for every possible ADC level, rebuilt lazily after points change, so correcting a sample is a single index.
+    """
+
+    def __init__(self, min_level: int = A2D.min_level, max_level: int = A2D.max_level, capacity: int = 8):
+        """
+        :param min_level: lowest raw level the ADC can report
+        :param max_level: highest raw level the ADC can report
+        :param capacity: initial number of calibration points to allocate for
+        """
+        self.min_level = min_level
+        self.max_level = max_level
+        self._raw = np.empty(capacity, dtype=np.float64)
+        self._correction = np.empty(capacity, dtype=np.float64)
+        self._len = 0
+        self._lut: Union[np.ndarray, None] = None
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def points(self) -> np.ndarray:
+        """calibration points as an (N, 2) array of [raw level, correction] rows sorted by raw level"""
+        return np.column_stack((self._raw[:self._len], self._correction[:self._len]))
+
+    def add(self, raw: float, correction: float):
+        """
+        adds a calibration point, replacing any existing point at the same raw level.
+        :param raw: raw level the point was measured at
+        :param correction: value to add to readings at that level
+        """
+        index = int(np.searchsorted(self._raw[:self._len], raw))
+        if index < self._len and self._raw[index] == raw:
+            self._correction[index] = correction
+        else:
+            if self._len == len(self._raw):
+                self._raw = np.resize(self._raw, 2 * len(self._raw))
+                self._correction = np.resize(self._correction, 2 * len(self._correction))
+            # shift the tail up by one in place
+            self._raw[index + 1:self._len + 1] = self._raw[index:self._len]
+            self._correction[index + 1:self._len + 1] = self._correction[index:self._len]
+            self._raw[index] = raw
+            self._correction[index] = correction
+            self._len += 1
+        self._lut = None
+
+    def clear(self):
+        self._len = 0
+        self._lut = None
+
+    @property
+    def lut(self) -> np.ndarray:
+        """dense correction table, indexed by raw level - min_level"""
+        if self._lut is None:
+            levels = np.arange(self.min_level, self.max_level + 1, dtype=np.float64)
+            if self._len:
+                self._lut = np.interp(levels, self._raw[:self._len], self._correction[:self._len])
+            else:
+                self._lut = np.zeros_like(levels)
+        return self._lut
+
+    def correction(self, raw: int) -> float:
+        """correction for a single integer raw level"""
+        return float(self.lut[raw - self.min_level])
+
+    def apply(self, raw: int) -> float:
+        """corrected value for a single integer raw level"""
+        return raw + float(self.lut[raw - self.min_level])
+
+    def apply_batch(self, raw) -> np.ndarray:
+        """
+        corrected values for a whole array of raw levels.
+        integer levels are looked up in the dense table, anything else is interpolated directly.
+        """
+        raw = np.asarray(raw)
+        if np.issubdtype(raw.dtype, np.integer):
+            # widen before offsetting so narrow buffers (eg: int16) do not wrap
+            return raw + self.lut[raw.astype(np.intp) - self.min_level]
+        if not self._len:
+            return raw.astype(np.float64)
+        return raw + np.interp(raw, self._raw[:self._len], self._correction[:self._len])
+
+
 class StrainGauge:
-    def __init__(self, interface: A2D, vcc: float = 5.0, gf: float = 2.0, r_nom: float = 350.0):
+    # 4 / (number of active gauges) per bridge arrangement, in NI's naming: quarter bridge type I (one active gauge),
+    # half bridge type II (two active gauges in bending, one in tension and one in compression) and full bridge
+    # type I (four active gauges). a half bridge type I (poisson gauge) has a different, nonlinear formula and is
+    # not supported
+    BRIDGE_MAP = {'quarter': 4, 'half': 2, 'full': 1}
+    # consecutive conversion ready timeouts after which a capture gives up
+    max_missed_edges = 3
+
+    def __init__(self, interface: A2D, vcc: float = 5.0, gf: float = 2.0, r_nom: float = 350.0,
+                 channel: int = 3, gain: int = 4, data_rate: int = 860, bridge: str = 'quarter',
+                 r_lead: float = 0.0):
+        """
+        :param interface: ADC the bridge is connected to
+        :param vcc: bridge excitation voltage
+        :param gf: gauge factor
+        :param r_nom: nominal gauge resistance
+        :param channel: differential channel selection passed to read_adc_difference
+        :param gain: ADC PGA gain for strain readings
+        :param data_rate: ADC data rate for strain readings
+        :param bridge: bridge arrangement, one of BRIDGE_MAP
+        :param r_lead: lead resistance to the gauges, desensitizes quarter and half bridges by r_lead / r_nom
+        """
+        if bridge not in self.BRIDGE_MAP:
+            raise ValueError(f'bridge must be one of {tuple(self.BRIDGE_MAP)}')
         self.interface = interface
         self.vcc = vcc
         self.gf = gf
         self.r_nom = r_nom
-        self.cal_map = np.array([[], []])
+        self.r_lead = r_lead
+        self.channel = channel
+        self.gain = gain
+        self.data_rate = data_rate
+        self.bridge = bridge
+        # bridge ratio (Vout / Vex) of the unstrained bridge, see zero()
+        self.vr_zero = 0.0
+        self.cal_table = CalibrationTable()
+        # conversions captures lost: read over by a later one, or their ready edge timed out, see capture()
+        self.missed_edges = 0
+        self._update_constants()
         add_to_poll(self.read_strain)
 
+    def _update_constants(self):
+        """
+        precomputes the level -> strain conversion, call after changing any of the bridge parameters.
+            Vr = level * vr_per_level - vr_zero
+            quarter: strain = k * Vr / (1 + 2 * Vr)
+            half/full: strain = k * Vr
+        with k = -BRIDGE_MAP[bridge] / gf in percent strain, times (1 + r_lead / r_nom) for quarter and half
+        bridges. a full bridge has no lead term, as in NI's full bridge type I formula
+        """
+        # strain readings use their own gain, so the interface's configured step size does not apply
+        self.vr_per_level = 2 * self.interface.pga_map[self.gain] / self.interface.levels / self.vcc
+        self.k = -100 * self.BRIDGE_MAP[self.bridge] / self.gf
+        if self.bridge != 'full':
+            self.k *= 1 + self.r_lead / self.r_nom
+        self._nonlinear = self.bridge == 'quarter'
+
+    def zero(self):
+        """takes the current bridge output as zero strain"""
+        self.vr_zero = 0.0
+        self.vr_zero = self.read_raw() * self.vr_per_level
+
+    def strain_from_level(self, level: float) -> float:
+        """converts one raw differential level to strain (%)"""
+        vr = level * self.vr_per_level - self.vr_zero
+        if self._nonlinear:
+            return self.k * vr / (1 + 2 * vr)
+        return self.k * vr
+
+    def strain_from_levels(self, levels) -> np.ndarray:
+        """converts a buffer of raw differential levels to strain (%)"""
+        vr = np.asarray(levels, dtype=np.float64) * self.vr_per_level
+        vr -= self.vr_zero
+        if self._nonlinear:
+            return self.k * vr / (1 + 2 * vr)
+        return self.k * vr
+
+    def level_from_strain(self, strain: float) -> float:
+        """inverse of strain_from_level"""
+        vr = strain / (self.k - 2 * strain) if self._nonlinear else strain / self.k
+        return (vr + self.vr_zero) / self.vr_per_level
+
+    @property
+    def cal_map(self) -> np.ndarray:
+        """calibration points as an (N, 2) array of [raw level, correction] rows"""
+        return self.cal_table.points
+
+    @timed('hal.strain_gauge.read_raw')
+    def read_raw(self) -> int:
+        """raw differential ADC level across the bridge"""
+        return self.interface.read_adc_difference(self.channel, gain=self.gain, data_rate=self.data_rate)
+
     @publish('strain', ('strain',))
-    def read_strain(self):
-        raw = self.interface.read_adc_difference(3, gain=4, data_rate=860)
-        strain = raw
-        # voltage = self.interface.level2voltage(raw) # + (self.vcc / 2)
-        # strain = .8 / (2*((1+voltage) - (.4*voltage-1))) * (1+ (1/350))
-        #strain = (1 / voltage - 1) / self.gf
-        return strain
+    def read_strain(self) -> float:
+        return self.strain_from_level(self.read_raw())
 
     @publish('strain', ('strain',))
-    def read_adjusted_strain(self):
+    def read_adjusted_strain(self) -> float:
         """
-        tries applying a linear piecewise interpolated to the read strain value as a correction factor.
+        applies the piecewise linear interpolated calibration correction to the raw level before conversion.
         :return:
         """
-        strain = self.read_strain()
-        correction = np.interp(strain, self.cal_map[:, 0], self.cal_map[:, 1])
-        return strain + correction
+        return self.strain_from_level(self.cal_table.apply(self.read_raw()))
+
+    def adjust(self, raw) -> np.ndarray:
+        """
+        converts a whole buffer of raw readings to calibrated strain.
+        :param raw: array like of raw differential ADC levels
+        :return: corrected strain values (%)
+        """
+        return self.strain_from_levels(self.cal_table.apply_batch(raw))
+
+    @publish('strain_burst', ('strain', 'raw', 'acq_ts'))
+    def capture(self, duration: float, data_rate: int = 860) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        captures strain at the full device rate for `duration` seconds.
+
+        the ADC is put into continuous differential conversions with ALERT/RDY as a conversion ready signal.
+        edge detection is armed once for the whole window, so every ready edge is counted and timestamped even
+        while the previous sample is still being read; each sample is read after its edge into preallocated
+        buffers. polling is held off for the window since the ADC is shared. the block is published to
+        'strain_burst' once complete.
+        conversions that came ready but were read over by a later one are counted in missed_edges. so is a ready
+        edge that does not arrive in time, which is waited for again: the capture fails with RuntimeError after
+        max_missed_edges of those in a row.
+        :param duration: capture window (s)
+        :param data_rate: ADC data rate, one of the ADC's accepted sample rates
+        :return: calibrated strain (%), raw levels and acquisition timestamps (perf_counter s of the ready edge)
+            per sample
+        """
+        if data_rate not in self.interface.accepted_sample_rates:
+            raise ValueError(f'data_rate must be one of {sorted(self.interface.accepted_sample_rates)}')
+        num_samples = max(1, int(duration * data_rate))
+        raw = np.empty(num_samples, dtype=np.int16)
+        acq_ts = np.empty(num_samples, dtype=np.float64)
+        # ready edge is missed if nothing arrives within a few conversion periods (s)
+        timeout = max(0.002, 3 / data_rate)
+        get_last_result = self.interface.get_last_result
+        alert_pin = self.interface.alert_pin
+        # ready edges seen and the time of the latest, counted by the edge callback (on RPi.GPIO's thread)
+        edges = [0, 0.0]
+        ready = Event()
+
+        def on_edge(channel):
+            edges[1] = perf_counter()
+            edges[0] += 1
+            ready.set()
+        # ALERT/RDY is open drain, pulled up between conversions
+        GPIO.setup(alert_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        with hold():
+            # hi threshold MSB set and lo threshold MSB clear turns ALERT/RDY into a conversion ready output
+            self.interface.start_adc_difference_comparator(self.channel, self.interface.min_level, 0,
+                                                           gain=self.gain, data_rate=data_rate)
+            GPIO.add_event_detect(alert_pin, GPIO.FALLING, callback=on_edge)
+            try:
+                index = read = missed = 0
+                while index < num_samples:
+                    if not ready.wait(timeout):
+                        # no conversion came ready: the last result was already stored, so nothing is read
+                        missed += 1
+                        self.missed_edges += 1
+                        if missed >= self.max_missed_edges:
+                            raise RuntimeError(f'no conversion ready edge on pin {alert_pin} for {missed} timeouts, '
+                                               f'{index} of {num_samples} samples captured')
+                        continue
+                    ready.clear()
+                    missed = 0
+                    count, acq_ts[index] = edges
+                    raw[index] = get_last_result()
+                    # conversions that came ready since the last read were overwritten by the latest one
+                    self.missed_edges += max(0, count - read - 1)
+                    read = count
+                    index += 1
+            finally:
+                GPIO.remove_event_detect(alert_pin)
+                self.interface.stop_adc()
+        return self.adjust(raw), raw, acq_ts
 
     def add_cal_point(self, target):
         """
@@ -54,6 +299,5 @@ class StrainGauge:
 
         recommendation is to call multiple times at various strains.
         """
-        strain = self.read_strain()
-        diff = (target - strain)
-        self.cal_map = np.vstack((self.cal_map, [target, diff]))
+        raw = self.read_raw()
+        self.cal_table.add(raw, self.level_from_strain(target) - raw)
@@ -10,19 +10,55 @@ Copyright (c):  2018 Danyal Ahsanullah
 License: N/A
 Description: 
 """
-from typing import Tuple
+from time import perf_counter
+from typing import Tuple, Union
+from libs.utils import GPIO
 from libs.hal.max31856 import MAX31856
-from libs.data_router import add_to_poll, publish
+from libs.data_router import add_to_poll, publish, publish_event
 
 
 class Thermocouple(MAX31856):
+    # faults that mean the probe is not usable, polling is suspended until they clear
+    SUSPEND_FAULTS = MAX31856.MAX31856_FAULT_OPEN | MAX31856.MAX31856_FAULT_TCRANGE | MAX31856.MAX31856_FAULT_CJRANGE
 
-    def __init__(self, name: str, tc_type, num_avgs, *args, **kwargs):
+    def __init__(self, name: str, tc_type, num_avgs, *args, drdy_pin: Union[int, None] = None,
+                 conversion_sync: bool = False, open_circuit_detect: bool = True, fault_retry: float = 5.0,
+                 **kwargs):
+        """
+        :param name: name used to tag published readings
+        :param tc_type: thermocouple type letter, see MAX31856.THERMOCOUPLE_MAP
+        :param num_avgs: number of samples averaged per conversion, see MAX31856.SAMPLE_MAP
+        :param drdy_pin: optional pin the MAX31856 DRDY output is tied to. Implies conversion_sync.
+        :param conversion_sync: only read when a new conversion is available and timestamp it at conversion time.
+            Without a DRDY pin, conversion availability is modelled from the conversion time.
+        :param open_circuit_detect: enable the MAX31856 open circuit detection
+        :param fault_retry: seconds between fault register checks while polling is suspended by a fault
+        """
         super().__init__(tc_type=tc_type, avgsel=num_avgs, *args, **kwargs)
         self._tc_type_str = tc_type
         self._avg_samples = num_avgs
         self.name = name
-        add_to_poll(self.get_temps)
+        self.drdy_pin = drdy_pin
+        self.conversion_sync = conversion_sync or drdy_pin is not None
+        self.fault_retry = fault_retry
+        # latest fault status register value, updated with every reading
+        self.fault = 0
+        self._fault_check_ts = 0.0
+        if open_circuit_detect:
+            self._write_register(self.MAX31856_REG_WRITE_CR0, self.MAX31856_CR0_READ_CONT | self.MAX31856_CR0_OCFAULT)
+        # continuous conversions start once CR0 has been written
+        self._last_conversion_ts = perf_counter()
+        self._drdy_ts = None
+        if self.drdy_pin is not None:
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(self.drdy_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            # DRDY asserts low when a conversion completes
+            GPIO.add_event_detect(self.drdy_pin, GPIO.FALLING, callback=self._on_drdy)
+        add_to_poll(self.poll)
+
+    # noinspection PyUnusedLocal
+    def _on_drdy(self, channel):
+        self._drdy_ts = perf_counter()
 
     def read_temp(self):
         return super().read_temp_c()
@@ -30,9 +66,68 @@ class Thermocouple(MAX31856):
     def read_internal_temp(self):
         return super().read_internal_temp_c()
 
-    @publish('thermocouple', ('meta', 'temp', 'internal_temp'))
-    def get_temps(self) -> Tuple[str, float, float]:
-        return self.name, self.read_temp(), self.read_internal_temp()
+    @publish('thermocouple', ('meta', 'temp', 'internal_temp', 'acq_ts', 'fault', 'valid'))
+    def get_temps(self, acq_ts: Union[float, None] = None) -> Tuple[str, float, float, float, int, bool]:
+        # single burst transaction instead of one chip select cycle per register, fault status included
+        temp, internal_temp, fault = self.read_burst()
+        acq_ts = perf_counter() if acq_ts is None else acq_ts
+        self._update_fault(fault, acq_ts)
+        return self.name, temp, internal_temp, acq_ts, fault, not fault & self.MAX31856_FAULT_INVALID
+
+    def _update_fault(self, fault: int, ts: float):
+        """caches the fault status and raises a 'fault' event whenever it changes"""
+        if fault != self.fault:
+            self.fault = fault
+            publish_event('fault', meta=self.name, fault=fault, flags=self.fault_flags, acq_ts=ts)
+        self._fault_check_ts = ts
+
+    @property
+    def fault_flags(self) -> Tuple[str, ...]:
+        """names of the faults set in the cached fault status, see MAX31856.FAULT_MAP"""
+        return self.decode_fault(self.fault)
+
+    @property
+    def suspended(self) -> bool:
+        """True while an open circuit or range fault keeps the channel from being read and logged"""
+        return bool(self.fault & self.SUSPEND_FAULTS)
+
+    def poll(self) -> Union[Tuple[str, float, float, float, int, bool], None]:
+        """
+        polling entry point, reads through poll_temps with conversion_sync or get_temps otherwise.
+        while suspended by a fault only the fault register is checked, every `fault_retry` seconds.
+        :return: result of get_temps, or None if nothing was read
+        """
+        if self.suspended:
+            now = perf_counter()
+            if now - self._fault_check_ts < self.fault_retry:
+                return None
+            self._update_fault(self.read_fault_register(), now)
+            if self.suspended:
+                return None
+        return self.poll_temps() if self.conversion_sync else self.get_temps()
+
+    def poll_temps(self) -> Union[Tuple[str, float, float, float, int, bool], None]:
+        """
+        reads the sensor only if a conversion has completed since the last read, so each conversion is
+        published exactly once and stamped with the time it completed.
+        :return: result of get_temps, or None if no new conversion is available
+        """
+        now = perf_counter()
+        if self.drdy_pin is not None:
+            conversion_ts, self._drdy_ts = self._drdy_ts, None
+            if conversion_ts is None:
+                # an edge may have been missed before detection was armed, DRDY stays low until read
+                if GPIO.input(self.drdy_pin) != GPIO.LOW:
+                    return None
+                conversion_ts = now
+        else:
+            period = self.conversion_time
+            if now - self._last_conversion_ts < period:
+                return None
+            # newest conversion completed on the last whole conversion period
+            conversion_ts = self._last_conversion_ts + ((now - self._last_conversion_ts) // period) * period
+        self._last_conversion_ts = conversion_ts
+        return self.get_temps(conversion_ts)
 
     @property
     def fault_register(self):
@@ -48,6 +143,7 @@ class Thermocouple(MAX31856):
         self.tc_type = self.THERMOCOUPLE_MAP[value]
         cr1 = ((self.avgsel << 4) + self.tc_type)
         self._write_register(self.MAX31856_REG_WRITE_CR1, cr1)
+        self._last_conversion_ts = perf_counter()
 
     @property
     def averaging_samples(self):
@@ -59,3 +155,4 @@ class Thermocouple(MAX31856):
         self.avgsel = self.SAMPLE_MAP[value]
         cr1 = ((self.avgsel << 4) + self.tc_type)
         self._write_register(self.MAX31856_REG_WRITE_CR1, cr1)
+        self._last_conversion_ts = perf_counter()
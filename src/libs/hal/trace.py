@@ -0,0 +1,458 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+trace.py
+Author: Danyal Ahsanullah
+Date: 8/31/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: record and replay of the traffic between the hal and its chips.
+
+    while recording, the adc and dac (ADS1115 and MCP4725 calls), the thermocouples (transactions on their spi
+    bus) and the load cell (serial calls) write every call's arguments, result and timing to a binary trace.
+    replaying builds the same hal devices on chips that answer from a trace instead, so everything above the
+    chips (drivers, parsers, control loops, logging) runs on what the rig did, without the rig.
+
+    with TraceCapture('run.trace'):     # on the rig, before any device is built
+        ...
+    with TraceReplay('run.trace'):      # anywhere
+        ...                             # the same calls, in the same order per device
+
+    or: launcher.py --trace run.trace --config <procedure>
+
+    calls are replayed in order per device. a call that differs from the trace (or runs past its end) raises
+    TraceMismatch, so code whose chip traffic depends on wall clock timing (eg: thermocouple conversion polling)
+    only replays if it issues the same calls. gpio is not traced.
+
+    file layout, little endian: MAGIC, then records of
+        uint16 call, float64 start (s since the trace started), float32 duration (s), uint32 payload length
+    and a payload that is the marshalled (args, kwargs, result, error) of the call. call NAME records define the
+    next call id instead, their payload is the call's utf-8 '<device>.<method>'. paths ending in .gz or .xz
+    are compressed. summary of a trace:
+        python -m libs.hal.trace <path>
+"""
+
+import sys
+import struct
+import marshal
+from os.path import splitext
+from collections import deque
+from threading import RLock, local
+from time import perf_counter, sleep
+from typing import Callable, Dict, Iterator, NamedTuple, Tuple, Union
+
+from libs import hal
+from libs.hal.adc import ADS1115, ADS1115Interface as A2D
+from libs.hal.dac import MCP4725, MCP4725Interface as D2A
+from libs.hal.thermocouple import Thermocouple
+from libs.hal.sparkfun_openscale import OpenScale
+from libs.hal.chip_swap import ChipSwap
+from libs.log_rotation import OPENERS
+
+MAGIC = b'PCTRACE\x01'
+RECORD = struct.Struct('<HdfI')
+NAME = 0xFFFF
+
+# chip calls traced, per interface
+ADS1115_CALLS: Tuple[str, ...] = ('read_adc', 'read_adc_difference', 'start_adc', 'start_adc_difference',
+                                  'start_adc_comparator', 'start_adc_difference_comparator', 'get_last_result',
+                                  'stop_adc')
+MCP4725_CALLS: Tuple[str, ...] = ('set_voltage',)
+SPI_CALLS: Tuple[str, ...] = ('set_clock_hz', 'set_mode', 'set_bit_order', 'transfer')
+# opening and closing the port are not traffic, replayed ports open and close without the trace
+SERIAL_CALLS: Tuple[str, ...] = ('flush', 'reset_input_buffer', 'reset_output_buffer', 'write', 'read', 'read_until',
+                                 'readline')
+
+
+class TraceMismatch(RuntimeError):
+    """the replayed code made a call the trace does not have next"""
+
+
+class Call(NamedTuple):
+    device: str
+    method: str
+    start: float
+    duration: float
+    args: tuple
+    kwargs: dict
+    result: object
+    error: Union[str, None]
+
+
+def _plain(value):
+    """value as the builtin types marshal stores (numpy scalars and arrays, bytearrays, tuples)"""
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, bytearray):
+        return bytes(value)
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return value
+
+
+def _open(path: str, mode: str):
+    return OPENERS.get(splitext(path)[1], open)(path, mode)
+
+
+class TraceWriter:
+    """appends calls to a trace file, from any thread"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.calls = 0
+        self._file = _open(path, 'wb')
+        self._file.write(MAGIC)
+        self._ids: Dict[str, int] = {}
+        self._lock = RLock()
+        self._start = perf_counter()
+
+    def _id(self, name: str) -> int:
+        call = self._ids.get(name)
+        if call is None:
+            call = self._ids[name] = len(self._ids)
+            encoded = name.encode()
+            self._file.write(RECORD.pack(NAME, 0.0, 0.0, len(encoded)) + encoded)
+        return call
+
+    def call(self, device: str, method: str, func: Callable, args: tuple, kwargs: dict):
+        """calls func(*args, **kwargs) and records it, errors are recorded and raised again"""
+        result, error = None, None
+        start = perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            duration = perf_counter() - start
+            payload = marshal.dumps((_plain(args), {key: _plain(value) for key, value in kwargs.items()},
+                                     _plain(result), error))
+            with self._lock:
+                if not self._file.closed:
+                    self._file.write(RECORD.pack(self._id(f'{device}.{method}'), start - self._start, duration,
+                                                 len(payload)) + payload)
+                    self.calls += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_trace(path: str) -> Iterator[Call]:
+    """calls of a trace, in the order they were recorded"""
+    names: Dict[int, Tuple[str, str]] = {}
+    with _open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a hal trace')
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                # a trace cut short (eg: by a crash) ends at its last whole record
+                return
+            call, start, duration, size = RECORD.unpack(header)
+            payload = file.read(size)
+            if len(payload) < size:
+                return
+            if call == NAME:
+                names[len(names)] = tuple(payload.decode().rsplit('.', 1))
+                continue
+            args, kwargs, result, error = marshal.loads(payload)
+            yield Call(*names[call], start, duration, tuple(args), kwargs, result, error)
+
+
+class _Recorder:
+    """records the calls of one device, calls made from within a recorded call (eg: read_until) are not"""
+
+    def __init__(self, writer: TraceWriter, device: str):
+        self.writer = writer
+        self.device = device
+        self._local = local()
+
+    def call(self, method: str, func: Callable, args: tuple, kwargs: dict):
+        if getattr(self._local, 'busy', False):
+            return func(*args, **kwargs)
+        self._local.busy = True
+        try:
+            return self.writer.call(self.device, method, func, args, kwargs)
+        finally:
+            self._local.busy = False
+
+
+class _Player:
+    """answers the calls of one device from its calls in a trace"""
+
+    def __init__(self, device: str, calls: deque, strict: bool = True, pace: bool = False):
+        self.device = device
+        self.calls = calls
+        self.strict = strict
+        self.pace = pace
+
+    def call(self, method: str, args: tuple, kwargs: dict):
+        if not self.calls:
+            raise TraceMismatch(f'{self.device}.{method}{args} called past the end of its trace')
+        call = self.calls.popleft()
+        if call.method != method or (self.strict and (list(call.args) != _plain(args) or
+                                                      call.kwargs != {k: _plain(v) for k, v in kwargs.items()})):
+            raise TraceMismatch(f'{self.device}.{method}{args} called where the trace has '
+                                f'{call.device}.{call.method}{call.args} (at {call.start:.6f} s)')
+        if self.pace:
+            sleep(call.duration)
+        if call.error is not None:
+            raise OSError(f'replayed {call.error}')
+        return call.result
+
+
+def _recorded(owner: type, method: str) -> Callable:
+    """method of owner recording calls to the next class's method (the chip's)"""
+    def recorded(self, *args, **kwargs):
+        return self._trace.call(method, getattr(super(owner, self), method), args, kwargs)
+
+    recorded.__name__ = method
+    return recorded
+
+
+def _replayed(method: str) -> Callable:
+    def replayed(self, *args, **kwargs):
+        return self._trace.call(method, args, kwargs)
+
+    replayed.__name__ = method
+    return replayed
+
+
+class TracedADS1115(ADS1115):
+    """ADS1115 recording its calls"""
+    _trace: _Recorder = None
+
+
+class ReplayADS1115(ADS1115):
+    """ADS1115 answering from a trace"""
+    _trace: _Player = None
+
+    # noinspection PyMissingConstructor
+    def __init__(self, *args, **kwargs):
+        # no i2c bus is opened
+        pass
+
+
+class TracedMCP4725(MCP4725):
+    """MCP4725 recording its calls"""
+    _trace: _Recorder = None
+
+
+class ReplayMCP4725(MCP4725):
+    """MCP4725 answering from a trace"""
+    _trace: _Player = None
+
+    # noinspection PyMissingConstructor
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+for _method in ADS1115_CALLS:
+    setattr(TracedADS1115, _method, _recorded(TracedADS1115, _method))
+    setattr(ReplayADS1115, _method, _replayed(_method))
+for _method in MCP4725_CALLS:
+    setattr(TracedMCP4725, _method, _recorded(TracedMCP4725, _method))
+    setattr(ReplayMCP4725, _method, _replayed(_method))
+
+
+class TracedA2D(A2D, TracedADS1115):
+    def __init__(self, trace: _Recorder, **kwargs):
+        self._trace = trace
+        super().__init__(**kwargs)
+
+
+class ReplayA2D(A2D, ReplayADS1115):
+    def __init__(self, trace: _Player, **kwargs):
+        self._trace = trace
+        super().__init__(**kwargs)
+
+
+class TracedD2A(D2A, TracedMCP4725):
+    def __init__(self, trace: _Recorder, **kwargs):
+        self._trace = trace
+        super().__init__(**kwargs)
+
+
+class ReplayD2A(D2A, ReplayMCP4725):
+    def __init__(self, trace: _Player, **kwargs):
+        self._trace = trace
+        super().__init__(**kwargs)
+
+
+class TracedSPI:
+    """spi bus (SPI.SpiDev, SPI.BitBang or a libs.hal.soft_spi backend) recording its calls"""
+
+    def __init__(self, spi, trace: _Recorder):
+        self.spi = spi
+        self._trace = trace
+
+    def __getattr__(self, name):
+        attr = getattr(self.spi, name)
+        if name not in SPI_CALLS:
+            return attr
+        return lambda *args, **kwargs: self._trace.call(name, attr, args, kwargs)
+
+
+class ReplaySPI:
+    """spi bus answering from a trace"""
+
+    def __init__(self, trace: _Player):
+        self._trace = trace
+
+
+for _method in SPI_CALLS:
+    setattr(ReplaySPI, _method, _replayed(_method))
+
+
+class TracedThermocouple(Thermocouple):
+    """thermocouple recording the transactions on its spi bus, whichever bus it is given"""
+
+    def __init__(self, trace: _Recorder, **kwargs):
+        self._trace = trace
+        super().__init__(**kwargs)
+
+    @property
+    def _spi(self):
+        return self.__dict__['_spi']
+
+    @_spi.setter
+    def _spi(self, spi):
+        self.__dict__['_spi'] = spi if spi is None else TracedSPI(spi, self._trace)
+
+
+class TracedOpenScale(OpenScale):
+    """OpenScale recording its serial calls"""
+
+    def __init__(self, trace: _Recorder, *args, **kwargs):
+        self._trace = trace
+        super().__init__(*args, **kwargs)
+
+    @property
+    def in_waiting(self) -> int:
+        return self._trace.call('in_waiting', lambda: super(TracedOpenScale, self).in_waiting, (), {})
+
+
+class ReplayOpenScale(OpenScale):
+    """OpenScale answering its serial calls from a trace"""
+
+    def __init__(self, trace: _Player, *args, **kwargs):
+        self._trace = trace
+        super().__init__(*args, **kwargs)
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    @property
+    def in_waiting(self) -> int:
+        return self._trace.call('in_waiting', (), {})
+
+
+for _method in SERIAL_CALLS:
+    setattr(TracedOpenScale, _method, _recorded(TracedOpenScale, _method))
+    setattr(ReplayOpenScale, _method, _replayed(_method))
+
+
+class TraceCapture(ChipSwap):
+    """records the chip traffic of the hal's devices to a trace"""
+
+    def __init__(self, path: str):
+        """
+        :param path: trace file, compressed if it ends in .gz or .xz
+        """
+        super().__init__()
+        self.path = path
+        self.writer: Union[TraceWriter, None] = None
+
+    def _factories_for(self) -> Dict[str, Callable]:
+        def recorder(name: str) -> _Recorder:
+            return _Recorder(self.writer, name)
+
+        def thermocouple(name: str):
+            # on the hal's own bus, wrapped by TracedThermocouple
+            return lambda: TracedThermocouple(recorder(name), **hal.settings(name), **hal.SPI_BUSES[name]())
+
+        return {
+            'adc': lambda: TracedA2D(recorder('adc'), **hal.settings('adc')),
+            'dac': lambda: TracedD2A(recorder('dac'), **hal.settings('dac')),
+            **{name: thermocouple(name) for name in hal.SPI_BUSES},
+            'load_cell': lambda: TracedOpenScale(recorder('load_cell'), **hal.settings('load_cell')),
+        }
+
+    def install(self):
+        if not self.installed:
+            self.writer = TraceWriter(self.path)
+        super().install()
+
+    def uninstall(self):
+        super().uninstall()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class TraceReplay(ChipSwap):
+    """builds the hal's devices on chips answering from a trace"""
+
+    def __init__(self, path: str, strict: bool = True, pace: bool = False):
+        """
+        :param path: trace recorded with TraceCapture
+        :param strict: calls have to have the recorded arguments too, not only the recorded method
+        :param pace: take as long as each recorded call took, otherwise calls return immediately
+        """
+        super().__init__()
+        self.path = path
+        self.strict = strict
+        self.pace = pace
+        self.calls: Dict[str, deque] = {}
+        for call in read_trace(path):
+            self.calls.setdefault(call.device, deque()).append(call)
+
+    def _factories_for(self) -> Dict[str, Callable]:
+        def player(name: str) -> _Player:
+            return _Player(name, self.calls.setdefault(name, deque()), self.strict, self.pace)
+
+        def thermocouple(name: str):
+            # whichever bus it was recorded on, its transactions are replayed the same way
+            return lambda: Thermocouple(**hal.settings(name), hardware_spi=ReplaySPI(player(name)))
+
+        return {
+            'adc': lambda: ReplayA2D(player('adc'), **hal.settings('adc')),
+            'dac': lambda: ReplayD2A(player('dac'), **hal.settings('dac')),
+            **{name: thermocouple(name) for name in hal.SPI_BUSES},
+            'load_cell': lambda: ReplayOpenScale(player('load_cell'), **hal.settings('load_cell')),
+        }
+
+    @property
+    def remaining(self) -> Dict[str, int]:
+        """calls of each device not replayed (yet)"""
+        return {device: len(calls) for device, calls in self.calls.items() if calls}
+
+
+def summary(path: str) -> str:
+    """calls, mean and max duration of each traced call"""
+    stats: Dict[str, list] = {}
+    end = 0.0
+    for call in read_trace(path):
+        entry = stats.setdefault(f'{call.device}.{call.method}', [0, 0.0, 0.0, 0])
+        entry[0] += 1
+        entry[1] += call.duration
+        entry[2] = max(entry[2], call.duration)
+        entry[3] += call.error is not None
+        end = max(end, call.start + call.duration)
+    width = max((len(name) for name in stats), default=4)
+    lines = [f'{"call":<{width}} {"calls":>8} {"mean ms":>9} {"max ms":>9} {"errors":>7}']
+    lines.extend(f'{name:<{width}} {count:>8} {total / count * 1e3:>9.3f} {peak * 1e3:>9.3f} {errors:>7}'
+                 for name, (count, total, peak, errors) in sorted(stats.items()))
+    lines.append(f'{sum(entry[0] for entry in stats.values())} calls over {end:.1f} s')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    for _path in sys.argv[1:] or sys.exit('usage: python -m libs.hal.trace <trace> ...'):
+        print(summary(_path))
@@ -0,0 +1,236 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+instrumentation.py
+Author: Danyal Ahsanullah
+Date: 8/30/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: timing histograms and counters for the hot paths, off unless enabled.
+
+    instruments.enable()
+    ...  # run, timed functions record into their histograms
+    print(instruments.report())
+    instruments.dump('snapshot.json')
+
+    @timed('hal.adc.read_single')        -- records every call's duration into a named histogram
+    with instruments.span('name'):       -- same for a block
+    instruments.count('name')            -- named counters
+
+    while disabled a timed function costs one flag check on top of the call. built in instruments:
+        publish.<topic>.read / .dispatch -- @publish wrapped functions: the device read and the listeners
+        poll.round, poll.rounds, poll.overruns -- query_sensors rounds, rounds that took longer than the period
+        hal.*                            -- device reads (adc, strain gauge, thermocouple burst, load cell)
+        controller.process               -- ControllerBase.process
+        logger.record_data / .record_frame -- DataLogger writes
+
+    launcher.py --instrument <path> enables them for a run, SIGUSR1 dumps a snapshot to <path> while running
+    and SIGUSR2 toggles recording. reading back a dump:
+        python -m libs.instrumentation <path>
+"""
+
+import sys
+import json
+from time import perf_counter_ns, time
+from functools import wraps as _wraps
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Union
+
+# linear buckets per power of two, values are kept to within 1/2**SUB_BUCKET_BITS of their bucket's lower bound
+SUB_BUCKET_BITS: int = 5
+_LINEAR = 2 << SUB_BUCKET_BITS
+PERCENTILES = (50, 90, 99)
+
+
+def bucket_index(value: int) -> int:
+    """log linear bucket of a (non negative, integer) value"""
+    if value < _LINEAR:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+
+def bucket_low(index: int) -> int:
+    """smallest value in a bucket"""
+    if index < _LINEAR:
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    return (index - (shift << SUB_BUCKET_BITS)) << shift
+
+
+class Histogram:
+    """
+    HDR style histogram of durations (ns): exact below 2**(SUB_BUCKET_BITS + 1) ns, a constant relative
+    precision above. updates are not locked, a sample can be lost if two threads record into the same
+    histogram at the same time.
+    """
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value: int):
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> int:
+        """
+        highest value (ns) equivalent to the recorded value at a percentile, capped at the largest recorded value
+        :param percent: 0 - 100
+        """
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(bucket_low(index + 1) - 1, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        """summary in us, with the buckets as {lower bound (ns): count}"""
+        if not self.count:
+            return {'count': 0}
+        summary = {'count': self.count, 'total_ms': self.total / 1e6, 'mean_us': self.total / self.count / 1e3,
+                   'min_us': self.min / 1e3}
+        summary.update((f'p{percent}_us', self.percentile(percent) / 1e3) for percent in PERCENTILES)
+        summary['max_us'] = self.max / 1e3
+        summary['buckets'] = {bucket_low(index): self.counts[index] for index in sorted(self.counts)}
+        return summary
+
+
+class Instruments:
+    """named histograms and counters, recording only while enabled"""
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self._since = time()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def toggle(self) -> bool:
+        """flips recording on or off, returns the new state"""
+        self.enabled = not self.enabled
+        return self.enabled
+
+    def reset(self):
+        """drops everything recorded so far"""
+        self.histograms = {}
+        self.counters = {}
+        self._since = time()
+
+    def histogram(self, name: str) -> Histogram:
+        try:
+            return self.histograms[name]
+        except KeyError:
+            return self.histograms.setdefault(name, Histogram())
+
+    def record(self, name: str, duration: int):
+        """records a duration (ns) regardless of whether recording is enabled"""
+        self.histogram(name).record(duration)
+
+    def count(self, name: str, amount: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def span(self, name: str):
+        """times the enclosed block into a histogram"""
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.histogram(name).record(perf_counter_ns() - start)
+
+    def snapshot(self) -> Dict:
+        """everything recorded so far, as json serializable data"""
+        return {'since': self._since, 'time': time(), 'enabled': self.enabled,
+                'histograms': {name: hist.to_dict() for name, hist in sorted(self.histograms.items())},
+                'counters': dict(sorted(self.counters.items()))}
+
+    def dump(self, path: str) -> Dict:
+        """writes a snapshot to a json file, see report() for reading it back"""
+        snapshot = self.snapshot()
+        with open(path, 'w') as file:
+            json.dump(snapshot, file, indent=1)
+        return snapshot
+
+    def report(self) -> str:
+        return report(self.snapshot())
+
+
+def report(snapshot: Dict) -> str:
+    """table of a snapshot's histograms (us) and counters"""
+    columns = ('count', 'mean_us', 'min_us', *(f'p{percent}_us' for percent in PERCENTILES), 'max_us')
+    histograms = snapshot['histograms']
+    width = max((len(name) for name in (*histograms, *snapshot['counters'])), default=4)
+    lines = [f'{"name":<{width}} ' + ' '.join(f'{column[:-3] if column.endswith("_us") else column:>10}'
+                                                for column in columns) + '  (us)']
+    for name, hist in histograms.items():
+        if hist['count']:
+            lines.append(f'{name:<{width}} {hist["count"]:>10} ' +
+                         ' '.join(f'{hist[column]:>10.1f}' for column in columns[1:]))
+    if snapshot['counters']:
+        lines.append('')
+        lines.extend(f'{name:<{width}} {value:>10}' for name, value in snapshot['counters'].items())
+    lines.append(f'\nover {snapshot["time"] - snapshot["since"]:.1f} s')
+    return '\n'.join(lines)
+
+
+def timed(name: str, registry: Union[Instruments, None] = None) -> Callable:
+    """
+    decorator recording each call's duration into a named histogram while instrumentation is enabled
+    :param name: histogram name, dotted by convention (eg: hal.adc.read_single)
+    :param registry: instruments to record into, the module's by default
+    """
+
+    def decorator(func):
+        @_wraps(func)
+        def wrapper(*args, **kwargs):
+            instr = registry or instruments
+            if not instr.enabled:
+                return func(*args, **kwargs)
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                instr.histogram(name).record(perf_counter_ns() - start)
+
+        return wrapper
+
+    return decorator
+
+
+instruments = Instruments()
+
+
+def main(paths: Iterable[str]):
+    for path in paths:
+        with open(path) as file:
+            print(report(json.load(file)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or sys.exit('usage: python -m libs.instrumentation <snapshot.json> ...'))
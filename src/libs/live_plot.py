@@ -0,0 +1,202 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+live_plot.py
+Author: Danyal Ahsanullah
+Date: 8/25/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: live plotting in a separate process, fed through shared memory ring buffers.
+
+    acquisition only writes samples into fixed size rings in shared memory, the plotting process
+    snapshots the rings and updates its existing lines in place, so memory use is bounded by the window
+    and acquisition never waits on a redraw.
+
+    plot = LivePlot([('thermocouple.fluid', 'temp'), ('thermocouple.fluid', 'internal_temp')])
+    plot.start()
+    ...
+    plot.close()
+"""
+
+import multiprocessing as _mp
+from multiprocessing import shared_memory
+from time import perf_counter
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from libs.data_router import TOPICS, register_listeners
+from pubsub import pub
+
+_COUNT_SIZE = np.dtype(np.int64).itemsize
+
+
+class SharedRing:
+    """
+    fixed window ring of float64 rows in shared memory, written by one process and read by any others.
+    """
+
+    def __init__(self, window: int, width: int = 2, name: Union[str, None] = None):
+        """
+        :param window: number of rows kept
+        :param width: values per row
+        :param name: name of an existing ring to attach to, a new ring is created if None
+        """
+        self.window = window
+        self.width = width
+        self.owner = name is None
+        size = _COUNT_SIZE + window * width * 8
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        # total number of rows ever written, bumped after the row is complete
+        self._count = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self._rows = np.ndarray((window, width), dtype=np.float64, buffer=self.shm.buf, offset=_COUNT_SIZE)
+        if self.owner:
+            self._count[0] = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def count(self) -> int:
+        return int(self._count[0])
+
+    def append(self, row: Sequence[float]):
+        count = int(self._count[0])
+        self._rows[count % self.window] = row
+        self._count[0] = count + 1
+
+    def snapshot(self) -> np.ndarray:
+        """
+        copies the newest rows, oldest first. the writer is never blocked, a copy it overran is retried.
+        at most window - 1 rows are returned, the slot of the oldest row is the one being overwritten next.
+        """
+        while True:
+            count = int(self._count[0])
+            start = max(0, count - self.window + 1)
+            rows = self._rows[np.arange(start, count) % self.window]
+            if int(self._count[0]) - start < self.window:
+                return rows
+
+    def close(self):
+        """detaches from the ring, the creating side also frees it"""
+        self._count = self._rows = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _plot_process(names: List[str], window: int, traces: List[Tuple[str, str]], interval: float, stop):
+    """plotting process: one subplot per field, one line per trace, lines updated in place"""
+    import matplotlib.pyplot as plt
+
+    rings = [SharedRing(window, name=name) for name in names]
+    fields = list(dict.fromkeys(field for _, field in traces))
+    fig, axes = plt.subplots(len(fields), 1, sharex=True, squeeze=False)
+    axes = {field: ax for field, ax in zip(fields, axes[:, 0])}
+    lines = []
+    for source, field in traces:
+        line, = axes[field].plot([], [], label=f'{source} {field}')
+        lines.append(line)
+    for field, ax in axes.items():
+        ax.set_ylabel(field)
+        ax.legend(loc='upper right')
+    axes[fields[-1]].set_xlabel('time (s)')
+    plt.show(block=False)
+    try:
+        while not stop.is_set() and plt.fignum_exists(fig.number):
+            for ring, line in zip(rings, lines):
+                rows = ring.snapshot()
+                line.set_data(rows[:, 0], rows[:, 1])
+            for ax in axes.values():
+                ax.relim()
+                ax.autoscale_view()
+            fig.canvas.draw_idle()
+            fig.canvas.start_event_loop(interval)
+    finally:
+        for ring in rings:
+            ring.close()
+
+
+class LivePlot:
+    """
+    plots traces of published samples live, from a separate process.
+    """
+
+    def __init__(self, traces: Sequence[Tuple[str, str]], window: int = 2000, interval: float = 0.1,
+                 listen: bool = True):
+        """
+        :param traces: (topic_meta, field) of every line, eg: ('thermocouple.fluid', 'temp')
+        :param window: samples kept (and plotted) per trace
+        :param interval: time between redraws (s)
+        :param listen: subscribe to the traces' topics, otherwise samples are fed through add()
+        """
+        self.traces = list(traces)
+        self.window = window
+        self.interval = interval
+        self.rings = [SharedRing(window) for _ in self.traces]
+        self.start_time = perf_counter()
+        self._sources: Dict[str, List[Tuple[int, str]]] = {}
+        for index, (source, field) in enumerate(self.traces):
+            self._sources.setdefault(source, []).append((index, field))
+        self.topics = frozenset(topic for topic in TOPICS
+                                if any(source == topic or source.startswith(topic + '.') for source in self._sources))
+        self.listen = listen
+        if listen:
+            register_listeners(self.record, self.topics)
+        self._stop = _mp.Event()
+        self._process: Union[_mp.Process, None] = None
+
+    def start(self):
+        """starts the plotting process"""
+        self._process = _mp.Process(target=_plot_process, name='live-plot', daemon=True,
+                                    args=([ring.name for ring in self.rings], self.window, self.traces,
+                                          self.interval, self._stop))
+        self._process.start()
+
+    def add(self, trace: int, ts: float, value: float):
+        """adds a sample to a trace, ts in seconds"""
+        self.rings[trace].append((ts, value))
+
+    def record(self, data, topic=pub.AUTO_TOPIC):
+        """listener for published samples"""
+        topic = topic.getName()
+        targets = self._sources.get('.'.join(filter(None, (topic, data.get('meta', '')))))
+        if targets is None:
+            return
+        acq_ts = data.get('acq_ts')
+        if isinstance(acq_ts, np.ndarray):
+            # blocks of samples
+            rows = np.empty((len(acq_ts), 2))
+            rows[:, 0] = acq_ts - self.start_time
+            for index, field in targets:
+                rows[:, 1] = data[field]
+                for row in rows:
+                    self.rings[index].append(row)
+            return
+        ts = (perf_counter() if acq_ts is None else acq_ts) - self.start_time
+        for index, field in targets:
+            self.rings[index].append((ts, data[field]))
+
+    def close(self):
+        if self.listen:
+            for topic in self.topics:
+                pub.unsubscribe(self.record, topic)
+            self.listen = False
+        self._stop.set()
+        if self._process is not None:
+            self._process.join(timeout=2.0)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+        for ring in self.rings:
+            ring.close()
+        self.rings = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+log_durability.py
+Author: Danyal Ahsanullah
+Date: 8/22/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: flush/fsync policies for logs and recovery of logs left torn by a crash.
+
+    DurableLog bounds how much data can be lost to a crash by flushing (and fsyncing) every N records and/or
+    T seconds, keeping each flush small instead of leaving it to whenever python's buffers fill up.
+
+    recovery:
+        python -m libs.log_durability <log dir or files>...
+    truncates torn final lines and removes partially compressed segments.
+"""
+
+import os
+import sys
+import glob
+from time import perf_counter
+from typing import List, Union
+
+from libs.log_rotation import segments
+
+
+class DurableLog:
+    """wraps a log file (or RotatingLog) with a flush/fsync policy"""
+
+    def __init__(self, file, flush_every: Union[int, None] = None, flush_interval: Union[float, None] = 1.0,
+                 fsync: bool = True):
+        """
+        :param file: writable text file like object with flush() and fileno()
+        :param flush_every: flush after this many writes
+        :param flush_interval: flush once the oldest unflushed write is this old (s), checked on writes and poll()
+        :param fsync: also fsync on every flush, so flushed data survives power loss and not just a crash
+        """
+        self.file = file
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._pending = 0
+        self._first_pending = 0.0
+
+    def write(self, text: str) -> int:
+        written = self.file.write(text)
+        if not self._pending:
+            self._first_pending = perf_counter()
+        self._pending += 1
+        if self.flush_every is not None and self._pending >= self.flush_every:
+            self.flush()
+        else:
+            self.poll()
+        return written
+
+    def poll(self):
+        """flushes if the flush interval has passed since the oldest unflushed write"""
+        if self._pending and self.flush_interval is not None and \
+                perf_counter() - self._first_pending >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self._pending = 0
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    @property
+    def closed(self) -> bool:
+        return self.file.closed
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+def recover_file(path: str) -> int:
+    """
+    truncates a plain log after its last complete line.
+    :return: number of bytes removed
+    """
+    with open(path, 'rb+') as file:
+        size = file.seek(0, os.SEEK_END)
+        # scan backwards in blocks for the last newline
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            file.seek(start)
+            block = file.read(end - start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            file.truncate(end)
+        return size - end
+
+
+def recover_log(path: str) -> List[str]:
+    """
+    repairs a (possibly rotated) log after a crash.
+    partially compressed segments are removed (the plain segment is kept until compression completes)
+    and torn final lines of plain segments are truncated.
+    :param path: log path as given to DataLogger/RotatingLog, or a single segment
+    :return: descriptions of the repairs made
+    """
+    repairs = []
+    stem, ext = os.path.splitext(path)
+    for partial in glob.glob(glob.escape(stem) + '.[0-9][0-9][0-9][0-9]' + ext + '.*.tmp'):
+        os.remove(partial)
+        repairs.append(f'removed partial compressed segment {partial}')
+    for segment in segments(path):
+        if os.path.splitext(segment)[1] == ext:
+            removed = recover_file(segment)
+            if removed:
+                repairs.append(f'truncated {removed} bytes of torn record from {segment}')
+    return repairs
+
+
+def recover(paths: List[str]) -> List[str]:
+    """runs recover_log on files and on the logs found in directories"""
+    repairs = []
+    for path in paths:
+        if os.path.isdir(path):
+            logs = set()
+            for file in glob.glob(os.path.join(glob.escape(path), '*.csv*')):
+                name = file[:file.index('.csv') + 4]
+                # rotated segments are recovered through their log path
+                base, index = os.path.splitext(os.path.splitext(name)[0])
+                logs.add(base + '.csv' if index[1:].isdigit() and len(index) == 5 else name)
+            for log in sorted(logs):
+                repairs.extend(recover_log(log))
+        else:
+            repairs.extend(recover_log(path))
+    return repairs
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1:
+        print('usage: python -m libs.log_durability <log dir or files>...')
+        sys.exit(1)
+    for repair in recover(sys.argv[1:]):
+        print(repair)
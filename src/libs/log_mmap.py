@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+log_mmap.py
+Author: Danyal Ahsanullah
+Date: 8/23/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: fixed width binary record logs written through mmap.
+
+    file layout:
+        HEADER_SIZE byte header: magic, record count (uint64), json record dtype description
+        records: packed numpy structured records
+    the file is preallocated and grown in large chunks, records are written straight into the mapping.
+    the record count in the header is updated after each record, so open_record_log() can map
+    the records written so far as a numpy memmap while the log is still being written.
+"""
+
+import os
+import json
+import mmap
+import struct
+from typing import Dict, Sequence, Union
+
+import numpy as np
+
+MAGIC = b'PICTLREC'
+HEADER_SIZE = 4096
+_COUNT = struct.Struct('<Q')
+_COUNT_OFFSET = len(MAGIC)
+_DTYPE_OFFSET = _COUNT_OFFSET + _COUNT.size
+
+
+def _dtype_from_header(header: bytes) -> np.dtype:
+    descr = json.loads(header[_DTYPE_OFFSET:].rstrip(b'\0').decode())
+    return np.dtype([tuple(field) for field in descr])
+
+
+class RecordLog:
+    """
+    append only log of fixed width records backed by a memory mapped, preallocated file.
+    """
+
+    def __init__(self, path: str, dtype: Union[np.dtype, Sequence], chunk_records: int = 1 << 16):
+        """
+        :param path: file to create
+        :param dtype: numpy structured dtype (or its description) of a record
+        :param chunk_records: number of records the file grows by whenever it fills up
+        """
+        self.name = path
+        self.dtype = np.dtype(dtype)
+        self.chunk_records = chunk_records
+        descr = json.dumps(self.dtype.descr).encode()
+        if _DTYPE_OFFSET + len(descr) > HEADER_SIZE:
+            raise ValueError('record description does not fit in the header')
+        self.count = 0
+        self.capacity = 0
+        self._file = open(path, 'w+b')
+        self._file.write(MAGIC + _COUNT.pack(0) + descr)
+        self._mmap: Union[mmap.mmap, None] = None
+        self._records: Union[np.ndarray, None] = None
+        self._grow()
+
+    def _grow(self):
+        """extends the file by a chunk and remaps it"""
+        if self._mmap is not None:
+            self._records = None
+            self._mmap.flush()
+            self._mmap.close()
+        self.capacity += self.chunk_records
+        self._file.truncate(HEADER_SIZE + self.capacity * self.dtype.itemsize)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        self._records = np.ndarray((self.capacity,), dtype=self.dtype, buffer=self._mmap, offset=HEADER_SIZE)
+
+    def append(self, record: Union[tuple, Dict]):
+        """
+        writes one record.
+        :param record: tuple in field order, or a mapping containing every field
+        """
+        if self.count == self.capacity:
+            self._grow()
+        if isinstance(record, dict):
+            record = tuple(record[field] for field in self.dtype.names)
+        self._records[self.count] = record
+        self.count += 1
+        _COUNT.pack_into(self._mmap, _COUNT_OFFSET, self.count)
+
+    def extend(self, records: Union[np.ndarray, Dict]):
+        """
+        writes a block of records.
+        :param records: structured array of the log's dtype, or a mapping of every field to an array of values
+        """
+        if isinstance(records, dict):
+            size = len(records[self.dtype.names[0]])
+        else:
+            size = len(records)
+        while self.count + size > self.capacity:
+            self._grow()
+        block = self._records[self.count:self.count + size]
+        if isinstance(records, dict):
+            for field in self.dtype.names:
+                block[field] = records[field]
+        else:
+            block[:] = records
+        self.count += size
+        _COUNT.pack_into(self._mmap, _COUNT_OFFSET, self.count)
+
+    def flush(self):
+        if self._mmap is not None:
+            self._mmap.flush()
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def close(self):
+        """flushes and trims the preallocated space off the end of the file"""
+        if self._file.closed:
+            return
+        self._records = None
+        self._mmap.flush()
+        self._mmap.close()
+        self._mmap = None
+        self._file.truncate(HEADER_SIZE + self.count * self.dtype.itemsize)
+        self._file.close()
+
+
+def open_record_log(path: str) -> np.memmap:
+    """
+    maps the records written to a RecordLog so far, without copying or parsing.
+    works on logs still being written, records appended after opening are not included.
+    """
+    with open(path, 'rb') as file:
+        header = file.read(HEADER_SIZE)
+    if not header.startswith(MAGIC):
+        raise ValueError(f'{path} is not a record log')
+    dtype = _dtype_from_header(header)
+    count, = _COUNT.unpack_from(header, _COUNT_OFFSET)
+    if not count:
+        return np.zeros(0, dtype=dtype)
+    # never map past the end of the file, the count is bumped after a record is written
+    count = min(count, (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize)
+    return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(count,))
@@ -0,0 +1,211 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+log_rotation.py
+Author: Danyal Ahsanullah
+Date: 8/21/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: size/time based rotation of csv logs with background compression of closed segments.
+
+    a rotated log `<stem>.csv` is written as numbered segments `<stem>.0000.csv`, `<stem>.0001.csv`, ...
+    each segment starts with the log header so it can be read on its own.
+    closed segments are compressed in the background to `<stem>.NNNN.csv.gz` (or `.xz`).
+    iter_log() streams the records of all segments in order, as if they were one file.
+"""
+
+import os
+import gzip
+import lzma
+import glob
+import shutil
+import warnings as _warnings
+from queue import Queue
+from threading import Thread
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Union
+
+COMPRESSORS: Dict[str, Callable] = {
+    'gzip': gzip.open,
+    'lzma': lzma.open,
+}
+EXTENSIONS: Dict[str, str] = {
+    'gzip': '.gz',
+    'lzma': '.xz',
+}
+OPENERS: Dict[str, Callable] = {
+    '.gz': gzip.open,
+    '.xz': lzma.open,
+}
+
+
+class _Compressor:
+    """single background worker that compresses closed segments in the order they were closed"""
+
+    def __init__(self):
+        self._queue: Queue = Queue()
+        self._thread: Union[Thread, None] = None
+
+    def submit(self, path: str, compression: str):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = Thread(target=self._run, name='log-compressor', daemon=True)
+            self._thread.start()
+        self._queue.put((path, compression))
+
+    def join(self):
+        """blocks until every submitted segment has been compressed"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            path, compression = self._queue.get()
+            try:
+                compress_file(path, compression)
+            except OSError as e:
+                # segment stays uncompressed, which readers handle as well
+                _warnings.warn(f'failed to compress log segment {path}: {e}', RuntimeWarning)
+            finally:
+                self._queue.task_done()
+
+
+def compress_file(path: str, compression: str = 'gzip') -> str:
+    """
+    compresses `path` next to itself and removes the original once the compressed copy is complete.
+    :return: path of the compressed file
+    """
+    target = path + EXTENSIONS[compression]
+    partial = target + '.tmp'
+    with open(path, 'rb') as src, COMPRESSORS[compression](partial, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    # rename is atomic, readers see either the plain or the compressed segment complete
+    os.replace(partial, target)
+    os.remove(path)
+    return target
+
+
+compressor = _Compressor()
+
+
+class RotatingLog:
+    """
+    text log that starts a new segment once the current one reaches `max_bytes` or is `max_seconds` old.
+    rotation only happens between writes, so records are never split across segments.
+    """
+
+    def __init__(self, path: str, header: str = '', max_bytes: Union[int, None] = None,
+                 max_seconds: Union[float, None] = None, compression: Union[str, None] = 'gzip'):
+        """
+        :param path: log path, segments are numbered before the extension
+        :param header: written at the start of every segment
+        :param max_bytes: segment size limit
+        :param max_seconds: segment duration limit
+        :param compression: one of COMPRESSORS to compress closed segments with, or None to keep them as is
+        """
+        if compression is not None and compression not in COMPRESSORS:
+            raise ValueError(f'compression must be one of {tuple(COMPRESSORS)} or None')
+        self.stem, self.ext = os.path.splitext(path)
+        self.header = header
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compression = compression
+        self.index = -1
+        self.name = None
+        self._file = None
+        self._size = 0
+        self._opened = 0.0
+        self._rotate()
+
+    def segment_path(self, index: int) -> str:
+        return f'{self.stem}.{index:04d}{self.ext}'
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            if self.compression is not None:
+                compressor.submit(self.name, self.compression)
+        self.index += 1
+        self.name = self.segment_path(self.index)
+        self._file = open(self.name, 'w')
+        self._file.write(self.header)
+        self._size = len(self.header)
+        self._opened = perf_counter()
+
+    def write(self, text: str) -> int:
+        written = self._file.write(text)
+        self._size += written
+        if (self.max_bytes is not None and self._size >= self.max_bytes) or \
+                (self.max_seconds is not None and perf_counter() - self._opened >= self.max_seconds):
+            self._rotate()
+        return written
+
+    def flush(self):
+        self._file.flush()
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            if self.compression is not None:
+                compressor.submit(self.name, self.compression)
+
+
+def segments(path: str) -> List[str]:
+    """
+    ordered segment files of a log. plain logs are their own single segment.
+    if a segment is present both plain and compressed (compression in progress) the plain one is used.
+    """
+    if os.path.exists(path):
+        return [path]
+    stem, ext = os.path.splitext(path)
+    found: Dict[str, str] = {}
+    for segment in glob.glob(glob.escape(stem) + '.[0-9][0-9][0-9][0-9]' + ext + '*'):
+        base, compressed = os.path.splitext(segment)
+        if compressed == ext:
+            found[segment] = segment
+        elif compressed in OPENERS and base not in found:
+            found[base] = segment
+    return [found[key] for key in sorted(found)]
+
+
+def open_segment(path: str):
+    """
+    opens a plain or compressed segment for reading text.
+    a plain segment compressed since it was listed (eg: while a live log is read) is opened compressed.
+    """
+    opener = OPENERS.get(os.path.splitext(path)[1])
+    if opener is not None:
+        return opener(path, 'rt')
+    try:
+        return open(path)
+    except FileNotFoundError:
+        for ext, opener in OPENERS.items():
+            if os.path.exists(path + ext):
+                return opener(path + ext, 'rt')
+        raise
+
+
+def iter_log(path: str, header: bool = True) -> Iterator[str]:
+    """
+    streams the lines of a (possibly rotated and compressed) log.
+    :param path: log path as given to RotatingLog (or a plain log file)
+    :param header: include the header of the first segment, repeated headers of later segments are always skipped
+    """
+    for index, segment in enumerate(segments(path)):
+        with open_segment(segment) as file:
+            in_header = True
+            for line in file:
+                if in_header:
+                    # header is the comment block followed by the column line
+                    if not line.startswith('#'):
+                        in_header = False
+                    if index or not header:
+                        continue
+                yield line
@@ -0,0 +1,185 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+startup_profile.py
+Author: Danyal Ahsanullah
+Date: 8/27/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: records where startup time goes, as a tree of module imports, device initializations and
+             named phases.
+
+    profiler.start()
+    ...  # imports, libs.hal devices being built, `with profiler.span('load procedure'):` blocks
+    profiler.stop()
+    print(profiler.report())
+
+    launcher.py --profile-startup prints the report for a run, diagnostic/startup_profile.py for the
+    launcher's startup alone.
+"""
+
+import sys
+from threading import get_ident
+from time import perf_counter
+from contextlib import contextmanager
+from typing import Dict, List, Union
+
+
+class Node:
+    """one timed span and the spans nested in it"""
+
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind
+        self.elapsed = 0.0
+        self.children: List['Node'] = []
+
+    @property
+    def self_time(self) -> float:
+        return self.elapsed - sum(child.elapsed for child in self.children)
+
+    def to_dict(self) -> Dict:
+        return {'name': self.name, 'kind': self.kind, 'elapsed': self.elapsed,
+                'children': [child.to_dict() for child in self.children]}
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+class _TimedLoader:
+    """wraps a module loader so that creating and executing the module are timed"""
+
+    def __init__(self, loader, profiler: 'StartupProfiler'):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        # extension modules do most of their work here
+        with self._profiler.span(spec.name, 'import'):
+            return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        try:
+            with self._profiler.span(module.__name__, 'import'):
+                self._loader.exec_module(module)
+        finally:
+            # the module keeps its real loader
+            module.__loader__ = self._loader
+            if getattr(module, '__spec__', None) is not None:
+                module.__spec__.loader = self._loader
+
+
+class _TimingFinder:
+    """meta path finder that defers to the other finders and times the loaders they find"""
+
+    def __init__(self, profiler: 'StartupProfiler'):
+        self._profiler = profiler
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self._profiler)
+        return spec
+
+
+class StartupProfiler:
+    """
+    builds a tree of timed spans. only the thread that started the profiler is recorded.
+    """
+
+    def __init__(self):
+        self.root = Node('startup', 'root')
+        self.enabled = False
+        self._stack: List[Node] = [self.root]
+        self._finder = _TimingFinder(self)
+        self._thread: Union[int, None] = None
+        self._start = 0.0
+
+    def start(self):
+        """starts recording, imports from here on are timed"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self._thread = get_ident()
+        self._start = perf_counter()
+        sys.meta_path.insert(0, self._finder)
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        sys.meta_path.remove(self._finder)
+        self.root.elapsed += perf_counter() - self._start
+
+    @contextmanager
+    def span(self, name: str, kind: str = 'phase'):
+        """times the enclosed block as a child of the enclosing span"""
+        if not self.enabled or get_ident() != self._thread:
+            yield
+            return
+        parent = self._stack[-1]
+        if parent.children and parent.children[-1].name == name and parent.children[-1].kind == kind:
+            # eg: an extension module's create and exec steps
+            node = parent.children[-1]
+        else:
+            node = Node(name, kind)
+            parent.children.append(node)
+        self._stack.append(node)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            node.elapsed += perf_counter() - start
+            self._stack.pop()
+
+    @property
+    def elapsed(self) -> float:
+        return self.root.elapsed + (perf_counter() - self._start if self.enabled else 0.0)
+
+    def totals(self, kind: str) -> Dict[str, float]:
+        """total time of each span of a kind, eg: totals('device')"""
+        totals: Dict[str, float] = {}
+        for node in self.root.walk():
+            if node.kind == kind:
+                totals[node.name] = totals.get(node.name, 0.0) + node.elapsed
+        return totals
+
+    def report(self, min_ms: float = 1.0) -> str:
+        """
+        indented tree of spans: total ms, self ms, kind and name.
+        :param min_ms: spans shorter than this are folded into their parent's self time
+        """
+        lines = [f'{"total ms":>9} {"self ms":>9}  span', f'{self.elapsed * 1e3:9.1f} {"":>9}  startup']
+
+        def add(node: Node, depth: int):
+            for child in node.children:
+                if child.elapsed * 1e3 < min_ms:
+                    continue
+                lines.append(f'{child.elapsed * 1e3:9.1f} {child.self_time * 1e3:9.1f}  '
+                             f'{"  " * depth}{child.kind} {child.name}')
+                add(child, depth + 1)
+
+        add(self.root, 0)
+        return '\n'.join(lines)
+
+    def to_dict(self) -> Dict:
+        tree = self.root.to_dict()
+        tree['elapsed'] = self.elapsed
+        return tree
+
+
+profiler = StartupProfiler()
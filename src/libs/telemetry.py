@@ -0,0 +1,324 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+telemetry.py
+Author: Danyal Ahsanullah
+Date: 8/24/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: live telemetry of published samples over a unix domain or localhost tcp socket.
+
+    frames are length prefixed and little endian:
+        uint32 length of the rest of the frame
+        uint16 channel, uint16 sample count, float64 time (s since server start)
+        float64 values, field major (all samples of the first field, then the second, ...)
+    the first frame sent to a client is the channel table: channel CHANNEL_TABLE followed by
+    json [[topic_meta, [fields...]], ...] indexed by channel.
+
+    the acquisition thread only packs frames and queues them, a sender thread writes them without blocking.
+    non numeric fields (eg: the load cell's units string) are sent as nan, samples with a missing field are left
+    out and counted in TelemetryServer.skipped.
+    clients whose queue overflows get every other frame of theirs dropped (and so on) until they keep up,
+    clients that still can't keep up at max_decimation are disconnected.
+
+    watching a run:
+        python -m libs.telemetry <unix socket path | host:port>
+"""
+
+import os
+import sys
+import json
+import socket
+import struct
+import selectors
+from collections import deque
+from threading import Thread
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+
+from libs.data_router import FIELDS, THERMOCOUPLE_NAMES, TOPICS, register_listeners
+from pubsub import pub
+
+LENGTH = struct.Struct('<I')
+HEADER = struct.Struct('<HHd')
+CHANNEL_TABLE = 0xFFFF
+
+
+def parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """'host:port' (or ':port' for localhost) is a tcp address, anything else a unix socket path"""
+    host, _, port = address.rpartition(':')
+    if port.isdigit() and os.sep not in host:
+        return host or 'localhost', int(port)
+    return address
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def _channels(topics: Iterable[str]) -> List[Tuple[str, Tuple[str, ...]]]:
+    return [('.'.join(filter(None, (topic, meta))), FIELDS[topic]) for topic in sorted(topics)
+            for meta in (THERMOCOUPLE_NAMES if 'thermocouple' in topic else ('',))]
+
+
+class _Client:
+    def __init__(self, sock: socket.socket, max_queue: int):
+        self.sock = sock
+        self.frames: deque = deque(maxlen=max_queue)
+        self.pending = memoryview(b'')
+        self.decimation = 1
+        self.skipped = 0
+        self.dropped = 0
+
+
+class TelemetryServer:
+    """
+    serves decimated samples of the published topics to any number of socket clients.
+    """
+
+    def __init__(self, address: Union[str, Tuple[str, int]], topics: Iterable[str] = TOPICS, decimation: int = 1,
+                 max_queue: int = 256, max_decimation: int = 64):
+        """
+        :param address: unix socket path or (host, port), see parse_address
+        :param topics: topics to serve
+        :param decimation: only serve every Nth sample of each channel
+        :param max_queue: frames queued per client before it is decimated further
+        :param max_decimation: clients that fall behind at this decimation are disconnected
+        """
+        self.address = address
+        self.topics = frozenset(topics)
+        self.decimation = decimation
+        self.max_queue = max_queue
+        self.max_decimation = max_decimation
+        self.start = perf_counter()
+        self.channels = _channels(self.topics)
+        self._channel_ids: Dict[str, int] = {name: index for index, (name, _) in enumerate(self.channels)}
+        self._counts: List[int] = [0] * len(self.channels)
+        # samples per channel that could not be packed, the listener never raises into the publisher
+        self.skipped: Dict[str, int] = {}
+        table = json.dumps(self.channels).encode()
+        self._table = LENGTH.pack(HEADER.size + len(table)) + HEADER.pack(CHANNEL_TABLE, 0, 0.0) + table
+        # replaced, never mutated, so the acquisition thread can iterate it without locking
+        self._clients: Tuple[_Client, ...] = ()
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.remove(address)
+            self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(address)
+        self._listener.listen()
+        self._listener.setblocking(False)
+        if not isinstance(address, str):
+            self.address = self._listener.getsockname()[:2]
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self.closed = False
+        register_listeners(self.send_data, self.topics)
+        self._thread = Thread(target=self._run, name='telemetry', daemon=True)
+        self._thread.start()
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    def send_data(self, data, topic=pub.AUTO_TOPIC):
+        """listener for published samples, runs on the acquisition thread and never blocks"""
+        topic = topic.getName()
+        name = '.'.join(filter(None, (topic, data.get('meta', ''))))
+        channel = self._channel_ids.get(name)
+        if channel is None:
+            self._skip(name)
+            return
+        self._counts[channel] += 1
+        if not self._clients or self._counts[channel] % self.decimation:
+            return
+        acq_ts = data.get('acq_ts')
+        try:
+            values = [data[field] for field in FIELDS[topic]]
+            if isinstance(values[0], np.ndarray):
+                count = len(values[0])
+                ts = (perf_counter() if acq_ts is None else acq_ts[0]) - self.start
+                payload = np.concatenate(values).astype('<f8', copy=False).tobytes()
+            else:
+                count = 1
+                ts = (perf_counter() if acq_ts is None else acq_ts) - self.start
+                # the actuator's force carries the load cell's units string in local_temp, sent as nan
+                payload = struct.pack(f'<{len(values)}d', *map(_number, values))
+            header = HEADER.pack(channel, count, ts)
+        except (KeyError, IndexError, TypeError, ValueError, struct.error):
+            # a missing field, or an array of a non numeric dtype, the sample is left out
+            self._skip(name)
+            return
+        frame = LENGTH.pack(HEADER.size + len(payload)) + header + payload
+        for client in self._clients:
+            if client.skipped + 1 < client.decimation:
+                client.skipped += 1
+                continue
+            client.skipped = 0
+            if len(client.frames) == client.frames.maxlen:
+                # client is behind, the oldest frame is dropped by the append
+                client.dropped += 1
+                client.decimation <<= 1
+            client.frames.append(frame)
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            # sender is already awake (or closing)
+            pass
+
+    def _skip(self, name: str):
+        self.skipped[name] = self.skipped.get(name, 0) + 1
+
+    def _drop(self, client: _Client):
+        self._clients = tuple(other for other in self._clients if other is not client)
+        try:
+            self._selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+
+    def _flush(self, client: _Client):
+        """writes as much of a client's queue as the socket takes without blocking"""
+        while True:
+            if not client.pending:
+                if not client.frames:
+                    # caught up, ease the decimation back off
+                    client.decimation = max(1, client.decimation >> 1)
+                    break
+                chunk = []
+                while client.frames and len(chunk) < 64:
+                    chunk.append(client.frames.popleft())
+                client.pending = memoryview(b''.join(chunk))
+            try:
+                sent = client.sock.send(client.pending)
+            except BlockingIOError:
+                break
+            except OSError:
+                self._drop(client)
+                return
+            client.pending = client.pending[sent:]
+        if client.decimation > self.max_decimation:
+            self._drop(client)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.pending else 0)
+        self._selector.modify(client.sock, events, client)
+
+    def _run(self):
+        while not self.closed:
+            for key, events in self._selector.select(timeout=0.5):
+                if key.fileobj is self._listener:
+                    try:
+                        sock, _ = self._listener.accept()
+                    except OSError:
+                        continue
+                    sock.setblocking(False)
+                    client = _Client(sock, self.max_queue)
+                    client.pending = memoryview(self._table)
+                    self._selector.register(sock, selectors.EVENT_READ, client)
+                    self._clients = self._clients + (client,)
+                elif key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                elif events & selectors.EVENT_READ:
+                    # clients don't send anything, readable means closed
+                    try:
+                        closed = not key.fileobj.recv(4096)
+                    except BlockingIOError:
+                        closed = False
+                    except OSError:
+                        closed = True
+                    if closed:
+                        self._drop(key.data)
+            for client in self._clients:
+                if client.pending or client.frames:
+                    self._flush(client)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for topic in self.topics:
+            pub.unsubscribe(self.send_data, topic)
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass
+        self._thread.join(timeout=2.0)
+        for client in self._clients:
+            client.sock.close()
+        self._clients = ()
+        self._selector.close()
+        self._listener.close()
+        self._wake_r.close()
+        self._wake_w.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Union[bytes, None]:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def receive(address: Union[str, Tuple[str, int]]) -> Iterator[Tuple[str, float, Dict[str, np.ndarray]]]:
+    """
+    connects to a TelemetryServer and yields (topic_meta, time (s), {field: values}) until it disconnects.
+    samples of a block share the time of their first sample.
+    """
+    sock = socket.socket(socket.AF_UNIX if isinstance(address, str) else socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(address)
+    return _frames(sock)
+
+
+def _frames(sock: socket.socket) -> Iterator[Tuple[str, float, Dict[str, np.ndarray]]]:
+    channels: List = []
+    with sock:
+        while True:
+            length = _recv_exactly(sock, LENGTH.size)
+            if length is None:
+                return
+            frame = _recv_exactly(sock, LENGTH.unpack(length)[0])
+            if frame is None:
+                return
+            channel, count, ts = HEADER.unpack_from(frame)
+            if channel == CHANNEL_TABLE:
+                channels = json.loads(frame[HEADER.size:].decode())
+                continue
+            name, fields = channels[channel]
+            values = np.frombuffer(frame, dtype='<f8', offset=HEADER.size).reshape(len(fields), count)
+            yield name, ts, dict(zip(fields, values))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python -m libs.telemetry <unix socket path | host:port>')
+        sys.exit(1)
+    for name, ts, sample in receive(parse_address(sys.argv[1])):
+        print(f'{ts:.4f} {name} ' + ' '.join(f'{field}={values.tolist()}' for field, values in sample.items()))
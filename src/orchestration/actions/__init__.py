@@ -24,7 +24,8 @@ Description:
 #     return condition
 
 import os
-from typing import Iterable as _Iterable
+from typing import Callable as _Callable, Iterable as _Iterable, Union as _Union
+from collections.abc import MutableMapping as _MutableMapping
 from importlib import import_module as _import_module
 from libs.utils import yamlobj, ReprMixIn
 from enum import (
@@ -32,19 +33,118 @@ from enum import (
     auto as _auto,
 )
 
+# entry point group for actions provided by other packages, eg: in their setup.py
+#   entry_points={'pi_control.actions': ['MY_ACTION = my_package.my_action:my_action']}
+ENTRY_POINT_GROUP = 'pi_control.actions'
+
 
 def _generate_statuses(conditions: _Iterable):
     for condition in conditions:
         setattr(Status, condition, _auto())
 
 
-def _generate_action_map():
-    return {module.upper(): getattr(_import_module(f'orchestration.actions.{module}'), module)
-            for module, ext in map(os.path.splitext, os.listdir(os.path.join('orchestration', 'actions')))
-            if not ((ext != '.py') or (module in {'readme', '__init__', '__pycache__'}))}
+def statuses(*names: str):
+    """
+    declares the statuses an action returns, besides 'error'.
+    routines using the action must then give a transition for each of them (or a '*' transition).
+
+        @statuses('success', 'terminated')
+        def set_position(interface=None, params=None):
+    """
+    def declare(action: _Callable) -> _Callable:
+        action.statuses = names
+        return action
+    return declare
+
+
+def _entry_points():
+    from importlib import metadata
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return entry_points.select(group=ENTRY_POINT_GROUP)
+    return entry_points.get(ENTRY_POINT_GROUP, ())
+
 
+class ActionMap(_MutableMapping):
+    """
+    action name -> action function, importing each action only when it is first looked up.
+
+    actions are found, in order of precedence, from:
+        register() / item assignment
+        modules of this package, `<name>.py` defining a function `<name>`
+        the ENTRY_POINT_GROUP entry points of installed packages
+    """
 
-action_map = _generate_action_map()
+    def __init__(self, package: str = __name__, directory: str = os.path.dirname(os.path.abspath(__file__))):
+        """
+        :param package: package the bundled action modules are imported from
+        :param directory: directory of that package, scanned for module names only
+        """
+        self._actions = {}
+        # name -> 'module:function' not imported yet
+        self._sources = {module.upper(): f'{package}.{module}:{module}'
+                         for module, ext in map(os.path.splitext, os.listdir(directory))
+                         if ext == '.py' and module != '__init__'}
+        self._entry_points = None
+
+    def _plugins(self):
+        if self._entry_points is None:
+            self._entry_points = {entry_point.name.upper(): entry_point for entry_point in _entry_points()}
+        return self._entry_points
+
+    def register(self, name: str, action: _Union[_Callable, str]):
+        """
+        adds an action.
+        :param name: name used by `!Action` in procedures (case insensitive)
+        :param action: the action function, or 'module:function' to import it from on first use
+        """
+        name = name.upper()
+        self._actions.pop(name, None)
+        if callable(action):
+            self._actions[name] = action
+        else:
+            self._sources[name] = action
+
+    def __getitem__(self, name: str) -> _Callable:
+        action = self._actions.get(name)
+        if action is None:
+            source = self._sources.get(name)
+            if source is not None:
+                module, _, attr = source.partition(':')
+                action = getattr(_import_module(module), attr)
+            elif name in self._plugins():
+                action = self._plugins()[name].load()
+            else:
+                raise KeyError(name)
+            self._actions[name] = action
+        return action
+
+    def __setitem__(self, name: str, action: _Callable):
+        self.register(name, action)
+
+    def __delitem__(self, name: str):
+        found = False
+        for mapping in (self._actions, self._sources):
+            found = mapping.pop(name, None) is not None or found
+        if not found:
+            raise KeyError(name)
+
+    def __contains__(self, name) -> bool:
+        # checked without importing anything
+        return name in self._actions or name in self._sources or name in self._plugins()
+
+    def __iter__(self):
+        return iter(dict.fromkeys([*self._actions, *self._sources, *self._plugins()]))
+
+    def __len__(self) -> int:
+        return len(set(self._actions) | set(self._sources) | set(self._plugins()))
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({sorted(self)})'
+
+
+action_map = ActionMap()
+register_action = action_map.register
 
 
 @yamlobj('!Action')
@@ -67,6 +167,7 @@ class Action(ReprMixIn):
 
 # predefined states
 # noinspection PyUnusedLocal
+@statuses('success')
 def start_action(*args, **kwargs):
     return 'success'
 
@@ -12,6 +12,7 @@ Description:
 """
 
 from libs.hal import LoadCell  # , load_cell
+from orchestration.actions import statuses
 
 choices = 'tcurdn'
 load_cell = None
@@ -26,6 +27,7 @@ prompt = f'current configuration is:\n'
          #'Enter choice: '
 
 
+@statuses('done')
 def calibrate_force(interface: LoadCell = load_cell, params: dict = None) -> str:
     """
     Action description
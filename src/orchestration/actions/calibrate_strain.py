@@ -8,7 +8,9 @@ License: N/A
 Description: 
 """
 
-from libs.hal import StrainGauge, s1, actuator
+from libs import hal
+from libs.hal import StrainGauge
+from orchestration.actions import statuses
 
 actions = {'add_point', 'set_pos_rel', 'set_pos_abs', 'done'}
 
@@ -26,13 +28,17 @@ prompt = 'add_point:\n' \
          'enter command: '
 
 
-def calibrate_strain(interface: StrainGauge = s1, params: dict = None) -> str:
+@statuses('done')
+def calibrate_strain(interface: StrainGauge = None, params: dict = None) -> str:
     """
     returns either 'done' or 'error' as status condition
 
     :param interface: base interface abstraction layer that is performing an action.
     :param params: dictionary of the form {'param0':<val>, 'param1':<val>, ..., 'paramN':<val>}
     """
+    if interface is None:
+        interface = hal.s1
+    actuator = hal.actuator
     condition = 'error'
     choice = input(prompt)
     while choice != 'done':
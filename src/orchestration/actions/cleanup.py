@@ -13,9 +13,11 @@ Begins the shutdown state of the device.
 """
 
 from libs.hal import hal_cleanup
+from orchestration.actions import statuses
 
 
 # noinspection PyUnusedLocal
+@statuses('success')
 def cleanup(interface=None, params=None):
     """
     runs hal_cleanup() to safely reset pin configurations made over the course of usage.
@@ -10,11 +10,14 @@ Description:
 
 import sys
 from libs.utils import INF
-from libs.hal import actuator, hal_init
+from libs import hal
+from libs.hal import hal_init
 from time import perf_counter
+from orchestration.actions import statuses
 
 
-def oscillate(interface=actuator, params=None):
+@statuses('timeout_stopped', 'repeats_stopped', 'timeout_reset', 'repeats_reset')
+def oscillate(interface=None, params=None):
     """
     Moves from thresholds described in params dict with keys of 'low_pos', 'high_pos'.
     Movement speed is optionally defined in params dict with the 'speed' key.
@@ -34,6 +37,8 @@ def oscillate(interface=actuator, params=None):
         - 'repeats_reset'    - broke on a timeout and reset actuator to closest boundary point
         - 'error'            - triggers on any failure during oscillations
     """
+    if interface is None:
+        interface = hal.actuator
     hal_init()
     condition = 'stopped'
     low_pos = params['low_pos']
@@ -10,11 +10,14 @@ Description:
 
 import sys
 from libs.utils import INF
-from libs.hal import actuator, hal_init
+from libs import hal
+from libs.hal import hal_init
 from time import perf_counter
+from orchestration.actions import statuses
 
 
-def oscillate_force(interface=actuator, params=None):
+@statuses('timeout_stopped', 'repeats_stopped', 'timeout_reset', 'repeats_reset')
+def oscillate_force(interface=None, params=None):
     """
     Sets a minimum force. The moves back the prescribed displacement and back to a minimum force.
     The related keys are 'min_force', 'displacement' respectively.
@@ -35,6 +38,8 @@ def oscillate_force(interface=actuator, params=None):
         - 'repeats_reset'    - broke on a timeout and reset actuator to closest boundary point
         - 'error'            - triggers on any failure during oscillations
     """
+    if interface is None:
+        interface = hal.actuator
     # initialize hal pins
     hal_init()
     # set default condition
@@ -13,13 +13,16 @@ Description:
 from math import ceil
 from itertools import repeat, chain
 from typing import Union, Dict, Iterable
-from libs.hal import actuator, Actuator
+from libs import hal
+from libs.hal import Actuator
+from orchestration.actions import statuses
 
 
 # action_params: Dict[str, Union[str, int, float, Iterable]]
 
 
-def position_lut(interface: Actuator = actuator,
+@statuses('done')
+def position_lut(interface: Actuator = None,
                  params: Union[Dict[str, Union[str, int, float, Iterable]], None] = None) -> str:
     """
     Moves the actuator to each position sequentially.
@@ -38,6 +41,8 @@ def position_lut(interface: Actuator = actuator,
         'success': moved to next position in LUT
         'done': finished all entries in LUT
     """
+    if interface is None:
+        interface = hal.actuator
     condition = 'error'
     units = params.get('units', interface.units)
     positions = list(map(interface.convert_units[units], params['positions']))
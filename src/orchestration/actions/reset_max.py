@@ -10,9 +10,13 @@ Copyright (c):  2018 Danyal Ahsanullah
 License: N/A
 Description: 
 """
-from libs.hal import actuator
+from libs import hal
+from orchestration.actions import statuses
 
 
-def reset_max(interface=actuator, params=None):
+@statuses('success')
+def reset_max(interface=None, params=None):
+    if interface is None:
+        interface = hal.actuator
     interface.reset_max()
     return 'success'
@@ -11,9 +11,13 @@ License: N/A
 Description: 
 """
 
-from libs.hal import actuator
+from libs import hal
+from orchestration.actions import statuses
 
 
-def reset_min(interface=actuator, params=None):
+@statuses('success')
+def reset_min(interface=None, params=None):
+    if interface is None:
+        interface = hal.actuator
     interface.reset_min()
     return 'success'
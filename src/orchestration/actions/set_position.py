@@ -9,15 +9,20 @@ Copyright (c):  2018 Danyal Ahsanullah
 License: N/A
 Description: 
 """
-from libs.hal import Actuator, actuator
+from libs import hal
+from libs.hal import Actuator
+from orchestration.actions import statuses
 
 WAIT_TIMEOUT = 2
 
 
-def set_position(interface: Actuator = actuator, params=None):
+@statuses('success', 'terminated')
+def set_position(interface: Actuator = None, params=None):
     """
     allow manual setting of position of actuator.
     """
+    if interface is None:
+        interface = hal.actuator
     speed_ctrl = interface.speed_controller
     pos_sense = interface.position_sensor
     speed_ctrl.set_voltage(speed_ctrl.stop)
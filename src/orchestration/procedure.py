@@ -13,14 +13,17 @@ Description:
 
 import yaml
 from sys import exit as _exit
+from threading import Thread as _Thread
+from traceback import print_exc as _print_exc
 from collections.abc import Mapping as _Mapping
-from typing import Iterable as _Iterable, Dict as _Dict
+from typing import Iterable as _Iterable, Dict as _Dict, FrozenSet as _FrozenSet, List as _List
 
 from libs.data_router import DataLogger
 from libs.utils import yamlobj, ReprMixIn
-from libs.hal import hal_cleanup, A2D, actuator
-from orchestration.routines import Routine
-from orchestration.actions import END_ACTION, ERROR_ACTION
+from libs import hal
+from libs.hal import hal_cleanup, A2D
+from orchestration.routines import END, Routine
+from orchestration.actions import ERROR_ACTION
 
 
 @yamlobj('!Config')
@@ -32,7 +35,10 @@ class Config(_Mapping, ReprMixIn):
     accepted_adc_channels = A2D.accepted_channels
 
     def __init__(self, version, len_units, force_units, upper_limit, lower_limit, pos_adc_sample_rate, pos_adc_gain,
-                 strain_adc_sample_rate, strain_adc_gain, pos_adc_channel=1, strain_adc_channel=3, period: float = 0.1):
+                 strain_adc_sample_rate, strain_adc_gain, pos_adc_channel=1, strain_adc_channel=3, period: float = 0.1,
+                 log_frames: bool = False, log_rotate_mb: float = None, log_rotate_minutes: float = None,
+                 log_compression: str = 'gzip', log_records: _Iterable[str] = (),
+                 log_sensors: _Iterable[str] = hal.POLLED):
         # validation starts at units, version must exist
         if any(unit in self.accepted_units for unit in (len_units, force_units)) and version:
             # to be used for future releases
@@ -41,9 +47,19 @@ class Config(_Mapping, ReprMixIn):
             self.len_units = len_units
             self.force_units = force_units
             self.period = period
-            # limits for actuator, stored and used in calculations as raw adc level
-            self.upper_limit = actuator.convert_units[self.len_units](upper_limit)
-            self.lower_limit = actuator.convert_units[self.len_units](lower_limit)
+            # log each poll round as one record in a single file, see DataLogger
+            self.log_frames = log_frames
+            # split logs into compressed segments by size and/or age, see libs.log_rotation
+            self.log_rotate_mb = log_rotate_mb
+            self.log_rotate_minutes = log_rotate_minutes
+            self.log_compression = log_compression
+            # fixed schema topics to log as binary record files readable as numpy memmaps, see libs.log_mmap
+            self.log_records = list(log_records)
+            # polled devices (see hal.POLLED) built when logging starts, so the ones no routine uses are logged too
+            bad_sensors = set(log_sensors) - set(hal.POLLED)
+            if bad_sensors:
+                raise ValueError('Invalid sensor(s) to log: {!s}'.format(sorted(bad_sensors)))
+            self.log_sensors = list(log_sensors)
             # configuration for position adc channel
             if pos_adc_sample_rate in self.accepted_adc_sample_rates:
                 self.pos_adc_sample_rate = pos_adc_sample_rate
@@ -70,6 +86,12 @@ class Config(_Mapping, ReprMixIn):
                 self.strain_adc_channel = strain_adc_channel
             else:
                 raise ValueError('Invalid differential channel provided: {!s}'.format(strain_adc_channel))
+            # limits for actuator, stored and used in calculations as raw adc level.
+            # converted with the procedure's position adc gain from class constants, so validation builds no device
+            # (devices are built once hal.configure() applied the procedure's settings)
+            step_size = A2D.step_size_for(self.pos_adc_gain)
+            self.upper_limit = hal.Actuator.level_from_length(upper_limit, self.len_units, step_size)
+            self.lower_limit = hal.Actuator.level_from_length(lower_limit, self.len_units, step_size)
         else:
             raise ValueError('Bad YAML configuration')
 
@@ -96,54 +118,122 @@ def load_procedure(path):
         return cfg
 
 
+class _RoutineThread(_Thread):
+    """runs a routine that declared its resources, owning them for as long as it runs"""
+
+    def __init__(self, routine: Routine, resources: _FrozenSet[str]):
+        super().__init__(name=f'routine {routine.name}', daemon=True)
+        self.routine = routine
+        self.resources = resources
+        self.failed = False
+
+    def run(self):
+        try:
+            hal.claim(self.resources)
+            print('executing routine: {}'.format(self.routine.name))
+            ProcedureExecutor.execute_routine(self.routine)
+        except SystemExit:
+            # execute_routine already reported the error and reset this routine's devices
+            self.failed = True
+        except BaseException:
+            _print_exc()
+            self.failed = True
+        finally:
+            hal.release()
+
+
 class ProcedureExecutor:
     """
-    class that handles executing routines
+    class that handles executing routines.
+    routines run in order, except routines that declare their resources: those run alongside each other
+    as long as they do not share a resource (or a device a resource is built on).
     """
 
-    routines = []
-
-    def __init__(self, cfg: _Dict, routines: _Iterable[Routine]):
-        self.routines.extend(routines)
-        self.logger = DataLogger(config=cfg)
+    def __init__(self, cfg: _Dict, routines: _Iterable[Routine], poll: bool = True, outdir: str = None):
+        """
+        :param cfg: procedure configuration
+        :param routines: routines to run, in order
+        :param poll: poll the sensors from a thread, see DataLogger
+        :param outdir: directory to write logs to, see DataLogger
+        """
+        self.routines = list(routines)
+        # malformed routines fail here, before any hardware is touched or any log is opened
+        for routine in self.routines:
+            if routine.exec:
+                routine.compile()
+        # devices not built yet are built with the procedure's adc settings
+        hal.configure(cfg)
+        rotate_mb = getattr(cfg, 'log_rotate_mb', None)
+        rotate_minutes = getattr(cfg, 'log_rotate_minutes', None)
+        self.logger = DataLogger(config=cfg, outdir=outdir, poll=poll, frame=getattr(cfg, 'log_frames', False),
+                                 max_bytes=None if rotate_mb is None else int(rotate_mb * 1e6),
+                                 max_seconds=None if rotate_minutes is None else rotate_minutes * 60,
+                                 compression=getattr(cfg, 'log_compression', 'gzip'),
+                                 records=getattr(cfg, 'log_records', ()),
+                                 sensors=getattr(cfg, 'log_sensors', hal.POLLED))
 
     def run(self):
         import time
         start = time.time()
+        workers: _List[_RoutineThread] = []
         for routine in self.routines:
-            print('executing routine: {}'.format(routine.name))
-            self.execute_routine(routine)
+            if routine.resources is None:
+                # runs alone, once every routine started before it is done
+                self._wait(workers, workers)
+                print('executing routine: {}'.format(routine.name))
+                self.execute_routine(routine)
+                continue
+            resources = hal.expand_resources(routine.resources)
+            # routines sharing a resource still run in order
+            self._wait([worker for worker in workers if worker.resources & resources], workers)
+            worker = _RoutineThread(routine, resources)
+            worker.start()
+            workers.append(worker)
+        self._wait(workers, workers)
         print(time.time() - start)
 
+    @staticmethod
+    def _wait(waiting: _List[_RoutineThread], workers: _List[_RoutineThread]):
+        """
+        waits for routines to finish. once any routine has failed, no further routines are started:
+        the ones still running are finished, then everything is cleaned up and the procedure exits.
+        """
+        for worker in waiting:
+            worker.join()
+        if any(worker.failed for worker in workers):
+            for worker in workers:
+                worker.join()
+            hal_cleanup()
+            _exit(1)
+
     @staticmethod
     def execute_routine(routine):
         if not routine.exec:
             # routine is not meant to be executed
             print('routine not set for exec')
             return
+        compiled = routine.compile()
+        execute, any_status, table = compiled.execute, compiled.any, compiled.table
         # start on start state
-        transitions = routine.transitions
-        current_action = routine.actions['START']
+        state = 0
         status = 'not_started'
         try:
-            while current_action is not END_ACTION:
-                status = current_action.execute()
-                # print(status, current_action.name, transitions)
-                # #todo: remove if not simulating
-                # from time import sleep
-                # from random import uniform
-                # sleep(uniform(0.05,5))
+            while state != END:
+                status = execute[state]()
                 # process status like for boolean actions
                 if status == 'error':
                     # raise warning
                     ERROR_ACTION.execute()
                     break
-                if '*' in transitions[current_action.name]:
-                    status = '*'
-                current_action = routine.actions[transitions[current_action.name][status]]
+                following = any_status[state]
+                if following is None:
+                    following = table[state].get(status)
+                    if following is None:
+                        raise RuntimeError(f'no transition for status {status!r}')
+                state = following
         except RuntimeError as e:  # error states trigger a runtime Error
             print(e)
-            print('ERROR during {} with {} (status of {})'.format(routine.name, current_action.name, status))
+            print('ERROR during {} with {} (status of {})'.format(routine.name, compiled.states[state], status))
             hal_cleanup()
             _exit(1)
 
@@ -11,11 +11,26 @@ License: N/A
 Description: import available routines here
 """
 
-from typing import Union, Dict
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Tuple, Union
 
 from libs.utils import yamlobj
 from orchestration.actions import START_ACTION, END_ACTION, ERROR_ACTION
 
+# successor of the final state, the routine is complete
+END = -1
+# alternative spellings of the built in states, see readme.md
+STATE_ALIASES = {'Start': 'START', 'End': 'END', 'ERR': 'ERROR', 'Error': 'ERROR'}
+
+
+class RoutineError(ValueError):
+    """raised for routines whose transitions can not be executed, with every problem found"""
+
+    def __init__(self, routine: str, problems: List[str]):
+        self.routine = routine
+        self.problems = problems
+        super().__init__(f'routine {routine!r} is invalid:\n  ' + '\n  '.join(problems))
+
 
 @yamlobj('!Routine')
 class Routine:
@@ -23,7 +38,12 @@ class Routine:
     type = 'RTN'
 
     def __init__(self, name: str, len_units: str, force_units: str, actions: Dict[str, Union[None, Dict[str, Union[None, str, int, float]]]],
-                 transitions=None, exec=True, output: str = 'stdout'):
+                 transitions=None, exec=True, output: str = 'stdout', resources: Union[Iterable[str], None] = None):
+        """
+        :param resources: devices (eg: actuator, s1, t2) and other resources (eg: pump) the routine drives.
+            routines that declare them run alongside the other routines whose resources they do not share,
+            routines that do not run alone.
+        """
         self.name = name
         self.len_units = len_units
         self.force_units = force_units
@@ -33,6 +53,73 @@ class Routine:
         self.actions['END'] = END_ACTION
         self.actions.setdefault('ERROR', ERROR_ACTION)
         self.output = output
+        # kept as given, yaml fills in nested sequences after the routine is constructed
+        self.resources = resources
         self.transitions = transitions if transitions is not None else {'START': {'*': 'ERROR'}}
         self.transitions.setdefault('START', {'*': 'ERROR'})
         # self.transitions.setdefault('ERROR', {'*': 'END'})
+        self._compiled: Union['CompiledRoutine', None] = None
+
+    def compile(self) -> 'CompiledRoutine':
+        """validated state table of the routine, built once. changes to actions/transitions after are not seen."""
+        if self._compiled is None:
+            self._compiled = CompiledRoutine(self)
+        return self._compiled
+
+
+class CompiledRoutine:
+    """
+    routine as a table indexed by integer state, START being state 0.
+    each state has the execute method of its action, an unconditional successor (or None)
+    and a map of status -> successor, successors are state indexes or END.
+    """
+
+    def __init__(self, routine: Routine):
+        self.name = routine.name
+        problems = []
+        actions = {STATE_ALIASES.get(name, name): action for name, action in routine.actions.items()}
+        transitions = {}
+        for source, table in routine.transitions.items():
+            source = STATE_ALIASES.get(source, source)
+            if source not in actions:
+                problems.append(f'transitions given for unknown state {source!r}')
+                continue
+            transitions[source] = {status: STATE_ALIASES.get(target, target) for status, target in table.items()}
+            for status, target in transitions[source].items():
+                if target not in actions:
+                    problems.append(f'{source!r} transitions on {status!r} to unknown state {target!r}')
+        # states in the order they are first reached from START
+        order = ['START']
+        queue = deque(order)
+        while queue:
+            for target in transitions.get(queue.popleft(), {}).values():
+                if target in actions and target not in order and target != 'END':
+                    order.append(target)
+                    queue.append(target)
+        for name in actions:
+            if name not in order and name not in ('END', 'ERROR'):
+                problems.append(f'state {name!r} is unreachable from START')
+        if 'ERROR' not in order:
+            order.append('ERROR')
+        for name in order:
+            action = actions[name]
+            if name not in transitions:
+                # the default error action raises, so it never needs a successor
+                if action is not ERROR_ACTION:
+                    problems.append(f'state {name!r} has no transitions')
+                continue
+            statuses = getattr(getattr(action, 'action', None), 'statuses', None)
+            if statuses is not None and '*' not in transitions[name]:
+                missing = [status for status in statuses if status not in transitions[name]]
+                if missing:
+                    problems.append(f'state {name!r} has no transitions for status(es) {missing}')
+        if problems:
+            raise RoutineError(self.name, problems)
+        index = {name: number for number, name in enumerate(order)}
+        index['END'] = END
+        self.states: Tuple[str, ...] = tuple(order)
+        self.execute: Tuple[Callable, ...] = tuple(actions[name].execute for name in order)
+        self.any: Tuple[Union[int, None], ...] = tuple(
+            index[transitions[name]['*']] if '*' in transitions.get(name, {}) else None for name in order)
+        self.table: Tuple[Dict[str, int], ...] = tuple(
+            {status: index[target] for status, target in transitions.get(name, {}).items()} for name in order)
@@ -28,20 +28,14 @@ import Adafruit_GPIO
 
 # Local Imports
 from libs import MAX31856
+from libs.live_plot import LivePlot
 
 # import time, math
 from time import sleep, strftime, time
 
-import matplotlib.pyplot as plt
-
-plt.ion()
-x_time = []
-sensor_internal = []
-sensor_external = []
-sensor2_internal = []
-sensor2_external = []
-sensor3_internal = []
-sensor3_external = []
+# plotted from a separate process, acquisition only writes to fixed size shared memory rings
+plot = LivePlot([('CH1', 'EXT'), ('CH1', 'INT'), ('CH2', 'INT'), ('CH3', 'INT')], window=3000, listen=False)
+plot.start()
 
 # Uncomment one of the blocks of code below to configure your Pi to use software or hardware SPI.
 
@@ -74,22 +68,6 @@ def write_temp(timestamp, temp, internal, temp2, internal2, temp3, internal3):
                   )
 
 
-def graph():
-    plt.clf()
-    # plt.scatter(x,y,y2)
-    plt.subplot(2,1,1)
-    plt.plot(x_time, sensor_external, color='r', linestyle='-', label='CH1:EXT')
-#    plt.plot(x_time, sensor3_external, color='g', linestyle='-', label='CH3:EXT')
-#    plt.plot(x_time, sensor2_external, color='b', linestyle='-', label='CH2:EXT')
-    plt.legend(loc='upper right')
-    plt.subplot(2,1,2)
-    plt.plot(x_time, sensor_internal, color='r', linestyle='-.', label='CH1:INT')
-    plt.plot(x_time, sensor2_internal, color='b', linestyle='-.', label='CH2:INT')
-    plt.plot(x_time, sensor3_internal, color='g', linestyle='-.', label='CH3:INT')
-    plt.legend(loc='upper right')
-    plt.pause(0.0001)
-
-
 print('Press Ctrl-C to quit.')
 start = time()
 while True:
@@ -102,13 +80,8 @@ while True:
     temp3 = sensor3.read_temp_c()
     internal3 = sensor3.read_internal_temp_c()
 
-    x_time.append(seconds - start)
-    sensor_internal.append(internal)
-    sensor_external.append(temp)
-    sensor2_internal.append(internal2)
-    sensor2_external.append(temp2)
-    sensor3_internal.append(internal3)
-    sensor3_external.append(temp3)
+    for trace, value in enumerate((temp, internal, internal2, internal3)):
+        plot.add(trace, seconds - start, value)
 
     print('Thermocouple Temperature1: {0:0.3F}*C'.format(temp))
     print('    Internal Temperature1: {0:0.3F}*C'.format(internal))
@@ -120,5 +93,4 @@ while True:
     # time.sleep(1.0)
 
     write_temp(time_stamp, temp, internal, temp2, internal2, temp3, internal3)
-    graph()
     sleep(0.1)
@@ -12,7 +12,7 @@ Description:
 """
 from random import uniform, choice, randrange
 from unittest import TestCase
-from libs.hal import _ADS1115 as A2D
+from libs.hal.adc import ADS1115Interface as A2D
 from copy import deepcopy
 
 
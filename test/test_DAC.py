@@ -13,7 +13,7 @@ Description:
 from copy import deepcopy
 from random import randrange, uniform, choice
 from unittest import TestCase
-from libs.hal import _MCP4725 as DAC
+from libs.hal.dac import MCP4725Interface as DAC
 
 
 class TestDAC(TestCase):
@@ -0,0 +1,62 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_actions.py
+Author: Danyal Ahsanullah
+Date: 8/28/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description:
+"""
+import os
+import sys
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from orchestration.actions import ActionMap, action_map
+
+
+class TestActionMap(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.package = os.path.join(self.tmp.name, 'lazy_actions')
+        os.mkdir(self.package)
+        open(os.path.join(self.package, '__init__.py'), 'w').close()
+        with open(os.path.join(self.package, 'wiggle.py'), 'w') as file:
+            file.write("def wiggle(interface=None, params=None):\n    return 'success'\n")
+        sys.path.insert(0, self.tmp.name)
+
+    def tearDown(self):
+        sys.path.remove(self.tmp.name)
+        for module in ('lazy_actions', 'lazy_actions.wiggle'):
+            sys.modules.pop(module, None)
+        self.tmp.cleanup()
+
+    def test_lazy(self):
+        actions = ActionMap('lazy_actions', self.package)
+        self.assertIn('WIGGLE', actions)
+        self.assertNotIn('lazy_actions.wiggle', sys.modules, 'action imported before use')
+        self.assertEqual(actions['WIGGLE'](), 'success')
+        self.assertIn('lazy_actions.wiggle', sys.modules)
+        with self.assertRaises(KeyError):
+            actions['MISSING']
+
+    def test_plugins(self):
+        entry_point = MagicMock()
+        entry_point.name = 'plugged'
+        entry_point.load.return_value = lambda interface=None, params=None: 'plugged'
+        with patch('orchestration.actions._entry_points', return_value=[entry_point]):
+            actions = ActionMap('lazy_actions', self.package)
+            actions.register('shake', 'lazy_actions.wiggle:wiggle')
+            actions['TWIST'] = lambda interface=None, params=None: 'twisted'
+            self.assertEqual(sorted(actions), ['PLUGGED', 'SHAKE', 'TWIST', 'WIGGLE'])
+            self.assertEqual(actions['PLUGGED'](), 'plugged')
+            self.assertEqual(actions['SHAKE'](), 'success')
+            self.assertEqual(actions['TWIST'](), 'twisted')
+
+    def test_bundled(self):
+        # found relative to the package, not the working directory
+        self.assertIn('RESET_MIN', action_map)
+        self.assertIn('START', action_map)
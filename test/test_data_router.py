@@ -0,0 +1,139 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_data_router.py
+Author: Danyal Ahsanullah
+Date: 8/20/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description:
+"""
+import os
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from unittest import TestCase
+from unittest.mock import patch
+import numpy as np
+from pubsub import pub
+# hal first, data_router and the hal modules import each other
+import libs.hal
+from libs.data_router import PUBLISH_FUNCS, DataLogger, close_loggers, query_sensors
+from libs.hal.constants import held, hold
+from libs.log_rotation import compressor, iter_log, segments
+from libs.log_durability import recover
+from libs.log_mmap import open_record_log
+
+CONFIG = {'len_units': 'mm', 'force_units': 'N'}
+
+
+class TestDataLogger(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+
+    def tearDown(self):
+        # loggers left open keep listening and would share messages with later tests
+        close_loggers()
+        compressor.join()
+        self.tmp.cleanup()
+
+    def read(self, logger, name, flush=True):
+        if flush:
+            logger.logs[name].flush()
+        with open(logger.topic_map[name]) as file:
+            return [line for line in file.read().splitlines() if not line.startswith('#')]
+
+    def test_frame(self):
+        logger = DataLogger(config=CONFIG, outdir=self.tmp.name, frame=True, poll=False)
+        self.assertNotIn('strain', logger.logs, 'per topic log opened in frame mode')
+        pub.sendMessage('strain', data={'strain': 0.25})
+        pub.sendMessage('thermocouple', data={'meta': 'fluid', 'temp': 25.0, 'internal_temp': 24.0,
+                                              'acq_ts': logger.start + 1.5, 'fault': 0, 'valid': True})
+        logger.record_frame(logger.start + 2.0)
+        logger.record_frame(logger.start + 2.1)
+        pub.sendMessage('actuator.speed', data={'speed': 3})
+        logger.record_frame(logger.start + 2.2)
+        header, first, second = self.read(logger, 'frame')
+        columns = header.split(', ')
+        first, second = dict(zip(columns, first.split(','))), dict(zip(columns, second.split(',')))
+        self.assertEqual(len(columns), len(first), 'record width mismatch')
+        self.assertAlmostEqual(float(first['round time (s)']), 2.0, 6)
+        self.assertEqual(first['strain strain'], '0.25')
+        self.assertAlmostEqual(float(first['thermocouple.fluid time (s)']), 1.5, 6, 'acquisition time not kept')
+        self.assertEqual(first['thermocouple.fluid valid'], '1')
+        self.assertEqual(first['thermocouple.sample temp'], '', 'unsampled channel not left empty')
+        self.assertAlmostEqual(float(second['round time (s)']), 2.2, 6, 'empty round written')
+        self.assertEqual(second['strain strain'], '', 'sample repeated in the next round')
+
+    def test_rotation(self):
+        logger = DataLogger(config=CONFIG, outdir=self.tmp.name, poll=False, max_bytes=400, compression='gzip')
+        for strain in range(100):
+            pub.sendMessage('strain', data={'strain': strain})
+        logger.logs['strain'].flush()
+        compressor.join()
+        self.assertGreater(len(segments(logger.topic_map['strain'])), 1, 'log not rotated')
+        self.assertEqual([int(line.split(',')[1]) for line in iter_log(logger.topic_map['strain'], header=False)],
+                         list(range(100)), 'records lost across segments')
+
+    def test_lifecycle(self):
+        with patch('libs.data_router.PUBLISH_FUNCS', []):
+            with DataLogger(config={**CONFIG, 'period': 0.01}, outdir=self.tmp.name, flush_every=1) as logger:
+                pub.sendMessage('strain', data={'strain': 1})
+                # flushed after every record, readable before close
+                lines = self.read(logger, 'strain', flush=False)
+                self.assertEqual(len(lines), 2, 'record not flushed')
+                self.assertEqual(lines[1].split(',')[1], '1')
+            self.assertTrue(all(file.closed for file in logger.logs.values()), 'logs left open')
+            self.assertFalse(logger.timerThread.is_alive(), 'polling thread left running')
+            pub.sendMessage('strain', data={'strain': 2})
+            logger.close()
+
+    def test_recover(self):
+        path = os.path.join(self.tmp.name, 'strain.csv')
+        with open(path, 'w') as file:
+            file.write('# comment:,\ntime (s), strain (%)\n0.1,1\n0.2,1.')
+        self.assertEqual(len(recover([self.tmp.name])), 1)
+        with open(path) as file:
+            self.assertEqual(file.read(), '# comment:,\ntime (s), strain (%)\n0.1,1\n', 'torn record not truncated')
+        self.assertEqual(recover([path]), [], 'intact log modified')
+
+    def test_records(self):
+        with self.assertRaises(ValueError):
+            DataLogger(config=CONFIG, outdir=self.tmp.name, poll=False, records=('thermocouple',))
+        logger = DataLogger(config=CONFIG, outdir=self.tmp.name, frame=True, poll=False,
+                            records=('strain', 'strain_burst'))
+        self.assertNotIn('strain', logger.logs, 'csv log opened for a record topic')
+        pub.sendMessage('strain', data={'strain': 0.5, 'acq_ts': logger.start + 1.0})
+        pub.sendMessage('strain_burst', data={'strain': np.array([0.1, 0.2]), 'raw': np.array([10, 20]),
+                                              'acq_ts': logger.start + np.array([2.0, 2.1])})
+        strain = open_record_log(logger.topic_map['strain'])
+        self.assertEqual(strain['strain'].tolist(), [0.5])
+        self.assertAlmostEqual(strain['ts'][0], 1.0, 6)
+        self.assertEqual(open_record_log(logger.topic_map['strain_burst'])['raw'].tolist(), [10, 20])
+        self.assertNotIn('strain strain', self.read(logger, 'frame')[0], 'record topic kept in frames')
+        logger.close()
+        self.assertTrue(all(file.closed for file in logger.records.values()), 'record logs left open')
+
+
+class TestQuerySensors(TestCase):
+    def test_reentrant_lock(self):
+        # polled reads that take the hal LOCK themselves (eg: OpenScale.get_reading) run inside the poll round
+        reads = []
+
+        def read():
+            with hold():
+                reads.append(held())
+
+        stop = Event()
+        saved = list(PUBLISH_FUNCS)
+        PUBLISH_FUNCS[:] = [read]
+        try:
+            thread = Thread(target=query_sensors, args=(0.001, lambda start: stop.set(), stop), daemon=True)
+            thread.start()
+            thread.join(timeout=2.0)
+        finally:
+            PUBLISH_FUNCS[:] = saved
+        self.assertFalse(thread.is_alive(), 'poll round deadlocked on the hal LOCK')
+        self.assertEqual(reads, [True])
+        self.assertFalse(held())
@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_hal.py
+Author: Danyal Ahsanullah
+Date: 8/26/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description:
+"""
+from types import ModuleType
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+import libs.hal as hal
+
+
+class TestLazyHal(TestCase):
+    def setUp(self):
+        # fresh registry, the serial port of the load cell is not opened
+        patchers = (patch.dict(hal.DEVICES, clear=True), patch.dict(hal.HAL_CONFIG),
+                    patch.dict(hal._FACTORIES, load_cell=MagicMock))
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_no_devices_at_import(self):
+        from launch import parser
+        parser.parse_args([])
+        self.assertEqual(hal.DEVICES, {}, 'devices built by cli parsing')
+
+    def test_build_on_access(self):
+        hal.configure({'pos_adc_channel': 2, 'pos_adc_gain': 2, 'version': '0.0.1'})
+        actuator = hal.actuator
+        self.assertNotIsInstance(actuator, ModuleType, 'submodule returned instead of the device')
+        self.assertEqual(sorted(hal.DEVICES), ['actuator', 'adc', 'dac', 'load_cell'])
+        self.assertIs(hal.actuator, actuator, 'device built twice')
+        self.assertIs(actuator.position_sensor, hal.adc)
+        self.assertEqual((hal.adc.default_channel, hal.adc.gain), (2, 2), 'configuration not applied')
+        self.assertNotIn('t1', hal.DEVICES, 'unused device built')
+
+    def test_claims(self):
+        from threading import Thread
+        self.addCleanup(hal.release)
+        self.assertEqual(hal.claim(['actuator', 'pump']), {'actuator', 'adc', 'dac', 'load_cell', 'pump'})
+        hal.actuator
+        with self.assertRaises(hal.DeviceBusy):
+            hal.get_device('t1')
+        errors = []
+
+        def other():
+            try:
+                hal.claim(['s1'])
+            except hal.DeviceBusy as error:
+                errors.append(error)
+            finally:
+                hal.release()
+        thread = Thread(target=other)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(errors), 1, 'shared adc claimed twice')
+        self.assertIn('adc', str(errors[0]))
+        hal.release()
+        self.assertEqual(hal.claimed(), frozenset())
+        hal.get_device('dac')
+
+    def test_config_limits(self):
+        from orchestration.procedure import Config
+        cfg = Config(version='0.0.1', len_units='in', force_units='N', upper_limit=6.0, lower_limit=1.5,
+                     pos_adc_sample_rate=128, pos_adc_gain=2, strain_adc_sample_rate=860, strain_adc_gain=4)
+        self.assertEqual(hal.DEVICES, {}, 'devices built by config validation')
+        hal.configure(cfg)
+        actuator = hal.actuator
+        for limit, length in ((cfg.upper_limit, 6.0), (cfg.lower_limit, 1.5)):
+            self.assertIsInstance(limit, int)
+            self.assertAlmostEqual(actuator.convert_units['in'](limit), length, delta=actuator.distance_per_level)
+        self.assertEqual((actuator.pos_limit_low, actuator.pos_limit_high), (cfg.lower_limit, cfg.upper_limit))
@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_instrumentation.py
+Author: Danyal Ahsanullah
+Date: 8/30/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: hot path timing histograms and counters.
+"""
+import os
+import json
+from tempfile import TemporaryDirectory
+from threading import Event
+from unittest import TestCase
+
+from pubsub import pub
+
+from libs import instrumentation
+from libs.instrumentation import Histogram, Instruments, bucket_index, bucket_low, instruments, timed
+from libs.data_router import PUBLISH_FUNCS, DataLogger, publish, query_sensors
+from libs.controller import PController
+
+
+class TestHistogram(TestCase):
+    def test_buckets(self):
+        precision = 2 ** -instrumentation.SUB_BUCKET_BITS
+        last = -1
+        for value in (*range(200), 1000, 12345, 10 ** 6, 123456789, 2 ** 40 + 3):
+            index = bucket_index(value)
+            self.assertGreaterEqual(index, last)
+            last = index
+            low = bucket_low(index)
+            self.assertLessEqual(low, value)
+            self.assertLess(value, bucket_low(index + 1))
+            self.assertLessEqual(value - low, precision * value)
+
+    def test_percentiles(self):
+        hist = Histogram()
+        for value in range(1, 10001):
+            hist.record(value * 1000)
+        self.assertEqual((hist.count, hist.min, hist.max), (10000, 1000, 10 ** 7))
+        for percent in (50, 90, 99):
+            self.assertAlmostEqual(hist.percentile(percent), percent * 10 ** 5, delta=percent * 10 ** 5 / 16)
+        self.assertEqual(hist.percentile(100), 10 ** 7)
+        summary = hist.to_dict()
+        self.assertAlmostEqual(summary['mean_us'], 5000.5)
+        self.assertEqual(sum(summary['buckets'].values()), 10000)
+
+
+class TestInstruments(TestCase):
+    def setUp(self):
+        instruments.reset()
+        instruments.enable()
+
+    def tearDown(self):
+        instruments.disable()
+        instruments.reset()
+
+    def test_toggle(self):
+        local = Instruments()
+
+        @timed('work', registry=local)
+        def work(value):
+            return value * 2
+
+        self.assertEqual(work(2), 4)
+        local.count('calls')
+        self.assertEqual((local.histograms, local.counters), ({}, {}), 'recorded while disabled')
+        local.enable()
+        self.assertEqual(work(3), 6)
+        local.count('calls', 2)
+        with local.span('block'):
+            pass
+        self.assertFalse(local.toggle())
+        work(4)
+        self.assertEqual(local.histograms['work'].count, 1)
+        self.assertEqual(local.histograms['block'].count, 1)
+        self.assertEqual(local.counters, {'calls': 2})
+
+    def test_publish_and_poll(self):
+        listened = []
+
+        def listener(data, topic=pub.AUTO_TOPIC):
+            listened.append(data)
+
+        reader = publish('actuator.speed', ('speed',))(lambda: 7)
+        pub.subscribe(listener, 'actuator.speed')
+        saved = list(PUBLISH_FUNCS)
+        try:
+            with TemporaryDirectory() as outdir:
+                with DataLogger(config={'len_units': 'raw', 'force_units': 'N'}, outdir=outdir, poll=False):
+                    PUBLISH_FUNCS[:] = [reader]
+                    stop = Event()
+                    query_sensors(0.001, on_round=lambda start: stop.set(), stop=stop)
+                    self.assertEqual(reader(), 7)
+        finally:
+            PUBLISH_FUNCS[:] = saved
+            pub.unsubscribe(listener, 'actuator.speed')
+        self.assertEqual(listened, [{'speed': 7}] * 2)
+        snapshot = instruments.snapshot()
+        histograms = snapshot['histograms']
+        for name in ('publish.actuator.speed.read', 'publish.actuator.speed.dispatch', 'logger.record_data'):
+            self.assertEqual(histograms[name]['count'], 2, name)
+        self.assertEqual(histograms['poll.round']['count'], 1)
+        self.assertEqual(snapshot['counters']['poll.rounds'], 1)
+        # dispatch includes the logger's write
+        self.assertGreaterEqual(histograms['publish.actuator.speed.dispatch']['max_us'],
+                                histograms['logger.record_data']['min_us'])
+
+    def test_controller_and_dump(self):
+        outputs = []
+        ctrl = PController(1.0, input_func=lambda: 1.0, output_func=outputs.append, desired_reference=2.0)
+        for _ in range(5):
+            ctrl.process()
+        instruments.disable()
+        ctrl.process()
+        self.assertEqual(len(outputs), 6)
+        with TemporaryDirectory() as outdir:
+            path = os.path.join(outdir, 'snapshot.json')
+            instruments.dump(path)
+            with open(path) as file:
+                snapshot = json.load(file)
+        self.assertEqual(snapshot['histograms']['controller.process']['count'], 5)
+        self.assertFalse(snapshot['enabled'])
+        self.assertIn('controller.process', instrumentation.report(snapshot))
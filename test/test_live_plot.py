@@ -0,0 +1,68 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_live_plot.py
+Author: Danyal Ahsanullah
+Date: 8/25/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description:
+"""
+import multiprocessing as mp
+from unittest import TestCase
+import numpy as np
+from pubsub import pub
+# hal first, data_router and the hal modules import each other
+import libs.hal
+from libs.live_plot import LivePlot, SharedRing
+
+
+def _read_ring(name, window, queue):
+    ring = SharedRing(window, name=name)
+    queue.put(ring.snapshot())
+    ring.close()
+
+
+class TestSharedRing(TestCase):
+    def test_wrap(self):
+        ring = SharedRing(8)
+        try:
+            self.assertEqual(ring.snapshot().shape, (0, 2))
+            for i in range(20):
+                ring.append((i, i * 2.0))
+            rows = ring.snapshot()
+            self.assertEqual(rows[:, 0].tolist(), list(range(13, 20)), 'rows not oldest first')
+            self.assertEqual(ring.count, 20)
+        finally:
+            ring.close()
+
+    def test_other_process(self):
+        ring = SharedRing(16)
+        try:
+            for i in range(5):
+                ring.append((i, -i))
+            queue = mp.Queue()
+            reader = mp.Process(target=_read_ring, args=(ring.name, 16, queue))
+            reader.start()
+            rows = queue.get(timeout=10)
+            reader.join()
+            np.testing.assert_array_equal(rows, [[i, -i] for i in range(5)])
+        finally:
+            ring.close()
+
+
+class TestLivePlot(TestCase):
+    def test_record(self):
+        with LivePlot([('thermocouple.fluid', 'temp'), ('strain_burst', 'strain')], window=8) as plot:
+            self.assertEqual(plot.topics, {'thermocouple', 'strain_burst'})
+            pub.sendMessage('thermocouple', data={'meta': 'fluid', 'temp': 25.0, 'internal_temp': 24.0,
+                                                  'acq_ts': plot.start_time + 1.5, 'fault': 0, 'valid': True})
+            pub.sendMessage('thermocouple', data={'meta': 'sample', 'temp': 30.0, 'internal_temp': 24.0,
+                                                  'fault': 0, 'valid': True})
+            pub.sendMessage('strain_burst', data={'strain': np.array([0.1, 0.2]), 'raw': np.array([10, 20]),
+                                                  'acq_ts': plot.start_time + np.array([2.0, 2.1])})
+            temp, strain = (ring.snapshot() for ring in plot.rings)
+            np.testing.assert_allclose(temp, [[1.5, 25.0]])
+            np.testing.assert_allclose(strain, [[2.0, 0.1], [2.1, 0.2]])
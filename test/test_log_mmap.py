@@ -0,0 +1,56 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_log_mmap.py
+Author: Danyal Ahsanullah
+Date: 8/23/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description:
+"""
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import numpy as np
+from libs.log_mmap import HEADER_SIZE, RecordLog, open_record_log
+
+DTYPE = [('ts', '<f8'), ('value', '<f8'), ('raw', '<i2')]
+
+
+class TestRecordLog(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'test.rec')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_growth(self):
+        log = RecordLog(self.path, DTYPE, chunk_records=16)
+        for i in range(100):
+            log.append((i * 0.1, i * 2.0, i))
+        self.assertGreaterEqual(log.capacity, 100)
+        self.assertEqual(os.path.getsize(self.path), HEADER_SIZE + log.capacity * log.dtype.itemsize,
+                         'file not preallocated in chunks')
+        log.close()
+        self.assertEqual(os.path.getsize(self.path), HEADER_SIZE + 100 * log.dtype.itemsize, 'file not trimmed')
+        records = open_record_log(self.path)
+        np.testing.assert_array_equal(records['raw'], np.arange(100))
+        np.testing.assert_allclose(records['value'], np.arange(100) * 2.0)
+
+    def test_live_read(self):
+        log = RecordLog(self.path, DTYPE, chunk_records=8)
+        self.assertEqual(len(open_record_log(self.path)), 0)
+        log.append({'ts': 0.0, 'value': 1.5, 'raw': 3})
+        log.extend({'ts': np.arange(10.0), 'value': np.ones(10), 'raw': np.arange(10, dtype=np.int16)})
+        # readable while the log is still open, without flushing
+        records = open_record_log(self.path)
+        self.assertEqual(len(records), 11)
+        self.assertEqual(records['value'][0], 1.5)
+        self.assertEqual(records['raw'][-1], 9)
+        log.extend(records[:2])
+        self.assertEqual(len(open_record_log(self.path)), 13)
+        log.close()
+        self.assertTrue(log.closed)
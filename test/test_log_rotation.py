@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_log_rotation.py
+Author: Danyal Ahsanullah
+Date: 8/21/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description:
+"""
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from libs.log_rotation import RotatingLog, compress_file, compressor, iter_log, segments
+
+HEADER = '# log for:, test\n# comment:,\ntime (s), value\n'
+
+
+class TestRotatingLog(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'test.csv')
+        self.records = [f'{i * 0.1},{i}\n' for i in range(1000)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, **kwargs):
+        log = RotatingLog(self.path, HEADER, **kwargs)
+        for record in self.records:
+            log.write(record)
+        log.close()
+        compressor.join()
+        return log
+
+    def test_size_rotation(self):
+        for compression, ext in (('gzip', '.gz'), ('lzma', '.xz'), (None, '')):
+            with self.subTest(compression=compression):
+                log = self.write(max_bytes=1000, compression=compression)
+                files = segments(self.path)
+                self.assertEqual(len(files), log.index + 1)
+                self.assertGreater(len(files), 5, 'log not rotated')
+                self.assertTrue(all(file.endswith('.csv' + ext) for file in files), 'segments not compressed')
+                self.assertEqual(''.join(iter_log(self.path)), HEADER + ''.join(self.records),
+                                 'records lost or reordered across segments')
+                self.assertEqual(''.join(iter_log(self.path, header=False)), ''.join(self.records))
+                for file in files:
+                    os.remove(file)
+
+    def test_time_rotation(self):
+        self.records = self.records[:5]
+        self.write(max_seconds=0)
+        self.assertEqual(len(segments(self.path)), 6, 'log not rotated on every record')
+        self.assertEqual(''.join(iter_log(self.path, header=False)), ''.join(self.records))
+
+    def test_plain_log(self):
+        with open(self.path, 'w') as file:
+            file.write(HEADER + ''.join(self.records))
+        self.assertEqual(''.join(iter_log(self.path, header=False)), ''.join(self.records))
+
+    def test_compressed_while_read(self):
+        self.write(max_bytes=1000, compression=None)
+        files = segments(self.path)
+        self.assertGreater(len(files), 2, 'log not rotated')
+        lines = iter_log(self.path, header=False)
+        read = [next(lines)]
+        # segments are listed once reading starts, later ones get compressed before they are reached
+        for file in files[1:]:
+            compress_file(file, 'gzip')
+        read.extend(lines)
+        self.assertEqual(''.join(read), ''.join(self.records))
@@ -13,7 +13,7 @@ Description:
 from unittest import TestCase
 from random import randrange, choice, uniform
 
-from libs.hal.sparkfun_openscale import OpenScale
+from libs.hal.sparkfun_openscale import OpenScale, CalibrationEngine
 
 
 class TestOpenScale(TestCase):
@@ -351,6 +351,76 @@ class TestOpenScale(TestCase):
                                'conversion failed!')
 
 
+class FakeCalibrationMenu:
+    """mimics the OpenScale calibration menu: one reading per keystroke, mass inversely related to the factor"""
+
+    def __init__(self, factor, load):
+        self.factor = factor
+        self.load = load
+        self.pending = b''
+        self.presses = 0
+
+    def line(self):
+        return 'Reading: [{:.4f} kg]   Calibration Factor: {}\r\n'.format(self.load / self.factor,
+                                                                         self.factor).encode('utf-8')
+
+    @property
+    def in_waiting(self):
+        return len(self.pending)
+
+    def write(self, data):
+        for key in data:
+            self.factor += 1 if key == ord('+') else -1
+            self.presses += 1
+            self.pending += self.line()
+
+    def flush(self):
+        pass
+
+    def read(self, size=1):
+        if not self.pending:
+            self.pending = self.line()
+        chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+
+class LossyCalibrationMenu(FakeCalibrationMenu):
+    """drops every 7th keystroke"""
+
+    def write(self, data):
+        for key in data:
+            self.presses += 1
+            if self.presses % 7:
+                super().write(bytes([key]))
+                self.presses -= 1
+
+
+class TestCalibrationEngine(TestCase):
+    def test_run(self):
+        load = uniform(1e5, 1e6)
+        target = uniform(1.0, 50.0)
+        device = FakeCalibrationMenu(factor=randrange(1000, 5000), load=load)
+        start = device.factor
+        factor = CalibrationEngine(device, tolerance=0.01).run(target)
+        self.assertEqual(factor, device.factor, 'reported factor does not match device')
+        self.assertAlmostEqual(load / factor, target, delta=max(0.01, load / factor ** 2),
+                               msg='calibration did not converge')
+        self.assertLess(device.presses, 3 * abs(factor - start) + 500,
+                        'calibration took too many keystrokes')
+
+    def test_dropped_keys(self):
+        load = uniform(1e5, 1e6)
+        target = uniform(1.0, 50.0)
+        device = LossyCalibrationMenu(factor=randrange(1000, 5000), load=load)
+        engine = CalibrationEngine(device, tolerance=0.01, settle_readings=40)
+        factor = engine.run(target)
+        # the engine follows the factor the device reports instead of waiting on keystrokes that never landed
+        self.assertEqual(factor, device.factor, 'reported factor does not match device')
+        self.assertGreater(engine.missed, 0)
+        self.assertAlmostEqual(load / factor, target, delta=max(0.01, load / factor ** 2),
+                               msg='calibration did not converge')
+
+
 if __name__ == '__main__':
     import unittest
 
@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_routines.py
+Author: Danyal Ahsanullah
+Date: 8/29/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description:
+"""
+import os
+import yaml
+from threading import Barrier
+from unittest import TestCase
+from unittest.mock import patch
+from libs import hal
+from orchestration.procedure import ProcedureExecutor
+from orchestration.routines import END, Routine, RoutineError
+from orchestration.actions import Action, action_map, statuses
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'CONFIG')
+
+
+class TestRoutine(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.results = {'FLIP': iter(['heads', 'tails', 'heads'])}
+
+        @statuses('heads', 'tails')
+        def flip(interface=None, params=None):
+            self.calls.append('FLIP')
+            return next(self.results['FLIP'])
+
+        def note(interface=None, params=None):
+            self.calls.append(params)
+            return params
+
+        action_map['FLIP'] = flip
+        action_map['NOTE'] = note
+
+    def tearDown(self):
+        for name in ('FLIP', 'NOTE'):
+            del action_map[name]
+
+    def routine(self, transitions, **actions):
+        actions.setdefault('FLIP', Action('FLIP'))
+        return Routine('coin', 'raw', 'raw', actions, transitions)
+
+    def test_compile(self):
+        routine = self.routine({'START': {'*': 'FLIP'},
+                                'FLIP': {'heads': 'FLIP', 'tails': 'TAILS', 'error': 'ERR'},
+                                'TAILS': {'*': 'END'}},
+                               TAILS=Action('NOTE', 'tails'))
+        compiled = routine.compile()
+        self.assertIs(routine.compile(), compiled)
+        self.assertEqual(compiled.states, ('START', 'FLIP', 'TAILS', 'ERROR'))
+        self.assertEqual(compiled.any, (1, None, END, None))
+        self.assertEqual(compiled.table[1], {'heads': 1, 'tails': 2, 'error': 3})
+
+    def test_execute(self):
+        routine = self.routine({'START': {'*': 'FLIP'},
+                                'FLIP': {'heads': 'FLIP', 'tails': 'TAILS'},
+                                'TAILS': {'*': 'END'}},
+                               TAILS=Action('NOTE', 'tails'))
+        ProcedureExecutor.execute_routine(routine)
+        self.assertEqual(self.calls, ['FLIP', 'FLIP', 'tails'])
+
+    def test_unhandled_status(self):
+        routine = self.routine({'START': {'*': 'FLIP'},
+                                'FLIP': {'heads': 'NOTE', 'tails': 'END'},
+                                'NOTE': {'success': 'END'}},
+                               NOTE=Action('NOTE', 'unexpected'))
+        with patch('orchestration.procedure.hal_cleanup') as cleanup, \
+                patch('orchestration.procedure._exit', side_effect=SystemExit) as exit_:
+            with self.assertRaises(SystemExit):
+                ProcedureExecutor.execute_routine(routine)
+        cleanup.assert_called_once_with()
+        exit_.assert_called_once_with(1)
+
+    def test_validation(self):
+        routine = self.routine({'START': {'*': 'FLIP'},
+                                'FLIP': {'heads': 'FLOP'},
+                                'TYPO': {'*': 'END'}},
+                               ORPHAN=Action('NOTE', 'orphan'), STUCK=Action('NOTE', 'stuck'))
+        routine.transitions['FLIP']['edge'] = 'STUCK'
+        with self.assertRaises(RoutineError) as error:
+            routine.compile()
+        self.assertEqual(error.exception.routine, 'coin')
+        self.assertEqual(sorted(error.exception.problems), sorted([
+            "'FLIP' transitions on 'heads' to unknown state 'FLOP'",
+            "transitions given for unknown state 'TYPO'",
+            "state 'ORPHAN' is unreachable from START",
+            "state 'STUCK' has no transitions",
+            "state 'FLIP' has no transitions for status(es) ['tails']",
+        ]))
+
+    def test_procedures(self):
+        for name in ('oscillate.yaml', 'oscillate_force.yaml', 'position_lut.yaml'):
+            with open(os.path.join(CONFIG_DIR, name)) as file:
+                procedure = yaml.load(file, Loader=yaml.Loader)
+            for routine in procedure['ROUTINES']:
+                routine.compile()
+        with open(os.path.join(CONFIG_DIR, 'calibrate.yaml')) as file:
+            procedure = yaml.load(file, Loader=yaml.Loader)
+        calibrate, = (routine for routine in procedure['ROUTINES'] if routine.name == 'calibrate')
+        with self.assertRaises(RoutineError) as error:
+            calibrate.compile()
+        self.assertIn("'CALIBRATE_MENU' transitions on 'done' to unknown state 'SAVE_CFG'", error.exception.problems)
+
+
+class TestParallel(TestCase):
+    def setUp(self):
+        self.order = []
+        # only passes once both routines reach it, ie: when they run at the same time
+        self.barrier = Barrier(2, timeout=2.0)
+
+        def meet(interface=None, params=None):
+            self.order.append(f'{params} start')
+            self.barrier.wait()
+            self.order.append(f'{params} end')
+            return 'success'
+
+        def note(interface=None, params=None):
+            self.order.append(params)
+            return 'success'
+
+        action_map['MEET'] = meet
+        action_map['NOTE'] = note
+        patcher = patch('orchestration.procedure.DataLogger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(hal.release)
+
+    def tearDown(self):
+        for name in ('MEET', 'NOTE'):
+            del action_map[name]
+
+    @staticmethod
+    def routine(name, action, resources=None):
+        return Routine(name, 'raw', 'raw', {'ACT': Action(action, name)},
+                       {'START': {'*': 'ACT'}, 'ACT': {'success': 'END'}}, resources=resources)
+
+    def test_overlap(self):
+        executor = ProcedureExecutor({}, [self.routine('cycle', 'MEET', ['actuator']),
+                                          self.routine('pump', 'MEET', ['pump', 't2']),
+                                          self.routine('after', 'NOTE')])
+        executor.run()
+        self.assertEqual(sorted(self.order[:2]), ['cycle start', 'pump start'])
+        self.assertEqual(self.order[-1], 'after')
+
+    def test_shared_resource(self):
+        executor = ProcedureExecutor({}, [self.routine('first', 'NOTE', ['actuator']),
+                                          self.routine('second', 'NOTE', ['s1'])])
+        with patch.object(ProcedureExecutor, '_wait', wraps=ProcedureExecutor._wait) as wait:
+            executor.run()
+        # second waits on first, they share the adc
+        self.assertEqual([len(call.args[0]) for call in wait.call_args_list], [0, 1, 2])
+        self.assertEqual(self.order, ['first', 'second'])
+
+    def test_failure(self):
+        executor = ProcedureExecutor({}, [self.routine('alone', 'MEET', ['actuator']),
+                                          self.routine('never', 'NOTE')])
+        self.barrier = Barrier(2, timeout=0.1)
+        with patch('orchestration.procedure.hal_cleanup') as cleanup, \
+                patch('orchestration.procedure._exit', side_effect=SystemExit) as exit_, \
+                patch('orchestration.procedure._print_exc'):
+            with self.assertRaises(SystemExit):
+                executor.run()
+        # by the failed routine for its own devices, then by the executor for everything
+        self.assertEqual(cleanup.call_count, 2)
+        self.assertEqual(exit_.call_args_list[-1].args, (1,))
+        self.assertNotIn('never', self.order)
+        self.assertEqual(hal.claimed(), frozenset())
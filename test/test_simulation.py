@@ -0,0 +1,185 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_simulation.py
+Author: Danyal Ahsanullah
+Date: 8/30/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description:
+"""
+import os
+import yaml
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import patch
+from libs import hal
+from pubsub import pub
+from libs.data_router import PUBLISH_FUNCS, DataLogger, register_listeners
+from libs.hal import Thermocouple
+from libs.hal.simulation import (RigModel, Simulation, SimulationLimit, VirtualClock, VirtualMAX31856,
+                                 VirtualOpenScale)
+from orchestration.procedure import ProcedureExecutor
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'CONFIG')
+
+
+class TestSimulation(TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.rig = RigModel(self.clock)
+        polled = len(PUBLISH_FUNCS)
+        self.addCleanup(PUBLISH_FUNCS.__delitem__, slice(polled, None))
+
+    def test_clock(self):
+        clock = VirtualClock(limit=1.0)
+        rounds = []
+        clock.every(0.25, rounds.append)
+        clock.sleep(0.6)
+        self.assertEqual(rounds, [0.25, 0.5])
+        self.assertEqual(clock.perf_counter(), 0.6)
+        with self.assertRaises(SimulationLimit):
+            clock.advance(0.5)
+        # cleanup after the limit still runs, polling does not
+        clock.advance(0.5)
+        self.assertEqual(rounds, [0.25, 0.5])
+
+    def test_rig(self):
+        self.rig.drive(4096)
+        self.rig.relay(hal.PINS['relay_1'], 0)
+        self.clock.advance(5.0)
+        self.rig.update()
+        # through the slack into the sample, slowing down with the load
+        self.assertLess(self.rig.position, self.rig.engage)
+        self.assertGreater(self.rig.position, 2.5 - 5 * self.rig.speed_none)
+        self.assertGreater(self.rig.sample_temp, self.rig.ambient)
+        self.rig.relay(hal.PINS['relay_1'], 1)
+        self.clock.advance(10.0)
+        self.rig.drive(0)
+        self.assertEqual(self.rig.force, 0.0)
+        self.assertLess(self.rig.sample_temp, self.rig.ambient)
+        self.assertEqual(self.rig.cycles, 1)
+
+    def test_thermocouple(self):
+        self.rig.sample_temp = -12.34
+        thermocouple = Thermocouple('sample', 'T', 4, conversion_sync=True,
+                                    hardware_spi=VirtualMAX31856(self.rig, 'sample', internal=25.5))
+        self.assertAlmostEqual(thermocouple.read_temp(), -12.34, delta=2 ** -7)
+        self.assertAlmostEqual(thermocouple.read_internal_temp(), 25.5, delta=2 ** -6)
+        self.assertEqual(thermocouple.fault_register, 0)
+        self.assertGreater(self.clock.now, 0.0)
+
+    def test_open_scale(self):
+        self.rig.position = 1.0
+        scale = VirtualOpenScale(self.rig)
+        force, units, timestamp = scale.get_reading()
+        self.assertAlmostEqual(force, 200.0, places=2)
+        self.assertEqual(units, 'N')
+        # stamped at the conversion, before the line is sent
+        self.assertLess(0, timestamp)
+        self.assertLess(timestamp, self.clock.now * 1000)
+
+    def test_limit_guard(self):
+        faults = []
+
+        def on_fault(data, topic=pub.AUTO_TOPIC):
+            faults.append(data)
+
+        register_listeners(on_fault, ('fault',))
+        self.addCleanup(pub.unsubscribe, on_fault, 'fault')
+        with patch.dict(hal.DEVICES, clear=True), Simulation(limit=60) as simulation:
+            actuator = hal.actuator
+            actuator.pos_limit_low, actuator.pos_limit_high = 5200, 6000
+
+            def level() -> float:
+                adc = actuator.position_sensor
+                return simulation.rig.position_voltage() / adc.pga_map[adc.gain] * 32768
+
+            # full speed at the upper limit, only the guard stops it
+            actuator.set_actuator_dir('forward')
+            actuator.set_out_speed(actuator.speed_controller.levels - 1)
+            peak = 0
+            while actuator.speed_controller.value:
+                actuator.position
+                peak = max(peak, level())
+            self.assertLessEqual(peak, 6000)
+            self.assertGreater(peak, 5900)
+            self.assertEqual(actuator.limit_guard.tripped, 'high')
+            self.assertEqual([fault['flags'] for fault in faults], [('position_limit_high',)])
+            # a move past the limit ends at the limit instead of running on
+            actuator.set_position(7000)
+            self.assertLessEqual(level(), 6000)
+            self.assertEqual(actuator.speed_controller.value, 0)
+            self.assertEqual(actuator.limit_guard.trips, 2)
+            # which is how that move ends, not a fault
+            self.assertEqual(len(faults), 1)
+            # driving away from the limit is not held back
+            actuator.set_position(5500)
+            self.assertIsNone(actuator.limit_guard.tripped)
+            self.assertAlmostEqual(level(), 5500, delta=20)
+            self.assertEqual(actuator.limit_guard.trips, 2)
+
+    def test_limit_guard_polled(self):
+        with patch.dict(hal.DEVICES, clear=True), Simulation(limit=60) as simulation:
+            actuator = hal.actuator
+            actuator.pos_limit_low, actuator.pos_limit_high = 5200, 6000
+            logger = DataLogger({'len_units': 'raw', 'force_units': 'N'}, outdir=simulation.outdir, poll=False)
+            simulation.attach(logger)
+            dac = actuator.speed_controller
+            set_level = dac.set_level
+
+            def slow_cut(level):
+                # a poll round comes due while the drive is cut, and checks the position again
+                if not level:
+                    simulation.clock.sleep(logger.period)
+                set_level(level)
+            actuator.set_actuator_dir('forward')
+            actuator.set_out_speed(dac.levels - 1)
+
+            def move():
+                while dac.value:
+                    actuator.position
+            with patch.object(dac, 'set_level', slow_cut):
+                thread = Thread(target=move, daemon=True)
+                thread.start()
+                thread.join(30)
+            logger.close()
+            self.assertFalse(thread.is_alive(), 'deadlocked cutting the drive')
+            self.assertEqual(actuator.limit_guard.tripped, 'high')
+            self.assertEqual(actuator.limit_guard.trips, 1)
+            self.assertGreater(simulation.summary()['samples'].get('actuator.position', 0), 0)
+
+    def test_dry_run(self):
+        with open(os.path.join(CONFIG_DIR, 'oscillate.yaml')) as file:
+            procedure = yaml.load(file, Loader=yaml.Loader)
+        procedure['ROUTINES'][0].actions['OSCILLATE'].params['repetitions'] = 3
+        faults = []
+
+        def on_fault(data, topic=pub.AUTO_TOPIC):
+            faults.append(data)
+
+        register_listeners(on_fault, ('fault',))
+        self.addCleanup(pub.unsubscribe, on_fault, 'fault')
+        with patch.dict(hal.DEVICES, clear=True), Simulation(limit=60) as simulation:
+            executor = ProcedureExecutor(cfg=procedure['CONFIG'], routines=procedure['ROUTINES'], poll=False,
+                                         outdir=simulation.outdir)
+            simulation.attach(executor.logger)
+            executor.run()
+            executor.logger.close()
+            summary = simulation.summary()
+            self.assertIn('cycles: 3', simulation.report())
+        self.assertFalse(simulation.clock.stopped)
+        self.assertEqual(summary['cycles'], 3)
+        # the recipe oscillates between its limits, stopping at them is not a fault
+        self.assertEqual(faults, [])
+        self.assertGreater(summary['duration'], summary['wall'])
+        self.assertGreater(summary['bytes'], 0)
+        # polled every period of simulated time
+        self.assertAlmostEqual(summary['samples']['actuator.speed'], summary['duration'] / executor.logger.period,
+                               delta=1)
+        # polled sensors no routine uses are logged as well
+        for topic in ('strain', 'thermocouple.ambient', 'thermocouple.fluid', 'thermocouple.sample'):
+            self.assertGreater(summary['samples'].get(topic, 0), 0, topic)
+        self.assertFalse(os.path.exists(simulation.outdir))
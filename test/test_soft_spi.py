@@ -0,0 +1,52 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_soft_spi.py
+Author: Danyal Ahsanullah
+Date: 8/14/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description:
+"""
+from unittest import TestCase
+from random import randint
+from libs.hal.soft_spi import FakeGPIOChip, FakeSPIDevice, WaveformSPI, LSBFIRST, MSBFIRST
+from libs.hal.max31856 import MAX31856
+
+PINS = {'clk': 13, 'cs': 5, 'do': 19, 'di': 26}
+
+
+class TestWaveformSPI(TestCase):
+    def build(self, mode, registers=bytes(16)):
+        device = FakeSPIDevice(PINS['clk'], PINS['di'], PINS['do'], PINS['cs'], mode=mode, registers=registers)
+        spi = WaveformSPI(PINS['clk'], PINS['di'], PINS['do'], PINS['cs'], chip=FakeGPIOChip(on_change=device))
+        spi.set_mode(mode)
+        return device, spi
+
+    def test_transfer_modes(self):
+        registers = bytes(randint(0, 255) for _ in range(16))
+        for mode in range(4):
+            device, spi = self.build(mode, registers)
+            self.assertEqual(spi.transfer([0x02, 0, 0, 0]), bytearray([0]) + registers[2:5])
+            self.assertEqual(device.received[-1], bytearray([0x02, 0, 0, 0]))
+            spi.transfer([0x85, 0xA5, 0x3C])
+            self.assertEqual(device.registers[5:7], bytearray([0xA5, 0x3C]))
+
+    def test_bit_order(self):
+        device, spi = self.build(1, bytes(range(16)))
+        spi.set_bit_order(LSBFIRST)
+        # 0x40 reversed on the wire is address 0x02, register 0x02 reads back reversed as 0x40
+        self.assertEqual(spi.transfer([0x40, 0]), bytearray([0, 0x40]))
+        spi.set_bit_order(MSBFIRST)
+        self.assertEqual(spi.transfer([0x02, 0]), bytearray([0, 0x02]))
+
+    def test_max31856(self):
+        registers = bytearray(16)
+        # 25.0 C thermocouple, 25.0 C cold junction, no faults
+        registers[0x0A:0x10] = bytes((0x19, 0x00, 0x01, 0x90, 0x00, 0x00))
+        device, spi = self.build(1, registers)
+        sensor = MAX31856(tc_type='T', avgsel=4, hardware_spi=spi)
+        self.assertEqual(sensor.read_burst(), (25.0, 25.0, 0))
+        self.assertEqual(device.registers[0x01], (sensor.avgsel << 4) + sensor.tc_type)
@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_startup.py
+Author: Danyal Ahsanullah
+Date: 8/27/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: startup profiling and the cold start budget.
+             the budget (s) can be overridden with PI_CONTROL_STARTUP_BUDGET for slower machines.
+"""
+import os
+import sys
+import json
+import subprocess
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from unittest import TestCase
+from libs.startup_profile import StartupProfiler
+
+STARTUP_BUDGET = float(os.environ.get('PI_CONTROL_STARTUP_BUDGET', 3.0))
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'diagnostic', 'startup_profile.py')
+
+
+class TestStartupProfiler(TestCase):
+    def test_tree(self):
+        with TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'profiled_outer.py'), 'w') as file:
+                file.write('import profiled_inner\n')
+            with open(os.path.join(tmp, 'profiled_inner.py'), 'w') as file:
+                file.write('from time import sleep\nsleep(0.01)\n')
+            sys.path.insert(0, tmp)
+            profiler = StartupProfiler()
+            try:
+                profiler.start()
+                with profiler.span('phase'):
+                    import profiled_outer
+                profiler.stop()
+            finally:
+                sys.path.remove(tmp)
+                sys.modules.pop('profiled_outer', None)
+                sys.modules.pop('profiled_inner', None)
+        phase, = profiler.root.children
+        outer, = phase.children
+        inner, = outer.children
+        self.assertEqual((outer.kind, outer.name, inner.name), ('import', 'profiled_outer', 'profiled_inner'))
+        self.assertGreaterEqual(inner.elapsed, 0.01)
+        self.assertGreaterEqual(outer.elapsed, inner.elapsed)
+        self.assertNotIn(profiler._finder, sys.meta_path, 'import hook left installed')
+        self.assertIn('import profiled_inner', profiler.report())
+        self.assertNotIn('_TimedLoader', type(profiled_outer.__loader__).__name__, 'module kept the timing loader')
+
+
+class TestStartupBudget(TestCase):
+    def test_cold_start(self):
+        start = perf_counter()
+        result = subprocess.run([sys.executable, SCRIPT, '--json'], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, check=True)
+        elapsed = perf_counter() - start
+        profile = json.loads(result.stdout.decode().splitlines()[-1])
+        self.assertEqual(profile['devices'], [], 'hardware initialized during startup')
+        self.assertLess(elapsed, STARTUP_BUDGET, f'cold start took {elapsed:.3f} s')
@@ -0,0 +1,182 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_strain_gauge.py
+Author: Danyal Ahsanullah
+Date: 8/16/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description:
+"""
+from random import randint, uniform
+from threading import Thread
+from time import sleep
+from unittest import TestCase
+from unittest.mock import patch
+import numpy as np
+from libs.hal.strain_gauge import CalibrationTable, StrainGauge
+from libs.hal.adc import ADS1115Interface
+
+
+class FakeADC(ADS1115Interface):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.level = 0
+        # continuous conversions completed (by FakeGPIO) and results read
+        self.converted = 0
+        self.reads = 0
+        self.continuous = False
+
+    def start_adc_difference_comparator(self, differential, high_threshold, low_threshold, gain=1, data_rate=None,
+                                        *args, **kwargs):
+        self.continuous = high_threshold < 0 <= low_threshold
+
+    def get_last_result(self):
+        self.reads += 1
+        return self.level - self.converted
+
+    def stop_adc(self):
+        self.continuous = False
+
+    # noinspection PyUnusedLocal
+    def read_adc_difference(self, differential, gain=1, data_rate=None):
+        return self.level
+
+
+class FakeGPIO:
+    """
+    ALERT/RDY pin of a FakeADC, its conversions come ready on a thread once edge detection is armed.
+    after the i-th read `bursts.get(i, 1)` conversions complete before the next one, 0 pauses for `pause` (s) first
+    """
+    IN, FALLING, PUD_UP = 'in', 'falling', 'pud_up'
+
+    def __init__(self, adc: FakeADC, bursts=None, pause: float = 0.0):
+        self.adc = adc
+        self.bursts = bursts or {}
+        self.pause = pause
+        self.pins = {}
+        self.detecting = False
+        self._thread = None
+
+    def setup(self, channel, direction, pull_up_down=None):
+        self.pins[channel] = (direction, pull_up_down)
+
+    def add_event_detect(self, channel, edge, callback=None):
+        self.detecting = True
+        self._thread = Thread(target=self._convert, args=(channel, callback), daemon=True)
+        self._thread.start()
+
+    def remove_event_detect(self, channel):
+        self.detecting = False
+        self._thread.join()
+
+    def _convert(self, channel, callback):
+        while self.detecting:
+            reads = self.adc.reads
+            burst = self.bursts.get(reads, 1)
+            if not burst:
+                sleep(self.pause)
+            for _ in range(max(1, burst)):
+                self.adc.converted += 1
+                callback(channel)
+            # the next conversion completes once this one was read
+            while self.detecting and self.adc.reads == reads:
+                sleep(0.0001)
+
+
+class TestCalibrationTable(TestCase):
+    def test_add(self):
+        table = CalibrationTable(capacity=2)
+        points = {randint(-30000, 30000): uniform(-100, 100) for _ in range(20)}
+        for raw, correction in points.items():
+            table.add(raw, correction)
+        self.assertEqual(len(table), len(points))
+        self.assertEqual(table.points.shape, (len(points), 2), 'calibration map shape mismatch')
+        self.assertTrue(np.all(np.diff(table.points[:, 0]) > 0), 'calibration points not sorted')
+        raw = next(iter(points))
+        table.add(raw, 1.5)
+        self.assertEqual(len(table), len(points), 'duplicate level not replaced')
+        self.assertEqual(table.correction(raw), 1.5)
+
+    def test_apply(self):
+        table = CalibrationTable()
+        self.assertEqual(table.apply(123), 123, 'empty table applied a correction')
+        for raw, correction in ((-1000, 10.0), (0, -5.0), (2000, 20.0)):
+            table.add(raw, correction)
+        levels = np.random.randint(table.min_level, table.max_level + 1, 1000)
+        expected = levels + np.interp(levels, table.points[:, 0], table.points[:, 1])
+        self.assertTrue(np.array_equal(table.apply_batch(levels), expected), 'batch correction mismatch')
+        self.assertEqual([table.apply(level) for level in levels.tolist()], expected.tolist(),
+                         'scalar correction mismatch')
+        self.assertEqual(table.apply(1000), 1000 + 7.5)
+        self.assertEqual(table.apply(table.max_level), table.max_level + 20.0)
+
+
+class TestStrainGauge(TestCase):
+    def setUp(self):
+        self.adc = FakeADC()
+        self.gauge = StrainGauge(interface=self.adc)
+
+    def test_add_cal_point(self):
+        # linear bridge so corrections interpolated between levels land exactly between the targets
+        self.gauge = StrainGauge(interface=self.adc, bridge='full')
+        self.assertEqual(self.gauge.cal_map.shape, (0, 2), 'empty calibration map shape mismatch')
+        for level, target in ((100, -0.05), (300, -0.15)):
+            self.adc.level = level
+            self.gauge.add_cal_point(target)
+        self.adc.level = 200
+        self.assertAlmostEqual(self.gauge.read_adjusted_strain(), -0.1, 9)
+        np.testing.assert_allclose(self.gauge.adjust([100, 200, 300]), [-0.05, -0.1, -0.15], atol=1e-9)
+
+    def test_strain(self):
+        for bridge, factor in StrainGauge.BRIDGE_MAP.items():
+            gauge = StrainGauge(interface=self.adc, vcc=5.0, gf=2.1, bridge=bridge, r_lead=1.5)
+            level = randint(self.adc.min_level, self.adc.max_level)
+            vr = level * 2 * self.adc.pga_map[gauge.gain] / self.adc.levels / 5.0
+            # no lead resistance term for a full bridge
+            expected = -factor * vr / 2.1 * (1 if bridge == 'full' else 1 + 1.5 / 350) * 100
+            if bridge == 'quarter':
+                expected /= 1 + 2 * vr
+            self.adc.level = level
+            self.assertAlmostEqual(gauge.read_strain(), expected, 9, f'{bridge} bridge strain mismatch')
+            self.assertAlmostEqual(gauge.level_from_strain(expected), level, 6, f'{bridge} bridge inverse mismatch')
+            levels = np.random.randint(self.adc.min_level, self.adc.max_level + 1, 100)
+            np.testing.assert_allclose(gauge.strain_from_levels(levels),
+                                       [gauge.strain_from_level(level) for level in levels.tolist()], rtol=1e-12)
+        self.adc.level = 1234
+        self.gauge.zero()
+        self.assertEqual(self.gauge.read_strain(), 0.0, 'zeroed bridge not at zero strain')
+
+    def test_capture(self):
+        self.adc.level = 0
+        gpio = FakeGPIO(self.adc, bursts={5: 2, 10: 3})
+        with patch('libs.hal.strain_gauge.GPIO', gpio):
+            strain, raw, acq_ts = self.gauge.capture(0.05, data_rate=860)
+        self.assertEqual(gpio.pins[self.adc.alert_pin], (gpio.IN, gpio.PUD_UP), 'alert pin not set up as an input')
+        self.assertEqual(len(raw), 43, 'sample count mismatch')
+        # conversions read over by a later one show as gaps, and are counted
+        expected = [-n for n in range(1, 47) if n not in (6, 12, 13)]
+        self.assertEqual(raw.tolist(), expected, 'samples not read in order')
+        self.assertEqual(self.gauge.missed_edges, 3)
+        self.assertTrue(np.all(np.diff(acq_ts) >= 0), 'timestamps out of order')
+        np.testing.assert_allclose(strain, self.gauge.strain_from_levels(raw))
+        self.assertFalse(self.adc.continuous, 'adc left in continuous mode')
+        self.assertFalse(gpio.detecting, 'edge detection left armed')
+        # a late edge is waited for again instead of re-reading the last result
+        self.gauge.missed_edges = 0
+        self.gauge.max_missed_edges = 100
+        self.adc.converted = self.adc.reads = 0
+        with patch('libs.hal.strain_gauge.GPIO', FakeGPIO(self.adc, bursts={5: 0}, pause=0.01)):
+            strain, raw, acq_ts = self.gauge.capture(0.05, data_rate=860)
+        self.assertEqual(raw.tolist(), list(range(-1, -44, -1)), 'samples not read in order')
+        self.assertGreater(self.gauge.missed_edges, 0, 'timeout not counted')
+        self.gauge.max_missed_edges = 3
+        self.adc.converted = self.adc.reads = 0
+        with patch('libs.hal.strain_gauge.GPIO', FakeGPIO(self.adc, bursts={10: 0}, pause=0.1)):
+            with self.assertRaises(RuntimeError):
+                self.gauge.capture(0.05, data_rate=860)
+        self.assertFalse(self.adc.continuous, 'adc left in continuous mode')
+        with self.assertRaises(ValueError):
+            self.gauge.capture(0.05, data_rate=1000)
@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_telemetry.py
+Author: Danyal Ahsanullah
+Date: 8/24/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description:
+"""
+import os
+import socket
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+from unittest import TestCase
+import numpy as np
+from pubsub import pub
+# hal first, data_router and the hal modules import each other
+import libs.hal
+from libs.telemetry import TelemetryServer, parse_address, receive
+
+
+def wait_for(condition, timeout=2.0):
+    end = perf_counter() + timeout
+    while not condition() and perf_counter() < end:
+        sleep(0.001)
+    return condition()
+
+
+class TestTelemetry(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'telemetry.sock')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('localhost:5000'), ('localhost', 5000))
+        self.assertEqual(parse_address(':5000'), ('localhost', 5000))
+        self.assertEqual(parse_address('/tmp/pi_control.sock'), '/tmp/pi_control.sock')
+
+    def test_stream(self):
+        for address in (self.path, ('localhost', 0)):
+            with self.subTest(address=address), TelemetryServer(address, decimation=2) as server:
+                samples = receive(server.address)
+                self.assertTrue(wait_for(lambda: server.clients == 1), 'client not accepted')
+                for strain in range(4):
+                    pub.sendMessage('strain', data={'strain': float(strain)})
+                pub.sendMessage('thermocouple', data={'meta': 'fluid', 'temp': 25.0, 'internal_temp': 24.0,
+                                                      'acq_ts': server.start + 1.5, 'fault': 0, 'valid': True})
+                pub.sendMessage('thermocouple', data={'meta': 'fluid', 'temp': 26.0, 'internal_temp': 24.0,
+                                                      'acq_ts': server.start + 1.6, 'fault': 0, 'valid': True})
+                pub.sendMessage('strain_burst', data={'strain': np.array([0.1, 0.2]), 'raw': np.array([10, 20]),
+                                                      'acq_ts': server.start + np.array([2.0, 2.1])})
+                pub.sendMessage('strain_burst', data={'strain': np.array([0.3]), 'raw': np.array([30]),
+                                                      'acq_ts': server.start + np.array([2.2])})
+                # every other sample of each channel
+                self.assertEqual([next(samples)[2]['strain'].tolist() for _ in range(2)], [[1.0], [3.0]])
+                name, ts, sample = next(samples)
+                self.assertEqual(name, 'thermocouple.fluid')
+                self.assertAlmostEqual(ts, 1.6, 6)
+                self.assertEqual(sample['temp'].tolist(), [26.0])
+                self.assertEqual(sample['valid'].tolist(), [1.0])
+                name, ts, sample = next(samples)
+                self.assertEqual(name, 'strain_burst')
+                self.assertEqual(sample['raw'].tolist(), [30.0])
+                samples.close()
+                self.assertTrue(wait_for(lambda: server.clients == 0), 'closed client not dropped')
+
+    def test_unpackable(self):
+        with TelemetryServer(self.path) as server:
+            samples = receive(server.address)
+            self.assertTrue(wait_for(lambda: server.clients == 1), 'client not accepted')
+            # as the actuator publishes the load cell's reading: the units string lands in local_temp
+            pub.sendMessage('actuator.force', data={'force': 9.8, 'local_temp': 'N', 'timestamp': 1200})
+            name, _, sample = next(samples)
+            self.assertEqual(name, 'actuator.force')
+            self.assertEqual(sample['force'].tolist(), [9.8])
+            self.assertTrue(np.isnan(sample['local_temp'][0]))
+            self.assertEqual(sample['timestamp'].tolist(), [1200.0])
+            pub.sendMessage('actuator.force', data={'force': 9.8, 'timestamp': 1200})
+            pub.sendMessage('thermocouple', data={'meta': 'spare', 'temp': 25.0, 'internal_temp': 24.0,
+                                                  'fault': 0, 'valid': True})
+            pub.sendMessage('strain', data={'strain': 0.5})
+            self.assertEqual(next(samples)[2]['strain'].tolist(), [0.5])
+            self.assertEqual(server.skipped, {'actuator.force': 1, 'thermocouple.spare': 1})
+            samples.close()
+
+    def test_slow_client(self):
+        with TelemetryServer(self.path, max_queue=4, max_decimation=4) as server, \
+                socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            sock.connect(self.path)
+            self.assertTrue(wait_for(lambda: server.clients == 1), 'client not accepted')
+            start = perf_counter()
+            for strain in range(200000):
+                pub.sendMessage('strain', data={'strain': float(strain)})
+                if not server.clients:
+                    break
+            elapsed = perf_counter() - start
+            # the client never reads, so it has to be decimated and then disconnected, without blocking publishing
+            self.assertTrue(wait_for(lambda: server.clients == 0), 'slow client not dropped')
+            self.assertLess(elapsed, 30.0)
@@ -12,7 +12,10 @@ Description:
 """
 from unittest import TestCase
 from libs.hal import Thermocouple
+from libs.data_router import register_listeners
 from random import choice
+from time import perf_counter
+import numpy as np
 
 
 class TestThermocouple(TestCase):
@@ -22,7 +25,7 @@ class TestThermocouple(TestCase):
     def setUp(self):
         self.tc_type = choice(self.thermocouple_types)
         self.avgs = choice(self.num_avgs)
-        self.thermocouple = Thermocouple(tc_type=self.tc_type, num_avgs=self.avgs,
+        self.thermocouple = Thermocouple(name='sample', tc_type=self.tc_type, num_avgs=self.avgs,
                                          software_spi={"clk": 13, "cs": 5, "do": 19, "di": 26})
 
     # def test_read_temp(self):
@@ -44,6 +47,63 @@ class TestThermocouple(TestCase):
             self.thermocouple.averaging_samples = avgs
             self.assertEqual(avgs, self.thermocouple._avg_samples, 'thermocouple type mismatch')
 
+    def test_read_burst(self):
+        registers = bytearray(16)
+        # 25.0 C thermocouple, 28.390625 C cold junction, open circuit fault
+        registers[0x0A:0x10] = bytes((0x1C, 0x64, 0x01, 0x90, 0x00, 0x01))
+        transfers = []
+
+        def transfer(data):
+            transfers.append(list(data))
+            return bytearray([0]) + bytearray(registers[data[0] + i] for i in range(len(data) - 1))
+
+        self.thermocouple._spi.transfer = transfer
+        self.assertEqual(self.thermocouple.read_burst(), (25.0, 28.390625, 0x01), 'burst decode mismatch')
+        self.assertEqual(len(transfers), 1, 'burst read took more than one transaction')
+        self.assertEqual(self.thermocouple.get_temps()[:3], (self.thermocouple.name, 25.0, 28.390625),
+                         'get_temps mismatch')
+        self.assertEqual(self.thermocouple.read_burst()[:2],
+                         (self.thermocouple.read_temp(), self.thermocouple.read_internal_temp()),
+                         'burst read disagrees with per register reads')
+
+    def test_poll_temps(self):
+        self.thermocouple._spi.transfer = lambda data: bytearray(len(data))
+        self.thermocouple._last_conversion_ts = perf_counter()
+        self.assertIsNone(self.thermocouple.poll_temps(), 'read before a conversion completed')
+        # pretend two and a half conversions have passed
+        period = self.thermocouple.conversion_time
+        start = self.thermocouple._last_conversion_ts = perf_counter() - 2.5 * period
+        res = self.thermocouple.poll_temps()
+        self.assertIsNotNone(res, 'completed conversion not read')
+        self.assertAlmostEqual(res[3], start + 2 * period, 6, 'conversion timestamp mismatch')
+        self.assertIsNone(self.thermocouple.poll_temps(), 'same conversion read twice')
+
+    def test_fault_monitoring(self):
+        registers = bytearray(16)
+        # -199.953125 C from an open probe
+        registers[0x0A:0x10] = bytes((0x19, 0x00, 0xF3, 0x80, 0x20, self.thermocouple.MAX31856_FAULT_OPEN))
+        self.thermocouple._spi.transfer = \
+            lambda data: bytearray([0]) + bytearray(registers[data[0] + i] for i in range(len(data) - 1))
+        events = []
+
+        def listener(data):
+            if data['meta'] == self.thermocouple.name:
+                events.append(data)
+
+        register_listeners(listener, ('fault',))
+        self.thermocouple.conversion_sync = False
+        res = self.thermocouple.poll()
+        self.assertEqual(res[4:], (self.thermocouple.MAX31856_FAULT_OPEN, False), 'fault not flagged invalid')
+        self.assertEqual(self.thermocouple.fault_flags, ('open',))
+        self.assertEqual([event['flags'] for event in events], [('open',)], 'fault event not raised')
+        self.assertIsNone(self.thermocouple.poll(), 'faulted channel still polled')
+        # probe reconnected, picked up on the next fault check
+        registers[0x0F] = 0
+        self.thermocouple._fault_check_ts -= self.thermocouple.fault_retry
+        res = self.thermocouple.poll()
+        self.assertEqual(res[4:], (0, True), 'recovered channel not read')
+        self.assertEqual([event['flags'] for event in events], [('open',), ()], 'recovery event not raised')
+
     def test_temperature_byte_conversions(self):
 
         """
@@ -121,3 +181,20 @@ class TestThermocouple(TestCase):
         lsb = 0b00000000
         decimal_cj_temp = self.thermocouple._cj_temp_from_bytes(msb, lsb)  # pylint: disable-msg=protected-access
         self.assertEqual(decimal_cj_temp, -55)
+
+    def test_vectorized_decoders(self):
+        # every cold junction word
+        msb, lsb = np.divmod(np.arange(1 << 16), 1 << 8)
+        expected = [self.thermocouple._cj_temp_from_bytes(m, l) for m, l in zip(msb.tolist(), lsb.tolist())]
+        self.assertTrue(np.array_equal(self.thermocouple.decode_cj_temps(msb, lsb), expected), 'cj decode mismatch')
+        # every thermocouple word, dead bits excluded
+        words = np.arange(1 << 19) << 5
+        byte2, byte1, byte0 = words >> 16, (words >> 8) & 0xFF, words & 0xFF
+        expected = [self.thermocouple._thermocouple_temp_from_bytes(b0, b1, b2)
+                    for b0, b1, b2 in zip(byte0.tolist(), byte1.tolist(), byte2.tolist())]
+        self.assertTrue(np.array_equal(self.thermocouple.decode_thermocouple_temps(byte0, byte1, byte2), expected),
+                        'thermocouple decode mismatch')
+        bursts = np.random.randint(0, 256, (100, 6), dtype=np.uint8)
+        temps, cj_temps, faults = self.thermocouple.decode_bursts(bursts)
+        self.assertEqual(list(zip(temps, cj_temps, faults)),
+                         [self.thermocouple._burst_from_bytes(burst) for burst in bursts.tolist()], 'burst decode mismatch')
@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+# vim:fileencoding=utf-8
+# -*- coding: utf-8 -*-
+"""
+pi_control
+test_trace.py
+Author: Danyal Ahsanullah
+Date: 8/31/2018
+Copyright (c):  2018 Danyal Ahsanullah
+License: N/A
+Description: record and replay of hal chip traffic, recorded from the simulated rig's chips.
+"""
+import os
+from collections import deque
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+from libs import hal
+from libs.data_router import PUBLISH_FUNCS
+from libs.hal import Thermocouple
+from libs.hal.simulation import RigModel, VirtualClock, VirtualMAX31856, VirtualOpenScale
+from libs.hal.trace import (ReplayOpenScale, ReplaySPI, TraceMismatch, TraceReplay, TraceWriter, TracedOpenScale,
+                            TracedThermocouple, _Player, _Recorder, read_trace, summary)
+
+
+class TracedVirtualOpenScale(TracedOpenScale, VirtualOpenScale):
+    pass
+
+
+class TestTrace(TestCase):
+    def setUp(self):
+        self.rig = RigModel(VirtualClock())
+        polled = len(PUBLISH_FUNCS)
+        self.addCleanup(PUBLISH_FUNCS.__delitem__, slice(polled, None))
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'run.trace.gz')
+
+    def calls(self, device: str) -> deque:
+        return deque(call for call in read_trace(self.path) if call.device == device)
+
+    def test_thermocouple(self):
+        writer = TraceWriter(self.path)
+        traced = TracedThermocouple(_Recorder(writer, 't1'), name='ambient', tc_type='T', num_avgs=4,
+                                    hardware_spi=VirtualMAX31856(self.rig, 'fluid'))
+        recorded = [traced.get_temps(acq_ts=float(i)) for i in range(5)]
+        writer.close()
+        calls = self.calls('t1')
+        # spi setup and the register writes of the thermocouple's setup, then one burst per reading
+        self.assertEqual([call.method for call in calls][:4],
+                         ['set_clock_hz', 'set_mode', 'set_bit_order', 'transfer'])
+        self.assertEqual([len(call.result) for call in list(calls)[-5:]], [7] * 5)
+        replayed = Thermocouple(name='ambient', tc_type='T', num_avgs=4, hardware_spi=ReplaySPI(_Player('t1', calls)))
+        self.assertEqual([replayed.get_temps(acq_ts=float(i)) for i in range(5)], recorded)
+        with self.assertRaises(TraceMismatch):
+            replayed.get_temps()
+
+    def test_open_scale(self):
+        writer = TraceWriter(self.path)
+        traced = TracedVirtualOpenScale(_Recorder(writer, 'load_cell'), self.rig)
+        recorded = [traced.get_reading() for _ in range(3)]
+        writer.close()
+        calls = self.calls('load_cell')
+        # read_until reads through read, only the outer call is recorded
+        self.assertEqual({call.method for call in calls}, {'write', 'read_until'})
+        replayed = ReplayOpenScale(_Player('load_cell', calls))
+        replayed.first_read = False
+        self.assertEqual([replayed.get_reading() for _ in range(3)], recorded)
+        self.assertIn('load_cell.read_until', summary(self.path))
+
+    def test_replay_devices(self):
+        writer = TraceWriter(self.path)
+        for level in (900, 4514, 4600):
+            writer.call('adc', 'read_adc', lambda *args, **kwargs: level, (1,), {'gain': 1, 'data_rate': 128})
+        writer.call('dac', 'set_voltage', lambda *args, **kwargs: None, (2048,), {})
+        writer.close()
+        with patch.dict(hal.DEVICES, clear=True):
+            with TraceReplay(self.path) as replay:
+                # readings under 1000 are discarded by the actuator, as on the rig
+                self.assertEqual(hal.get_device('adc').read_single(), 900)
+                self.assertEqual(hal.get_device('adc').read_single(), 4514)
+                self.assertEqual(replay.remaining, {'adc': 1, 'dac': 1})
+                with self.assertRaises(TraceMismatch):
+                    hal.get_device('dac').set_level(1000)
+                with self.assertRaises(TraceMismatch):
+                    hal.get_device('adc').read_adc(2, gain=1, data_rate=128)
+            self.assertNotIn('adc', hal.DEVICES)